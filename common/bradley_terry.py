@@ -0,0 +1,207 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Offline Bradley-Terry ratings over a study's full vote history """
+
+from dataclasses import dataclass
+import datetime
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from google.cloud import firestore
+
+from config.default import Default
+from config.firebase_config import FirebaseClient
+from common.ratings import DEFAULT_RATING, ELO_SCALE, Matchup, rating_doc_id
+from utils.logger import log
+
+
+config = Default()
+db = FirebaseClient(database_id=config.IMAGE_FIREBASE_DB).get_client()
+
+
+@dataclass
+class BradleyTerryFit:
+    """Ratings on the ELO scale, with bootstrap confidence intervals"""
+
+    models: list[str]
+    ratings: np.ndarray
+    ci_low: np.ndarray
+    ci_high: np.ndarray
+    games: np.ndarray
+    wins: np.ndarray
+    votes: int
+    bootstrap: int
+    confidence: float
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per model, strongest first."""
+        df = pd.DataFrame(
+            {
+                "model": self.models,
+                "rating": self.ratings,
+                "ci_low": self.ci_low,
+                "ci_high": self.ci_high,
+                "games": self.games,
+                "wins": self.wins,
+            }
+        )
+        return df.sort_values(by="rating", ascending=False).reset_index(drop=True)
+
+
+def _outcome_counts(matchups: Iterable[Matchup]) -> tuple[list[str], np.ndarray, int]:
+    """Count votes by outcome: decisive (winner, loser) cells, then tied (model, model) cells"""
+    votes = np.array([tuple(matchup) for matchup in matchups], dtype=object).reshape(-1, 3)
+    models, idx = np.unique(votes[:, :2].astype(str), return_inverse=True)
+    idx = idx.reshape(-1, 2)
+    n = len(models)
+    first_won = votes[:, 2] == votes[:, 0]
+    second_won = votes[:, 2] == votes[:, 1]
+    tied = ~(first_won | second_won)
+
+    winner = np.where(second_won, idx[:, 1], idx[:, 0])
+    loser = np.where(second_won, idx[:, 0], idx[:, 1])
+    tie_cells = n * n + idx.min(axis=1) * n + idx.max(axis=1)
+    cells = np.where(tied, tie_cells, winner * n + loser)
+    return list(models), np.bincount(cells, minlength=2 * n * n).astype(float), len(votes)
+
+
+def _win_matrix(counts: np.ndarray, n: int) -> np.ndarray:
+    """(..., n, n) matrix of wins of row over column; ties count half to each side"""
+    decisive = counts[..., : n * n].reshape(counts.shape[:-1] + (n, n))
+    ties = counts[..., n * n :].reshape(counts.shape[:-1] + (n, n))
+    return decisive + 0.5 * (ties + np.swapaxes(ties, -1, -2))
+
+
+def fit_strengths(
+    wins: np.ndarray, prior: float = 1.0, max_iter: int = 1000, tol: float = 1e-8, start: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Maximum-likelihood log-strengths for a batch of (..., n, n) win matrices (Hunter's MM algorithm).
+
+    Every pair that played also gets `prior` virtual tied games, which keeps
+    the estimates finite for models that never lost (or never won). `start`
+    warm-starts the iteration; models that never played are NaN.
+    """
+    games = wins + np.swapaxes(wins, -1, -2)
+    wins = wins + 0.5 * prior * (games > 0)
+    games = wins + np.swapaxes(wins, -1, -2)
+    total_wins = wins.sum(axis=-1)
+    active = games.sum(axis=-1) > 0
+    log_p = np.zeros(total_wins.shape) if start is None else np.nan_to_num(start)
+    for _ in range(max_iter):
+        p = np.exp(log_p)
+        denom = (games / (p[..., :, None] + p[..., None, :])).sum(axis=-1)
+        new_log_p = np.where(active, np.log(np.where(active, total_wins, 1) / np.where(active, denom, 1)), 0.0)
+        # fix the scale: the geometric mean strength of the active models is 1
+        new_log_p -= (new_log_p * active).sum(axis=-1, keepdims=True) / np.maximum(active.sum(axis=-1, keepdims=True), 1)
+        converged = np.abs(new_log_p - log_p).max() < tol
+        log_p = new_log_p
+        if converged:
+            break
+    return np.where(active, log_p, np.nan)
+
+
+def fit_bradley_terry(
+    matchups: Iterable[Matchup],
+    bootstrap: int = 1000,
+    confidence: float = 0.95,
+    prior: float = 1.0,
+    seed: Optional[int] = None,
+    max_iter: int = 1000,
+    tol: float = 1e-8,
+) -> BradleyTerryFit:
+    """
+    Fit Bradley-Terry ratings to votes, independent of the order they were cast in.
+
+    Args:
+        matchups: (model1, model2, winner) votes; a winner that is neither model is a tie.
+        bootstrap: number of bootstrap resamples of the votes for the confidence intervals.
+        confidence: width of the confidence intervals.
+        prior: virtual tied games added to every pair that played.
+        seed: random seed for the bootstrap.
+        max_iter: iteration limit of the fit.
+        tol: convergence tolerance, in log-strength.
+    Returns:
+        The fit. Ratings are on the ELO scale, with a mean of DEFAULT_RATING.
+    """
+    models, counts, votes = _outcome_counts(matchups)
+    n = len(models)
+    wins = _win_matrix(counts, n)
+    scale = ELO_SCALE / np.log(10)
+    ratings = DEFAULT_RATING + scale * fit_strengths(wins, prior, max_iter, tol)
+
+    ci_low = ci_high = np.full(n, np.nan)
+    if bootstrap and votes:
+        # resampling votes with replacement only changes how often each outcome occurs
+        rng = np.random.default_rng(seed)
+        samples = rng.multinomial(votes, counts / votes, size=bootstrap)
+        sampled = DEFAULT_RATING + scale * fit_strengths(_win_matrix(samples, n), prior, max_iter, tol)
+        alpha = (1 - confidence) / 2
+        ci_low, ci_high = np.nanquantile(sampled, [alpha, 1 - alpha], axis=0)
+
+    return BradleyTerryFit(
+        models=models,
+        ratings=ratings,
+        ci_low=ci_low,
+        ci_high=ci_high,
+        games=(wins + wins.T).sum(axis=1).astype(int),
+        wins=np.rint(wins.sum(axis=1)).astype(int),
+        votes=votes,
+        bootstrap=bootstrap,
+        confidence=confidence,
+    )
+
+
+def load_matchups(study: str) -> list[Matchup]:
+    """Every vote of a study, oldest first."""
+    docs = (
+        db.collection(config.IMAGE_RATINGS_COLLECTION_NAME)
+        .where(filter=firestore.FieldFilter("study", "==", study))
+        .where(filter=firestore.FieldFilter("type", "==", "vote"))
+        .select(["model1", "model2", "winner", "timestamp"])
+        .stream()
+    )
+    votes = sorted((doc.to_dict() for doc in docs), key=lambda vote: vote.get("timestamp") or datetime.datetime.min)
+    return [(vote["model1"], vote["model2"], vote["winner"]) for vote in votes]
+
+
+def store_fit(study: str, fit: BradleyTerryFit):
+    """Save a fit as the study's bt_rating document."""
+    rows = fit.to_frame()
+
+    def _finite(values: pd.Series) -> dict[str, Optional[float]]:
+        return {m: (round(float(v), 2) if np.isfinite(v) else None) for m, v in zip(rows["model"], values)}
+
+    db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document(rating_doc_id("bt_rating", study)).set(
+        {
+            "study": study,
+            "type": "bt_rating",
+            "timestamp": datetime.datetime.now(),
+            "vote_count": fit.votes,
+            "bootstrap": fit.bootstrap,
+            "confidence": fit.confidence,
+            "ratings": _finite(rows["rating"]),
+            "ci_low": _finite(rows["ci_low"]),
+            "ci_high": _finite(rows["ci_high"]),
+            "games": {m: int(v) for m, v in zip(rows["model"], rows["games"])},
+            "wins": {m: int(v) for m, v in zip(rows["model"], rows["wins"])},
+        }
+    )
+    log(f"Stored Bradley-Terry ratings for study '{study}' from {fit.votes} votes.")
+
+
+def load_fit(study: str) -> Optional[dict[str, Any]]:
+    """The study's stored bt_rating document, if it has been computed."""
+    snapshot = db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document(rating_doc_id("bt_rating", study)).get()
+    return snapshot.to_dict() if snapshot.exists else None
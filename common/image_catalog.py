@@ -0,0 +1,283 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" In-memory index of the pre-generated images that study battles are served from """
+
+from array import array
+import os
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from google.cloud import firestore
+
+from config.default import Default
+from config.firebase_config import FirebaseClient
+from common.image_variants import VariantPipeline
+from common.render_data import backend_call
+from utils.logger import LogLevel, log
+
+
+config = Default()
+db = FirebaseClient(database_id=config.IMAGE_FIREBASE_DB).get_client()
+
+
+def display_uri(gs_uri: str) -> str:
+    """The form of a stored image URI that the arena serves."""
+    if "stablediffusion" not in gs_uri:
+        return os.path.splitext(gs_uri)[0]
+    if gs_uri.startswith("20250328_"):
+        return os.path.splitext(gs_uri)[0]
+    return gs_uri
+
+
+class _ImageIndex:
+    """(prompt, model) -> image URIs.
+
+    Prompts and models are interned to small integers, each URI is stored
+    once, and every (prompt, model) key maps to an array of URI offsets.
+    `coverage` maps each prompt to a bitmask of the models that have an
+    image for it.
+    """
+
+    def __init__(self):
+        self.prompts: dict[str, int] = {}
+        self.prompt_names: list[str] = []
+        self.models: dict[str, int] = {}
+        self.uris: list[Optional[str]] = []
+        self.free: list[int] = []
+        self.images: dict[tuple[int, int], array] = {}
+        self.docs: dict[str, tuple[tuple[int, int], int]] = {}
+        self.coverage: dict[int, int] = {}
+        self.counts: dict[int, int] = {}  # images per model
+        self.version = 0
+        self.derived: dict[Any, tuple[int, Any]] = {}  # cached (version, value) of coverage queries
+
+    def _intern_prompt(self, prompt: str) -> int:
+        if prompt not in self.prompts:
+            self.prompts[prompt] = len(self.prompt_names)
+            self.prompt_names.append(prompt)
+        return self.prompts[prompt]
+
+    def add(self, doc_id: str, doc: dict[str, Any]):
+        self.remove(doc_id)
+        if not doc.get("gcsuri") or not doc.get("prompt") or not doc.get("model"):
+            return
+        key = (self._intern_prompt(doc["prompt"]), self.models.setdefault(doc["model"], len(self.models)))
+        uri = display_uri(doc["gcsuri"])
+        if self.free:
+            offset = self.free.pop()
+            self.uris[offset] = uri
+        else:
+            offset = len(self.uris)
+            self.uris.append(uri)
+        self.images.setdefault(key, array("I")).append(offset)
+        self.docs[doc_id] = (key, offset)
+        self.counts[key[1]] = self.counts.get(key[1], 0) + 1
+        if doc.get("variants"):
+            VariantPipeline().remember(uri, doc["variants"])
+        self.coverage[key[0]] = self.coverage.get(key[0], 0) | 1 << key[1]
+        self.version += 1
+
+    def remove(self, doc_id: str, model: Optional[str] = None):
+        """Drop a document's image; with `model`, only if it is still indexed under that model."""
+        entry = self.docs.get(doc_id)
+        if entry is None or (model is not None and entry[0][1] != self.models.get(model)):
+            return
+        del self.docs[doc_id]
+        key, offset = entry
+        self.counts[key[1]] -= 1
+        offsets = self.images[key]
+        offsets.remove(offset)
+        if not offsets:
+            del self.images[key]
+            self.coverage[key[0]] &= ~(1 << key[1])
+            if not self.coverage[key[0]]:
+                del self.coverage[key[0]]
+        self.uris[offset] = None
+        self.free.append(offset)
+        self.version += 1
+
+    def lookup(self, prompt: str, model: str) -> list[str]:
+        prompt_id, model_id = self.prompts.get(prompt), self.models.get(model)
+        if prompt_id is None or model_id is None:
+            return []
+        return [self.uris[offset] for offset in self.images.get((prompt_id, model_id), ())]
+
+    def image_count(self, model: str) -> int:
+        return self.counts.get(self.models.get(model), 0)
+
+    def prompt_count(self, model: str) -> int:
+        """Prompts the model has an image for"""
+        if model not in self.models:
+            return 0
+        bit = 1 << self.models[model]
+        return sum(1 for mask in self.coverage.values() if mask & bit)
+
+    def mask(self, models: list[str]) -> Optional[int]:
+        """Bitmask of the given models, or None if any has no images"""
+        mask = 0
+        for model in models:
+            if model not in self.models:
+                return None
+            mask |= 1 << self.models[model]
+        return mask
+
+    def covered_prompts(self, models: list[str]) -> list[str]:
+        """Prompts for which every one of the models has an image"""
+        key = ("covered", frozenset(models))
+        cached = self.derived.get(key)
+        if cached and cached[0] == self.version:
+            return cached[1]
+        mask = self.mask(models)
+        prompts = [] if mask is None else [self.prompt_names[p] for p, m in self.coverage.items() if m & mask == mask]
+        self.derived[key] = (self.version, prompts)
+        return prompts
+
+
+class StudyImageCatalog:
+    """(prompt, model) -> image URIs of every study model, held in memory (Singleton).
+
+    Image documents carry no study of their own (they are loaded per model,
+    and studies share models), so the catalog is indexed by model: a model's
+    images are loaded by a Firestore snapshot listener the first time a study
+    using it is watched. The listener then applies added, changed and removed
+    image documents incrementally, so lookups never touch the database.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(StudyImageCatalog, cls).__new__(cls)
+                instance._index = _ImageIndex()
+                instance._ready = {}
+                instance._watches = {}
+                cls._instance = instance
+            return cls._instance
+
+    def watch(self, models: list[str]) -> list[threading.Event]:
+        """Start loading the images of models that are not loaded already; returns their ready events."""
+        events = []
+        for model in models:
+            with self._lock:
+                if model in self._ready:
+                    events.append(self._ready[model])
+                    continue
+                ready = self._ready[model] = threading.Event()
+            events.append(ready)
+            self._watch_model(model, ready)
+        return events
+
+    def _watch_model(self, model: str, ready: threading.Event):
+        index = self._index
+
+        def on_snapshot(doc_snapshots, changes, read_time):  # pylint: disable=unused-argument
+            with self._lock:
+                for change in changes:
+                    if change.type.name == "REMOVED":
+                        # a document whose model changed is removed here after being added under its new model
+                        index.remove(change.document.id, model)
+                    else:
+                        index.add(change.document.id, change.document.to_dict())
+                images = index.image_count(model)
+            if not ready.is_set():
+                log(f"Image catalog loaded {images} images of model '{model}'.")
+                ready.set()
+
+        backend_call("firestore.image_catalog")
+        query = db.collection(config.IMAGE_COLLECTION_NAME).where(filter=firestore.FieldFilter("model", "==", model))
+        self._watches[model] = query.on_snapshot(on_snapshot)
+
+    def _wait(self, models: list[str], timeout: Optional[float] = None) -> bool:
+        """Whether the models' images load within `timeout`"""
+        deadline = time.monotonic() + (config.IMAGE_CATALOG_LOAD_TIMEOUT if timeout is None else timeout)
+        for ready in self.watch(models):
+            if not ready.wait(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def lookup(self, model: str, prompt: str, timeout: Optional[float] = None) -> Optional[list[str]]:
+        """All image URIs for a prompt and model, or None if the model is not loaded within `timeout`."""
+        if not self._wait([model], timeout):
+            log(f"Image catalog for model '{model}' is still loading.", LogLevel.WARNING)
+            return None
+        with self._lock:
+            return self._index.lookup(prompt, model)
+
+    def random_image(self, model: str, prompt: str) -> Optional[str]:
+        """One image URI for a prompt and model, chosen at random."""
+        uris = self.lookup(model, prompt)
+        return random.choice(uris) if uris else None
+
+    def covered_pairs(self, models: list[str]) -> Optional[dict[tuple[str, str], list[str]]]:
+        """For each pair of models, the prompts both have images for; None while the models load."""
+        if not self._wait(models):
+            return None
+        with self._lock:
+            return {
+                (model1, model2): self._index.covered_prompts([model1, model2])
+                for i, model1 in enumerate(models)
+                for model2 in models[i + 1 :]
+            }
+
+    def coverage_stats(self, models: list[str]) -> Optional[dict[str, Any]]:
+        """How completely the models' images cover their prompts; None while the models load."""
+        if not all(ready.is_set() for ready in self.watch(models)):
+            return None
+        index = self._index
+        with self._lock:
+            key = ("stats", tuple(models))
+            cached = index.derived.get(key)
+            if cached and cached[0] == index.version:
+                return cached[1]
+            mask = index.mask([model for model in models if model in index.models])
+            per_model = {model: 0 for model in models}
+            prompts = 0
+            for prompt_mask in index.coverage.values():
+                if not prompt_mask & mask:
+                    continue
+                prompts += 1
+                for model in models:
+                    if model in index.models and prompt_mask >> index.models[model] & 1:
+                        per_model[model] += 1
+            pairs = {
+                f"{model1} vs. {model2}": len(index.covered_prompts([model1, model2]))
+                for i, model1 in enumerate(models)
+                for model2 in models[i + 1 :]
+            }
+            stats = {
+                "images": sum(index.image_count(model) for model in models),
+                "prompts": prompts,
+                "fully_covered": len(index.covered_prompts(list(models))),
+                "prompts_per_model": per_model,
+                "prompts_per_pair": pairs,
+                "uncovered_pairs": [pair for pair, count in pairs.items() if not count],
+            }
+            index.derived[key] = (index.version, stats)
+            return stats
+
+    def metrics(self) -> dict[str, Any]:
+        """Loaded models, with their image and prompt counts."""
+        with self._lock:
+            return {
+                model: {
+                    "ready": ready.is_set(),
+                    "images": self._index.image_count(model),
+                    "prompts": self._index.prompt_count(model),
+                }
+                for model, ready in self._ready.items()
+            }
@@ -0,0 +1,204 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Smaller WebP variants of generated images, for thumbnails and the arena """
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import io
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from google.cloud import firestore
+from PIL import Image
+
+from common.render_data import backend_call
+from common.storage import StorageSession
+from config.default import Default
+from config.firebase_config import FirebaseClient
+from utils.logger import LogLevel, log
+
+
+config = Default()
+db = FirebaseClient(database_id=config.IMAGE_FIREBASE_DB).get_client()
+
+# variant name -> longest side, in pixels
+VARIANT_SIZES = {"thumb": 256, "display": 768}
+VARIANT_MIME_TYPE = "image/webp"
+_CACHE_CONTROL = "public, max-age=31536000, immutable"  # a variant never changes under its name
+
+
+def variant_uri(gs_uri: str, name: str) -> str:
+    """Where a variant of an image is stored: next to it, as <name>_<variant>.webp"""
+    return f"{os.path.splitext(gs_uri)[0]}_{name}.webp"
+
+
+def render_variants(data: bytes) -> dict[str, bytes]:
+    """Encode every variant of an image's bytes as WebP"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        variants = {}
+        for name, size in VARIANT_SIZES.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)  # never enlarges
+            buffer = io.BytesIO()
+            variant.save(buffer, format="WEBP", quality=config.VARIANT_QUALITY, method=4)
+            variants[name] = buffer.getvalue()
+        return variants
+
+
+def create_variants(gs_uri: str) -> tuple[dict[str, str], int, int]:
+    """Render and upload an image's variants, returning their URIs and the original and total variant sizes."""
+    session = StorageSession()
+    data = session.blob(gs_uri).download_as_bytes()
+    uris, variant_bytes = {}, 0
+    for name, contents in render_variants(data).items():
+        uri = variant_uri(gs_uri, name)
+        blob = session.blob(uri)
+        blob.cache_control = _CACHE_CONTROL
+        blob.upload_from_string(contents, content_type=VARIANT_MIME_TYPE)
+        uris[name] = uri
+        variant_bytes += len(contents)
+    return uris, len(data), variant_bytes
+
+
+def _key(gs_uri: str) -> str:
+    # stored and served forms of an image URI differ only by extension
+    return os.path.splitext(gs_uri)[0]
+
+
+def load_variants(gs_uri: str) -> dict[str, str]:
+    """An image's variants as recorded on its Firestore document; empty if none are."""
+    key = _key(gs_uri)
+    backend_call("firestore.variants")
+    query = (
+        db.collection(config.IMAGE_COLLECTION_NAME)
+        .where(filter=firestore.FieldFilter("gcsuri", ">=", key))
+        .where(filter=firestore.FieldFilter("gcsuri", "<", key + "\uf8ff"))
+        .select(["gcsuri", "variants"])
+    )
+    for doc in query.limit(10).stream():
+        image = doc.to_dict()
+        if _key(image["gcsuri"]) == key and image.get("variants"):
+            return image["variants"]
+    return {}
+
+
+class VariantPipeline:
+    """Creates image variants in the background, and remembers which exist (Singleton).
+
+    Generated images are submitted as they are stored, so variants never
+    delay a battle, and their URIs are recorded on the image's Firestore
+    document. Variants known to this process, whether created here or read
+    from image metadata, are kept in an LRU of VARIANT_INDEX_SIZE images
+    for pages to look up. The catalog's snapshot listeners fill it for the
+    images of watched models; any other image a page asks about is looked up
+    in the background, so variants created by other instances are served
+    from a later render on. Pages only ever read memory.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(VariantPipeline, cls).__new__(cls)
+                instance._executor = ThreadPoolExecutor(max_workers=config.VARIANT_WORKERS, thread_name_prefix="variants")
+                instance._known = OrderedDict()
+                instance._missing = OrderedDict()  # image key -> when it was found without variants
+                instance._pending = 0
+                instance._stats = {"created": 0, "failed": 0, "original_bytes": 0, "variant_bytes": 0, "lookups": 0}
+                cls._instance = instance
+            return cls._instance
+
+    def submit(self, gs_uri: str, on_done: Optional[Callable[[dict[str, str]], None]] = None) -> Future:
+        """Create an image's variants in the background; `on_done` receives their URIs."""
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._create, gs_uri, on_done)
+
+    def _create(self, gs_uri: str, on_done: Optional[Callable[[dict[str, str]], None]]) -> Optional[dict[str, str]]:
+        try:
+            uris, original_bytes, variant_bytes = create_variants(gs_uri)
+        except Exception as e:
+            log(f"Could not create variants of {gs_uri}: {e}", LogLevel.WARNING)
+            with self._lock:
+                self._pending -= 1
+                self._stats["failed"] += 1
+            return None
+        with self._lock:
+            self._pending -= 1
+            self._stats["created"] += 1
+            self._stats["original_bytes"] += original_bytes
+            self._stats["variant_bytes"] += variant_bytes
+        self.remember(gs_uri, uris)
+        if on_done:
+            on_done(uris)
+        return uris
+
+    def remember(self, gs_uri: str, variants: dict[str, str]):
+        """Record an image's variants, e.g. from its metadata."""
+        with self._lock:
+            self._known[_key(gs_uri)] = variants
+            self._known.move_to_end(_key(gs_uri))
+            self._missing.pop(_key(gs_uri), None)
+            while len(self._known) > config.VARIANT_INDEX_SIZE:
+                self._known.popitem(last=False)
+
+    def variants(self, gs_uri: str) -> dict[str, str]:
+        """The image's variants known to this process, by name; empty if none are. Never waits on a backend.
+
+        An image not known here is looked up on its Firestore document in
+        the background, at most once per VARIANT_LOOKUP_TTL, so later renders
+        can serve its variants.
+        """
+        if not gs_uri:
+            return {}
+        key = _key(gs_uri)
+        with self._lock:
+            if key in self._known:
+                self._known.move_to_end(key)
+                return self._known[key]
+            if time.time() - self._missing.get(key, float("-inf")) < config.VARIANT_LOOKUP_TTL:
+                return {}
+            self._missing[key] = time.time()
+            self._missing.move_to_end(key)
+            while len(self._missing) > config.VARIANT_INDEX_SIZE:
+                self._missing.popitem(last=False)
+            self._stats["lookups"] += 1
+        self._executor.submit(self._lookup, gs_uri)
+        return {}
+
+    def _lookup(self, gs_uri: str):
+        """Pool thread: remember the variants recorded on an image's document, if it has any"""
+        try:
+            variants = load_variants(gs_uri)
+        except Exception as e:
+            log(f"Could not look up variants of {gs_uri}: {e}", LogLevel.WARNING)
+            return
+        if variants:
+            self.remember(gs_uri, variants)
+
+    def best(self, gs_uri: str, name: str) -> str:
+        """The named variant of an image if it is known, else the image itself."""
+        return self.variants(gs_uri).get(name, gs_uri)
+
+    def metrics(self) -> dict[str, Any]:
+        """Variants created and pending, the bytes they save, and Firestore lookups of images not known here."""
+        with self._lock:
+            return {**self._stats, "pending": self._pending, "known": len(self._known)}
@@ -0,0 +1,154 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Precomputed leaderboard tables, cached per study and shared between workers """
+
+from dataclasses import dataclass
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from common.render_data import backend_call
+from config.default import Default
+from utils.logger import LogLevel, log
+
+
+config = Default()
+
+
+@dataclass
+class _Entry:
+    table: pd.DataFrame
+    expires_at: float
+    mtime_ns: int
+
+
+class LeaderboardCache:
+    """Leaderboard tables keyed by kind and study, with a TTL (Singleton).
+
+    Tables are held in memory and mirrored to one JSON file per key in
+    `LEADERBOARD_CACHE_DIR`, so gunicorn workers on the same host build
+    each table once per TTL between them. Invalidating a table removes its
+    file; every worker notices on its next read with a single stat call.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(LeaderboardCache, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+            return cls._instance
+
+    def _initialize(self):
+        self.ttl = config.LEADERBOARD_CACHE_TTL
+        self.directory = config.LEADERBOARD_CACHE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries: dict[str, _Entry] = {}
+        self._build_locks: dict[str, threading.Lock] = {}
+        self._stats = {"hits": 0, "shared_hits": 0, "builds": 0, "invalidations": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".json")
+
+    def get(self, study: str, build: Callable[[str], pd.DataFrame], kind: str = "ratings") -> pd.DataFrame:
+        """The study's table of a kind, built with `build(study)` if no fresh copy is cached."""
+        key = f"{kind}.{study}"
+        entry = self._fresh(key)
+        if entry is not None:
+            self._stats["hits"] += 1
+            return entry.table
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            # another thread, or another worker, may have built it meanwhile
+            entry = self._fresh(key) or self._load(key)
+            if entry is not None:
+                self._stats["shared_hits"] += 1
+                return entry.table
+            backend_call(f"leaderboard.{kind}")
+            table = build(study)
+            self._stats["builds"] += 1
+            self._entries[key] = self._save(key, table)
+            return table
+
+    def invalidate(self, study: str, kind: str = "ratings"):
+        """Drop the study's table of a kind in every worker."""
+        key = f"{kind}.{study}"
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        self._stats["invalidations"] += 1
+
+    def metrics(self) -> dict[str, Any]:
+        """Hit, build and invalidation counts."""
+        return {**self._stats, "studies": len(self._entries)}
+
+    def _fresh(self, key: str) -> Optional[_Entry]:
+        """The in-memory entry, if it is unexpired and its file is unchanged"""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.time():
+            return None
+        if entry.mtime_ns < 0:
+            return entry  # not shared; expires with its TTL
+        try:
+            if os.stat(self._path(key)).st_mtime_ns != entry.mtime_ns:
+                return None
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def _load(self, key: str) -> Optional[_Entry]:
+        """Adopt a table another worker wrote, if it is unexpired"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                doc = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if doc["expires_at"] < time.time():
+            return None
+        entry = _Entry(pd.DataFrame(doc["rows"], columns=doc["columns"]), doc["expires_at"], mtime_ns)
+        self._entries[key] = entry
+        return entry
+
+    def _save(self, key: str, table: pd.DataFrame) -> _Entry:
+        """Write a table for the other workers; the rename makes it appear atomically"""
+        expires_at = time.time() + self.ttl
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"expires_at": expires_at, "columns": list(table.columns), "rows": table.values.tolist()},
+                    f,
+                    default=str,
+                )
+            os.replace(tmp_path, path)
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            log(f"Could not share the leaderboard table {key}: {e}", LogLevel.WARNING)
+            mtime_ns = -1
+        return _Entry(table, expires_at, mtime_ns)
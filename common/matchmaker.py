@@ -0,0 +1,193 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Active-sampling matchmaker: picks the battles that tell us the most """
+
+from collections import Counter
+import math
+import random
+import threading
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from common.bradley_terry import fit_strengths, load_matchups
+from common.ratings import DEFAULT_RATING, ELO_SCALE, Matchup
+from utils.logger import LogLevel, log
+
+
+class _StudyMatrix:
+    """Win counts between a study's models, with a warm-started strength estimate"""
+
+    def __init__(self):
+        self.index: dict[str, int] = {}
+        self.wins = np.zeros((0, 0))
+        self.strengths = np.zeros(0)
+        self.dirty = False
+
+    def register(self, model: str):
+        if model not in self.index:
+            self.index[model] = len(self.index)
+            self.wins = np.pad(self.wins, ((0, 1), (0, 1)))
+            self.strengths = np.append(self.strengths, 0.0)
+
+    def refit(self):
+        if self.dirty:
+            self.strengths = np.nan_to_num(fit_strengths(self.wins, max_iter=200, start=self.strengths))
+            self.dirty = False
+
+    def add(self, model1: str, model2: str, winner: str):
+        self.register(model1)
+        self.register(model2)
+        i, j = self.index[model1], self.index[model2]
+        if winner == model1:
+            self.wins[i, j] += 1
+        elif winner == model2:
+            self.wins[j, i] += 1
+        else:
+            self.wins[i, j] += 0.5
+            self.wins[j, i] += 0.5
+        self.dirty = True
+
+
+class Matchmaker:
+    """Chooses model pairs and prompts for battles.
+
+    The matchmaker keeps a win matrix per study and fits Bradley-Terry
+    strengths to it. A pair is drawn with probability proportional to the
+    chance that the current estimate orders it wrongly: P(misorder) is
+    high for closely rated models and for pairs whose rating difference is
+    still uncertain because they (or their opponents) have been compared
+    few times, and falls towards zero once the order is settled. A floor
+    keeps every pair in rotation. Prompts are drawn by the power of
+    `prompt_choices` choices on appearance counts, which keeps prompt
+    exposure balanced without scanning the prompt list.
+
+    `load_history` seeds a study's matrix from its votes in the background.
+    """
+
+    def __init__(self, floor: float = 0.02, prompt_choices: int = 4, rng: Optional[random.Random] = None):
+        self.floor = floor
+        self.prompt_choices = prompt_choices
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._studies: dict[str, _StudyMatrix] = {}
+        self._prompts: dict[str, Counter] = {}
+        self._loaded: set[str] = set()
+
+    def load_history(self, study: str):
+        """Seed the study's win matrix from its vote history, once, without blocking."""
+        with self._lock:
+            if study in self._loaded:
+                return
+            self._loaded.add(study)
+
+        def _load():
+            try:
+                self.seed(study, load_matchups(study))
+            except Exception as e:
+                log(f"Failed to load the vote history of study '{study}': {e}", LogLevel.WARNING)
+
+        threading.Thread(target=_load, name=f"matchmaker-history-{study}", daemon=True).start()
+
+    def seed(self, study: str, matchups: Iterable[Matchup]):
+        """Add past votes to the study's win matrix."""
+        matchups = list(matchups)
+        with self._lock:
+            matrix = self._studies.setdefault(study, _StudyMatrix())
+            for model1, model2, winner in matchups:
+                matrix.add(model1, model2, winner)
+
+    def record(self, study: str, model1: str, model2: str, winner: str):
+        """Count a vote between two models."""
+        with self._lock:
+            self._studies.setdefault(study, _StudyMatrix()).add(model1, model2, winner)
+
+    def pair_weights(self, study: str, models: Sequence[str]) -> dict[tuple[str, str], float]:
+        """Sampling weight of every pair of models: the chance they are currently misordered."""
+        with self._lock:
+            matrix = self._studies.setdefault(study, _StudyMatrix())
+            for model in models:
+                matrix.register(model)
+            matrix.refit()
+            theta, wins = matrix.strengths, matrix.wins
+            idx = [matrix.index[model] for model in models]
+
+        # Fisher information of the log-strengths, with one virtual tie between every pair as the prior
+        games = wins + wins.T + 1 - np.eye(len(theta))
+        p = 1 / (1 + np.exp(theta[None, :] - theta[:, None]))
+        information = games * p * (1 - p)
+        information = np.diag(information.sum(axis=1)) - information
+        covariance = np.linalg.pinv(information)
+
+        weights = {}
+        for a, model1 in enumerate(models):
+            for b in range(a + 1, len(models)):
+                i, j = idx[a], idx[b]
+                variance = max(covariance[i, i] + covariance[j, j] - 2 * covariance[i, j], 1e-12)
+                # P(misorder) = Phi(-|difference| / sd)
+                weights[(model1, models[b])] = 0.5 * math.erfc(abs(theta[i] - theta[j]) / math.sqrt(2 * variance))
+        top = max(weights.values(), default=0)
+        return {pair: max(weight, self.floor * top) for pair, weight in weights.items()}
+
+    def pick_models(
+        self, study: str, models: Sequence[str], allowed: Optional[Iterable[tuple[str, str]]] = None
+    ) -> list[str]:
+        """Two models to battle, in random order, optionally only from the `allowed` pairs."""
+        if len(models) < 2:
+            raise ValueError("At least two models are needed for a battle.")
+        weights = self.pair_weights(study, models)
+        if allowed is not None:
+            allowed = {frozenset(pair) for pair in allowed}
+            weights = {pair: weight for pair, weight in weights.items() if frozenset(pair) in allowed}
+            if not weights:
+                raise ValueError("None of the allowed pairs can battle.")
+        pair = list(self._rng.choices(list(weights), weights=list(weights.values()))[0])
+        self._rng.shuffle(pair)
+        return pair
+
+    def pick_prompt(self, study: str, prompts: Sequence[str]) -> str:
+        """A prompt that has been shown less than most, and count it as shown."""
+        candidates = [self._rng.choice(prompts) for _ in range(self.prompt_choices)]
+        with self._lock:
+            counts = self._prompts.setdefault(study, Counter())
+            prompt = min(candidates, key=lambda candidate: counts[candidate])
+            counts[prompt] += 1
+        return prompt
+
+    def ratings(self, study: str) -> dict[str, float]:
+        """The matchmaker's own Bradley-Terry estimate, on the ELO scale."""
+        with self._lock:
+            matrix = self._studies.get(study)
+            if matrix is None:
+                return {}
+            matrix.refit()
+            return {model: DEFAULT_RATING + ELO_SCALE / math.log(10) * matrix.strengths[i] for model, i in matrix.index.items()}
+
+    def pair_counts(self, study: str) -> dict[tuple[str, str], int]:
+        """Votes seen per pair of models."""
+        with self._lock:
+            matrix = self._studies.get(study)
+            if matrix is None:
+                return {}
+            games = matrix.wins + matrix.wins.T
+            models = list(matrix.index)
+            return {
+                (model1, model2): int(games[i, j])
+                for i, model1 in enumerate(models)
+                for j, model2 in enumerate(models[i + 1 :], start=i + 1)
+                if games[i, j]
+            }
+
+
+matchmaker = Matchmaker()
@@ -12,22 +12,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
+from collections import OrderedDict, deque
 import datetime
 import json
 import os
+import threading
+import time
 from typing import Optional, Dict, Any, List
 import pandas as pd
+from tenacity import Retrying, stop_after_attempt, wait_exponential
 
 from google.cloud import firestore
 
 from config.default import Default
 from config.firebase_config import FirebaseClient
-from config.spanner_config import ArenaStudyTracker, ArenaModelEvaluation
 from models.set_up import ModelSetup
-from common.storage import check_gcs_blob_exists
+from common.bradley_terry import load_fit
+from common.image_variants import VariantPipeline
+from common.leaderboard import LeaderboardCache
+from common.matchmaker import matchmaker
+from common.rating_history import RatingHistoryWriter
+from common.render_data import backend_call
+from common.ratings import EloEngine
+from common.storage import exists_many
+from common.vote_log import VoteLog
 from alive_progress import alive_bar
 
 from utils.logger import LogLevel, log
+from utils.metrics import Histogram
 
 
 # Initialize configuration
@@ -37,30 +50,212 @@ config = Default()
 db = FirebaseClient(database_id=config.IMAGE_FIREBASE_DB).get_client()
 
 
+class MetadataWriter:
+    """Buffers image metadata and writes it to Firestore in batches (Singleton).
+
+    Records are flushed by a background thread once `batch_size` are waiting
+    or `flush_interval` seconds after the first of them was queued, whichever
+    comes first. Failed commits are retried with exponential backoff; a batch
+    that still fails goes back to the front of the queue. Anything still
+    buffered is flushed when the process exits, and what cannot be written
+    then is spilled to METADATA_SPILL_PATH and queued again on the next start.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(MetadataWriter, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+            return cls._instance
+
+    def _initialize(self):
+        self.batch_size = min(config.METADATA_BATCH_SIZE, 500)  # Firestore batch limit
+        self.flush_interval = config.METADATA_FLUSH_INTERVAL
+        self._queue: deque[tuple[str, str, dict[str, Any], bool]] = deque()
+        self._cond = threading.Condition()
+        self._writing = 0
+        self._flushing = 0
+        self._closed = False
+        self._stats = {"written": 0, "failed": 0, "batches": 0, "spilled": 0, "replayed": 0}
+        self.flush_latency = Histogram()
+        self._replay_spill()
+        self._thread = threading.Thread(target=self._run, name="metadata-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, collection_name: str, record: dict[str, Any], doc_id: Optional[str] = None, merge: bool = False) -> str:
+        """Buffer a record for writing, returning its (pre-allocated) document ID.
+
+        With `merge`, the record's fields are merged into the document `doc_id` instead of replacing it.
+        """
+        doc_id = doc_id or db.collection(collection_name).document().id
+        with self._cond:
+            self._queue.append((collection_name, doc_id, record, merge))
+            # wake the writer to start its flush timer, or to write a full batch
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        return doc_id
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every buffered record has been written, or timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1  # write without waiting for the flush timer
+            self._cond.notify_all()
+            try:
+                while self._queue or self._writing:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(timeout=remaining)
+            finally:
+                self._flushing -= 1
+        return True
+
+    def close(self):
+        """Flush buffered records and stop the writer thread."""
+        if self._closed:
+            return
+        self.flush(timeout=config.METADATA_FLUSH_INTERVAL * 10)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            unwritten = list(self._queue)
+            self._queue.clear()
+        if unwritten:
+            self._spill(unwritten)
+
+    def _spill(self, records: list[tuple[str, str, dict[str, Any], bool]]):
+        """Append unwritten records to the spill file"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(config.METADATA_SPILL_PATH)), exist_ok=True)
+            with open(config.METADATA_SPILL_PATH, "a", encoding="utf-8") as f:
+                for collection_name, doc_id, record, merge in records:
+                    f.write(json.dumps([collection_name, doc_id, record, merge], default=_encode_datetime) + "\n")
+        except (OSError, TypeError) as e:
+            log(f"Metadata writer lost {len(records)} unwritten records: {e}", LogLevel.ERROR)
+            return
+        self._stats["spilled"] += len(records)
+        log(f"Metadata writer spilled {len(records)} unwritten records to {config.METADATA_SPILL_PATH}.", LogLevel.WARNING)
+
+    def _replay_spill(self):
+        """Queue the records a previous run spilled"""
+        claimed = f"{config.METADATA_SPILL_PATH}.{os.getpid()}"
+        try:
+            os.replace(config.METADATA_SPILL_PATH, claimed)  # one worker claims the file
+            with open(claimed, "r", encoding="utf-8") as f:
+                records = [tuple(json.loads(line, object_hook=_decode_datetime)) for line in f if line.strip()]
+            os.remove(claimed)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log(f"Could not replay spilled metadata records: {e}", LogLevel.ERROR)
+            return
+        self._queue.extend(records)
+        self._stats["replayed"] += len(records)
+        log(f"Metadata writer replaying {len(records)} spilled records.")
+
+    def metrics(self) -> dict[str, Any]:
+        """Queue depth, write counts and flush latency."""
+        with self._cond:
+            return {**self._stats, "depth": len(self._queue), "flush_latency": self.flush_latency.snapshot()}
+
+    def _run(self):
+        """Writer thread loop"""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return  # close() spills what is left
+                # the flush timer starts with the first waiting record
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not self._flushing and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                if self._closed:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._writing = len(batch)
+            written = self._write(batch)
+            with self._cond:
+                closed = self._closed
+                if not written and not closed:
+                    self._queue.extendleft(reversed(batch))  # retried first, in order
+                self._writing = 0
+                self._cond.notify_all()
+                if not written and not closed:
+                    self._cond.wait(timeout=self.flush_interval)  # back off before the next attempt
+            if not written and closed:
+                self._spill(batch)  # close() has already spilled the queue
+
+    def _write(self, records: list[tuple[str, str, dict[str, Any], bool]]) -> bool:
+        """Commit one batch, retrying with exponential backoff; returns whether it was written"""
+        start = time.monotonic()
+        try:
+            for attempt in Retrying(
+                wait=wait_exponential(multiplier=1, min=1, max=16),
+                stop=stop_after_attempt(config.METADATA_MAX_RETRIES),
+                reraise=True,
+            ):
+                with attempt:
+                    batch = db.batch()
+                    for collection_name, doc_id, record, merge in records:
+                        batch.set(db.collection(collection_name).document(doc_id), record, merge=merge)
+                    batch.commit()
+        except Exception as e:
+            self._stats["failed"] += len(records)
+            log(f"Error storing {len(records)} image metadata records, requeued: {e}", LogLevel.ERROR)
+            return False
+        finally:
+            self.flush_latency.observe(time.monotonic() - start)
+        self._stats["written"] += len(records)
+        self._stats["batches"] += 1
+        log(f"Stored {len(records)} image metadata records in Firestore.")
+        return True
+
+
+def _encode_datetime(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"Cannot spill a {type(value).__name__}")
+
+
+def _decode_datetime(obj: dict[str, Any]) -> Any:
+    return datetime.datetime.fromisoformat(obj["$datetime"]) if set(obj) == {"$datetime"} else obj
+
+
 def add_image_metadata(gcsuri: str, prompt: str, model: str, study: Optional[str] = "live", collection_name: Optional[str] = None):
-    """Add Image metadata to Firestore persistence"""
+    """Queue Image metadata for Firestore persistence, returning its document ID"""
     
     if collection_name is None:
         collection_name = config.IMAGE_COLLECTION_NAME
-    print(f"Using Firestore collection: {collection_name}")
     current_datetime = datetime.datetime.now()
 
-    # Store the image metadata in Firestore
-    doc_ref = db.collection(collection_name).document()
-    try:
-        doc_ref.set(
-            {
-                "gcsuri": gcsuri,
-                "study": study,
-                "prompt": prompt,
-                "model": model,
-                "timestamp": current_datetime,  # alt: firestore.SERVER_TIMESTAMP
-            }
-        )
-    except Exception as e:
-        print(f"Error storing image metadata: {e}")
-        return
-    print(f"Image data stored in Firestore with document ID: {doc_ref.id}")
+    # Written in the background by the MetadataWriter
+    doc_id = MetadataWriter().enqueue(
+        collection_name,
+        {
+            "gcsuri": gcsuri,
+            "study": study,
+            "prompt": prompt,
+            "model": model,
+            "timestamp": current_datetime,  # alt: firestore.SERVER_TIMESTAMP
+        },
+    )
+    print(f"Image data queued for Firestore collection {collection_name} with document ID: {doc_id}")
+    return doc_id
+
+
+def add_image_variants(doc_id: str, variants: dict[str, str], collection_name: Optional[str] = None):
+    """Queue the URIs of an image's smaller variants, recorded next to its gcsuri"""
+    MetadataWriter().enqueue(collection_name or config.IMAGE_COLLECTION_NAME, {"variants": variants}, doc_id=doc_id, merge=True)
 
 
 def load_metadata_from_json(
@@ -100,6 +295,16 @@ def load_metadata_from_json(
         if not data_list:
             raise ValueError(f"No data found under the key '{top_level_key}' in the provided JSON file.")
 
+        # check every candidate image up front, concurrently, instead of one request per image
+        candidate_uris = [
+            f"gs://{Default.GENMEDIA_BUCKET}/{gcs_sub_folder}/{image_id}"
+            for item in data_list
+            if isinstance(item, (list, tuple)) and len(item) >= 2 and isinstance(item[1], list)
+            for image_id in item[1]
+        ]
+        print(f"Checking {len(candidate_uris)} candidate images in GCS...")
+        existing = exists_many(candidate_uris)
+
         total_items = len(data_list)
         with alive_bar(total_items, title="Processing Metadata") as bar:
             for item in data_list:
@@ -134,7 +339,7 @@ def load_metadata_from_json(
                 selected_image = None
                 for image_id in images:
                     gcs_uri = f"gs://{Default.GENMEDIA_BUCKET}/{gcs_sub_folder}/{image_id}"
-                    if check_gcs_blob_exists(gcs_uri):
+                    if existing.get(gcs_uri):
                         print(f"Selected image: {image_id} exists in GCS.")
                         selected_image = image_id
                         selected_image_gcsuri = gcs_uri
@@ -148,152 +353,219 @@ def load_metadata_from_json(
                 add_image_metadata(collection_name=collection_name, gcsuri=selected_image_gcsuri, prompt=prompt, model=model_name)
                 bar()  # Increment the progress bar
 
-def get_elo_ratings(study: str):
-    """ Retrieve ELO ratings for models from Firestore """
-    # Fetch current ELO ratings from Firestore
-    doc_ref = (
-        db.collection(config.IMAGE_RATINGS_COLLECTION_NAME)
-        .where(filter=firestore.FieldFilter("study", "==", study))
-        .where(filter=firestore.FieldFilter("type", "==", "elo_rating"))
-        .get()
-    )
-    updated_ratings = {}
-    if doc_ref:
-        for doc in doc_ref:
-            ratings = doc.to_dict().get("ratings", {})
-            updated_ratings.update(ratings)
-    # Convert to DataFrame
-    df = pd.DataFrame(list(updated_ratings.items()), columns=['Model', 'ELO Rating'])
-    df = df.sort_values(by='ELO Rating', ascending=False)  # Sort by rating
-    df.reset_index(drop=True, inplace=True)  # Reset index
-    return df
+    print("Waiting for queued metadata to be written...")
+    MetadataWriter().flush()
 
+def _format_interval(low: Optional[float], high: Optional[float]) -> str:
+    return f"{low:.0f} - {high:.0f}" if low is not None and high is not None else "n/a"
 
-def update_elo_ratings(model1: str, model2: str, winner: str, images: list[str], prompt: str, study: str):
-    """Update ELO ratings for models"""
 
-    current_datetime = datetime.datetime.now()
+def _win_rate(wins: int, games: int) -> str:
+    return f"{wins / games:.1%}" if games else "n/a"
 
-    # Fetch current ELO ratings from Firestore
-    doc_ref = (
-        db.collection(config.IMAGE_RATINGS_COLLECTION_NAME)
-        .where(filter=firestore.FieldFilter("study", "==", study))
-        .where(filter=firestore.FieldFilter("type", "==", "elo_rating"))
-        .get()
-    )
 
-    updated_ratings = {}
-    elo_rating_doc_id = None  # Store the document ID
-    if doc_ref:
-        for doc in doc_ref:
-            elo_rating_doc_id = doc.id  # Get the document ID
-            ratings = doc.to_dict().get("ratings", {})
-            updated_ratings.update(ratings)
-
-    elo_model1 = updated_ratings.get(model1, 1000)  # Default to 1000 if not found
-    elo_model2 = updated_ratings.get(model2, 1000)
-
-    # Calculate expected scores
-    expected_model1 = 1 / (1 + 10 ** ((elo_model2 - elo_model1) / 400))
-    expected_model2 = 1 / (1 + 10 ** ((elo_model1 - elo_model2) / 400))
-
-    # Update ELO ratings based on the winner
-    k_factor = config.ELO_K_FACTOR
-    if winner == model1:
-        elo_model1 = elo_model1 + k_factor * (1 - expected_model1)
-        elo_model2 = elo_model2 + k_factor * (0 - expected_model2)
-    elif winner == model2:
-        elo_model1 = elo_model1 + k_factor * (0 - expected_model1)
-        elo_model2 = elo_model2 + k_factor * (1 - expected_model2)
-
-    updated_ratings[model1] = round(elo_model1, 2)
-    updated_ratings[model2] = round(elo_model2, 2)
-
-    print(f"Ratings: {updated_ratings}")
-
-    # Store updated ELO ratings in Firestore
-    if elo_rating_doc_id:  # Check if the document ID was found
-        doc_ref = db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document(elo_rating_doc_id)
-        doc_ref.update(
-            {
-                "ratings": updated_ratings,
-                "timestamp": current_datetime,
-            }
-        )
-        print(f"ELO ratings updated in Firestore with document ID: {doc_ref.id}")
-    else:
-        # Document doesn't exist, create it
-        doc_ref = db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document()
-        doc_ref.set(
+def get_elo_ratings(study: str):
+    """ Build the leaderboard table: the stored Bradley-Terry fit if configured, else the live ELO ratings """
+    rows = []
+    if config.RATING_METHOD == "bradley_terry":
+        fit = load_fit(study)
+        if fit:
+            rows = [
+                {
+                    "Model": model,
+                    "Rating": rating,
+                    "Votes": fit["games"].get(model, 0),
+                    "Win Rate": _win_rate(fit["wins"].get(model, 0), fit["games"].get(model, 0)),
+                    f"{fit['confidence']:.0%} CI": _format_interval(fit["ci_low"].get(model), fit["ci_high"].get(model)),
+                }
+                for model, rating in fit["ratings"].items()
+                if rating is not None
+            ]
+        else:
+            log(f"No Bradley-Terry ratings stored for study '{study}'; serving ELO ratings.", LogLevel.WARNING)
+
+    if not rows:
+        state = EloEngine().state(study)
+        rows = [
             {
-                "study": study,
-                "type": "elo_rating",
-                "ratings": updated_ratings,
-                "timestamp": current_datetime,
+                "Model": model,
+                "Rating": rating,
+                "Votes": state["games"].get(model, 0),
+                "Win Rate": _win_rate(state["wins"].get(model, 0), state["games"].get(model, 0)),
+                "95% CI": "n/a",
             }
-        )
+            for model, rating in state["ratings"].items()
+        ]
+
+    df = pd.DataFrame(rows, columns=list(rows[0]) if rows else ["Model", "Rating", "Votes", "Win Rate", "95% CI"])
+    df = df.sort_values(by="Rating", ascending=False)  # Sort by rating
+    df.reset_index(drop=True, inplace=True)  # Reset index
+    return df
 
-        print(f"ELO ratings created in Firestore with document ID: {doc_ref.id}")
 
-    doc_ref = db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document()
-    doc_ref.set(
+def get_leaderboard(study: str) -> pd.DataFrame:
+    """ The study's leaderboard table, served from the shared cache """
+    return LeaderboardCache().get(study, get_elo_ratings)
+
+
+def record_vote(model1: str, model2: str, winner: str, images: list[str], prompt: str, study: str) -> str:
+    """Durably log a vote, returning its ID; ratings are updated in the background"""
+    vote_id = vote_log.append(
+        study,
         {
-            "timestamp": current_datetime,
-            "type": "vote",
+            "timestamp": datetime.datetime.now().isoformat(),
             "model1": model1,
             "image1": images[0],
             "model2": model2,
             "image2": images[1],
+            # variants known in memory, if any; the vote never waits on Firestore for them
+            "variants1": VariantPipeline().variants(images[0]),
+            "variants2": VariantPipeline().variants(images[1]),
             "winner": winner,
             "prompt": prompt,
-            "study": study
-        }
+        },
     )
+    matchmaker.record(study, model1, model2, winner)
+    log(f"Vote {vote_id} logged for study '{study}'.")
+    return vote_id
 
-    print(f"Vote updated in Firestore with document ID: {doc_ref.id}")
 
-    # Update the latest ELO ratings in Spanner
-    study_tracker = ArenaStudyTracker(
-        project_id=config.PROJECT_ID,
-        spanner_instance_id=config.SPANNER_INSTANCE_ID,
-        spanner_database_id=config.SPANNER_DATABASE_ID,
-    )
-    if not study_tracker:
-        log("Failed to initialize Spanner study tracker.", LogLevel.ERROR)
-        raise RuntimeError("Spanner study tracker initialization failed.")
-    elo_ratings_by_model = []
-    for model, elo in updated_ratings.items():
-        elo_study_entry = ArenaModelEvaluation(model_name=model, 
-                             rating=elo, 
-                             study=study)
-        elo_ratings_by_model.append(elo_study_entry)
-    
-    try:
-        study_tracker.upsert_study_runs(study_runs=elo_ratings_by_model)
-        log(f"ELO ratings updated in Spanner for study '{study}'.", LogLevel.ON)
-    except Exception as e:
-        log(f"Failed to update ELO ratings in Spanner: {e}", LogLevel.ERROR)
-        raise RuntimeError(f"Failed to update ELO ratings in Spanner: {e}")
+def _votes_by_study(votes: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    """Group logged votes by study, keeping their order"""
+    by_study: dict[str, list[dict[str, Any]]] = {}
+    for vote in votes:
+        by_study.setdefault(vote["study"], []).append(vote)
+    return by_study
 
 
-def get_latest_votes(study: str, limit: int = 10):
-    """Retrieve the latest votes from Firestore, ordered by timestamp in descending order."""
+def _store_votes_in_firestore(votes: list[dict[str, Any]]):
+    """Vote log sink: store vote documents and apply them to the ELO ratings"""
+    for study, study_votes in _votes_by_study(votes).items():
+        records = [
+            {**{k: v for k, v in vote.items() if k != "study"}, "timestamp": datetime.datetime.fromisoformat(vote["timestamp"])}
+            for vote in study_votes
+        ]
+        # votes already stored under their ID are skipped, so a replayed batch is applied once
+        updated_ratings = EloEngine().record_votes(study, records)
+        LeaderboardCache().invalidate(study)
+        VoteFeed().invalidate(study)
+        log(f"Applied {len(records)} votes to study '{study}'. Ratings: {updated_ratings}")
 
-    try:
-        votes_ref = (
+
+def _store_ratings_in_spanner(votes: list[dict[str, Any]]):
+    """Vote log sink: append the new ratings of the voted models to the Spanner history
+
+    Returns only once they are committed, so the votes stay in the log until then.
+    """
+    writer = RatingHistoryWriter()
+    for study, study_votes in _votes_by_study(votes).items():
+        ratings = EloEngine().ratings(study)
+        changed = {model for vote in study_votes for model in (vote["model1"], vote["model2"])}
+        writer.record(study, {model: ratings[model] for model in changed if model in ratings})
+    # within the drainer's lease, so no other worker replays the batch meanwhile
+    if not writer.flush(timeout=config.VOTE_DRAIN_LEASE / 2):
+        raise RuntimeError("Spanner rating history commit did not complete")
+
+
+vote_log = VoteLog()
+vote_log.register_sink("firestore", _store_votes_in_firestore)
+vote_log.register_sink("spanner", _store_ratings_in_spanner)
+vote_log.start()
+
+
+class VoteFeed:
+    """Pages of a study's votes, newest first, cached in memory (Singleton).
+
+    Votes are ordered by timestamp, then document id, so votes stored in the
+    same instant keep a fixed order. A page is identified by its cursor: the
+    timestamp and document id of the last vote on the page before it, as
+    "<iso timestamp>/<document id>". Pages after the first only hold older votes, so they
+    never change and are kept until evicted (LRU, VOTE_FEED_CACHE_PAGES).
+    The first page gains new votes, so it is re-read after VOTE_FEED_TTL
+    seconds, or as soon as this process stores a vote for the study.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(VoteFeed, cls).__new__(cls)
+                instance._pages = OrderedDict()
+                instance._stats = {"hits": 0, "reads": 0}
+                cls._instance = instance
+            return cls._instance
+
+    def page(
+        self, study: str, after: Optional[str] = None, limit: Optional[int] = None, max_age: Optional[float] = None
+    ) -> tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a study's votes.
+
+        Args:
+            study: the study.
+            after: the cursor returned with the previous page; None for the newest votes.
+            limit: votes per page; defaults to VOTE_FEED_PAGE_SIZE.
+            max_age: seconds a cached first page is served for; defaults to VOTE_FEED_TTL.
+        Returns:
+            The votes, and the cursor of the next page, or None if there are no older votes.
+        """
+        limit = limit or config.VOTE_FEED_PAGE_SIZE
+        max_age = config.VOTE_FEED_TTL if max_age is None else max_age
+        key = (study, after, limit)
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None and (after is not None or time.time() - cached[0] < max_age):
+                self._pages.move_to_end(key)
+                self._stats["hits"] += 1
+                return cached[1], cached[2]
+
+        query = (
             db.collection(config.IMAGE_RATINGS_COLLECTION_NAME)
             .where(filter=firestore.FieldFilter("study", "==", study))
             .where(filter=firestore.FieldFilter("type", "==", "vote"))
             .order_by("timestamp", direction=firestore.Query.DESCENDING)
-            .limit(limit)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)  # the document id
         )
-
-        votes = []
-        for doc in votes_ref.stream():
-            votes.append(doc.to_dict())
-
-        return votes
-
+        if after is not None:
+            timestamp, _, doc_id = after.partition("/")
+            query = query.start_after({"timestamp": datetime.datetime.fromisoformat(timestamp), "__name__": doc_id})
+        backend_call("firestore.votes")
+        docs = list(query.limit(limit).stream())
+        votes = [doc.to_dict() for doc in docs]
+        cursor = f"{votes[-1]['timestamp'].isoformat()}/{docs[-1].id}" if len(votes) == limit else None
+
+        with self._lock:
+            self._stats["reads"] += 1
+            self._pages[key] = (time.time(), votes, cursor)
+            while len(self._pages) > config.VOTE_FEED_CACHE_PAGES:
+                self._pages.popitem(last=False)
+        return votes, cursor
+
+    def invalidate(self, study: str):
+        """Drop the study's first pages, which new votes change."""
+        with self._lock:
+            for key in [key for key in self._pages if key[0] == study and key[1] is None]:
+                del self._pages[key]
+
+    def metrics(self) -> dict[str, Any]:
+        """Cached pages, and page reads served from the cache or Firestore."""
+        with self._lock:
+            return {**self._stats, "pages": len(self._pages)}
+
+
+def get_vote_page(
+    study: str, after: Optional[str] = None, limit: Optional[int] = None, max_age: Optional[float] = None
+) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a study's votes, newest first, and the cursor of the next page (see VoteFeed.page)."""
+    try:
+        return VoteFeed().page(study, after, limit, max_age)
     except Exception as e:
         print(f"Error fetching votes: {e}")
-        return []
+        return [], None
+
+
+def get_latest_votes(study: str, limit: int = 10):
+    """Retrieve the latest votes from Firestore, ordered by timestamp in descending order."""
+    return get_vote_page(study, limit=limit)[0]
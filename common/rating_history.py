@@ -0,0 +1,168 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Spanner rating history: coalescing writer and downsampled reads """
+
+import atexit
+import threading
+import time
+from typing import Any, Optional
+
+import pandas as pd
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
+from common.leaderboard import LeaderboardCache
+from config.default import Default
+from config.spanner_config import ArenaStudyTracker
+from utils.logger import LogLevel, log
+from utils.metrics import Histogram
+
+
+config = Default()
+
+
+class RatingHistoryWriter:
+    """Appends changed ratings to the Spanner history in periodic batches (Singleton).
+
+    `record` only notes the latest rating of each changed (study, model);
+    every `flush_interval` seconds, or on `flush`, the pending ratings are
+    inserted in one commit, so a burst of votes on the same models costs one
+    row per model. The vote log's Spanner sink flushes before it acknowledges
+    a batch of votes, so no vote is dropped from the log while its ratings
+    are only buffered here.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(RatingHistoryWriter, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+            return cls._instance
+
+    def _initialize(self):
+        self.flush_interval = config.RATING_HISTORY_FLUSH_INTERVAL
+        self._pending: dict[str, dict[str, float]] = {}
+        self._cond = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self._stats = {"recorded": 0, "rows": 0, "commits": 0, "failed": 0}
+        self.commit_latency = Histogram()
+        self._thread = threading.Thread(target=self._run, name="rating-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, study: str, ratings: dict[str, float]):
+        """Note new ratings for the given models of a study."""
+        with self._cond:
+            self._pending.setdefault(study, {}).update(ratings)
+            self._stats["recorded"] += len(ratings)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write pending ratings now and wait for them, or timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def close(self):
+        """Write pending ratings and stop the writer thread."""
+        if self._closed:
+            return
+        self.flush(timeout=self.flush_interval * 4)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def metrics(self) -> dict[str, Any]:
+        """Pending ratings, row and commit counts and commit latency."""
+        with self._cond:
+            pending = sum(len(models) for models in self._pending.values())
+        return {**self._stats, "pending": pending, "commit_latency": self.commit_latency.snapshot()}
+
+    def _run(self):
+        """Writer thread loop"""
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.flush_interval)
+                if self._closed:
+                    return
+                ratings, self._pending = self._pending, {}
+                self._writing = bool(ratings)
+            if ratings:
+                self._write(ratings)
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def _write(self, ratings: dict[str, dict[str, float]]):
+        """Insert one batch, retrying with exponential backoff"""
+        rows = sum(len(models) for models in ratings.values())
+        start = time.monotonic()
+        try:
+            for attempt in Retrying(
+                wait=wait_exponential(multiplier=1, min=1, max=8),
+                stop=stop_after_attempt(3),
+                reraise=True,
+            ):
+                with attempt:
+                    ArenaStudyTracker(
+                        project_id=config.PROJECT_ID,
+                        spanner_instance_id=config.SPANNER_INSTANCE_ID,
+                        spanner_database_id=config.SPANNER_DATABASE_ID,
+                    ).insert_ratings(ratings)
+        except Exception as e:
+            self._stats["failed"] += rows
+            log(f"Failed to update ELO ratings in Spanner: {e}", LogLevel.ERROR)
+            with self._cond:
+                # retry with the next batch, unless newer ratings have been recorded since
+                for study, models in ratings.items():
+                    self._pending[study] = {**models, **self._pending.get(study, {})}
+            return
+        finally:
+            self.commit_latency.observe(time.monotonic() - start)
+        self._stats["rows"] += rows
+        self._stats["commits"] += 1
+        log(f"ELO ratings of {rows} models updated in Spanner for {len(ratings)} studies.", LogLevel.ON)
+
+
+def _load_rating_history(study: str) -> pd.DataFrame:
+    """Downsampled rating trajectories from Spanner, as (model, time, rating) rows"""
+    try:
+        history = ArenaStudyTracker(
+            project_id=config.PROJECT_ID,
+            spanner_instance_id=config.SPANNER_INSTANCE_ID,
+            spanner_database_id=config.SPANNER_DATABASE_ID,
+        ).rating_history(study, points=config.RATING_HISTORY_POINTS)
+    except Exception as e:
+        log(f"Failed to read the rating history of study '{study}': {e}", LogLevel.ERROR)
+        history = {}
+    rows = [
+        (model, time_of_rating.timestamp(), rating)
+        for model, points in history.items()
+        for time_of_rating, rating in points
+    ]
+    return pd.DataFrame(rows, columns=["model", "time", "rating"])
+
+
+def get_rating_history(study: str) -> pd.DataFrame:
+    """Rating trajectories of a study's models, served from the shared leaderboard cache."""
+    return LeaderboardCache().get(study, _load_rating_history, kind="history")
@@ -0,0 +1,247 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Incremental ELO rating engine backed by Firestore transactions """
+
+import datetime
+import re
+import threading
+from typing import Any, Iterable, Optional
+
+from google.cloud import firestore
+
+from config.default import Default
+from config.firebase_config import FirebaseClient
+from utils.logger import LogLevel, log
+
+
+config = Default()
+db = FirebaseClient(database_id=config.IMAGE_FIREBASE_DB).get_client()
+
+DEFAULT_RATING = 1000
+ELO_SCALE = 400
+
+# (model1, model2, winner); a winner that is neither model leaves both ratings unchanged
+Matchup = tuple[str, str, str]
+
+
+def rating_doc_id(kind: str, study: str) -> str:
+    """Stable document ID for a study's ratings of a kind, e.g. "elo_rating"."""
+    return f"{kind}_" + re.sub(r"[^A-Za-z0-9_-]", "_", study)
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    """Expected score of a model against an opponent."""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / ELO_SCALE))
+
+
+def elo_update(
+    rating1: float, rating2: float, model1: str, model2: str, winner: str, k_factor: int = config.ELO_K_FACTOR
+) -> tuple[float, float]:
+    """New (model1, model2) ratings after one vote, rounded as they are stored."""
+    expected_model1 = expected_score(rating1, rating2)
+    expected_model2 = expected_score(rating2, rating1)
+    if winner == model1:
+        rating1 = rating1 + k_factor * (1 - expected_model1)
+        rating2 = rating2 + k_factor * (0 - expected_model2)
+    elif winner == model2:
+        rating1 = rating1 + k_factor * (0 - expected_model1)
+        rating2 = rating2 + k_factor * (1 - expected_model2)
+    return round(rating1, 2), round(rating2, 2)
+
+
+def replay(matchups: Iterable[Matchup], ratings: Optional[dict[str, float]] = None) -> dict[str, Any]:
+    """Apply votes in order, returning the resulting ratings, games and wins maps."""
+    state = {"ratings": dict(ratings or {}), "games": {}, "wins": {}}
+    for model1, model2, winner in matchups:
+        _apply(state, model1, model2, winner)
+    return state
+
+
+def _apply(state: dict[str, Any], model1: str, model2: str, winner: str) -> set[str]:
+    """Apply one vote to a ratings/games/wins state in place; returns the changed models."""
+    ratings = state["ratings"]
+    ratings[model1], ratings[model2] = elo_update(
+        ratings.get(model1, DEFAULT_RATING), ratings.get(model2, DEFAULT_RATING), model1, model2, winner
+    )
+    for model in (model1, model2):
+        state["games"][model] = state["games"].get(model, 0) + 1
+    if winner in (model1, model2):
+        state["wins"][winner] = state["wins"].get(winner, 0) + 1
+    return {model1, model2}
+
+
+class EloEngine:
+    """Keeps each study's ratings in memory and applies votes transactionally (Singleton).
+
+    Votes are applied inside a Firestore transaction that reads the study's
+    rating document and writes back only the fields of the models involved,
+    so concurrent votes from any number of workers are never lost. The
+    in-memory ratings are kept current by a snapshot listener.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(EloEngine, cls).__new__(cls)
+                instance._cache = {}
+                instance._doc_refs = {}
+                instance._watches = {}
+                instance._ready = {}
+                cls._instance = instance
+            return cls._instance
+
+    def _doc_ref(self, study: str) -> firestore.DocumentReference:
+        """The study's elo_rating document, creating a stable ID if there is none yet"""
+        doc_ref = self._doc_refs.get(study)
+        if doc_ref is None:
+            docs = (
+                db.collection(config.IMAGE_RATINGS_COLLECTION_NAME)
+                .where(filter=firestore.FieldFilter("study", "==", study))
+                .where(filter=firestore.FieldFilter("type", "==", "elo_rating"))
+                .limit(1)
+                .get()
+            )
+            if docs:
+                doc_ref = docs[0].reference
+            else:
+                doc_ref = db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document(rating_doc_id("elo_rating", study))
+            self._doc_refs[study] = doc_ref
+        return doc_ref
+
+    def _watch(self, study: str):
+        """Start the snapshot listener that keeps the study's cache current"""
+        with self._lock:
+            if study in self._watches:
+                return
+            ready = self._ready[study] = threading.Event()
+
+            def on_snapshot(doc_snapshots, changes, read_time):  # pylint: disable=unused-argument
+                for snapshot in doc_snapshots:
+                    self._store(study, snapshot.to_dict() if snapshot.exists else {})
+                if not doc_snapshots:
+                    self._store(study, {})
+                ready.set()
+
+            self._watches[study] = self._doc_ref(study).on_snapshot(on_snapshot)
+
+    def _store(self, study: str, doc: dict[str, Any]):
+        self._cache[study] = {
+            "ratings": dict(doc.get("ratings", {})),
+            "games": dict(doc.get("games", {})),
+            "wins": dict(doc.get("wins", {})),
+            "vote_count": doc.get("vote_count", 0),
+        }
+
+    def state(self, study: str) -> dict[str, Any]:
+        """Cached ratings, games and wins maps and vote count for a study."""
+        if study not in self._cache:
+            self._watch(study)
+            if not self._ready[study].wait(timeout=config.ELO_CACHE_TIMEOUT):
+                log(f"Timed out waiting for ratings of study {study}; reading directly.", LogLevel.WARNING)
+                snapshot = self._doc_ref(study).get()
+                self._store(study, snapshot.to_dict() if snapshot.exists else {})
+        return self._cache[study]
+
+    def ratings(self, study: str) -> dict[str, float]:
+        """Cached ratings for a study."""
+        return dict(self.state(study)["ratings"])
+
+    def apply_votes(self, study: str, matchups: list[Matchup]) -> dict[str, float]:
+        """Apply votes, in order, in one transaction and return the study's ratings after them."""
+        return self._commit(study, matchups)
+
+    def record_votes(self, study: str, votes: list[dict[str, Any]]) -> dict[str, float]:
+        """Store vote documents and apply them to the ratings in one transaction.
+
+        Each vote's "id" is its idempotency key: it becomes the vote document
+        ID, and votes whose document already exists are skipped, so replaying
+        a batch never counts a vote twice.
+        """
+        matchups = [(vote["model1"], vote["model2"], vote["winner"]) for vote in votes]
+        return self._commit(study, matchups, votes)
+
+    def _commit(
+        self, study: str, matchups: list[Matchup], votes: Optional[list[dict[str, Any]]] = None
+    ) -> dict[str, float]:
+        """Transactionally apply matchups (and store their vote documents, if given)"""
+        doc_ref = self._doc_ref(study)
+        vote_refs = [
+            db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document(vote["id"]) for vote in votes or []
+        ]
+        transaction = db.transaction(max_attempts=config.ELO_TRANSACTION_ATTEMPTS)
+
+        @firestore.transactional
+        def _apply_in_transaction(transaction: firestore.Transaction) -> dict[str, float]:
+            snapshot = doc_ref.get(transaction=transaction)
+            recorded = {s.id for s in transaction.get_all(vote_refs) if s.exists} if vote_refs else set()
+            doc = snapshot.to_dict() if snapshot.exists else {}
+            state = {key: dict(doc.get(key, {})) for key in ("ratings", "games", "wins")}
+            changed = set()
+            applied = 0
+            for idx, (model1, model2, winner) in enumerate(matchups):
+                if vote_refs and vote_refs[idx].id in recorded:
+                    continue
+                changed |= _apply(state, model1, model2, winner)
+                applied += 1
+                if vote_refs:
+                    record = {k: v for k, v in votes[idx].items() if k != "id"}
+                    transaction.set(vote_refs[idx], {"type": "vote", "study": study, **record})
+            if not applied:
+                return state["ratings"]
+
+            vote_count = doc.get("vote_count", 0) + applied
+            now = datetime.datetime.now()
+            if snapshot.exists:
+                # field-level update: only the models in these votes are written
+                updates: dict[str, Any] = {"timestamp": now, "vote_count": vote_count}
+                for model in changed:
+                    for key in ("ratings", "games", "wins"):
+                        if model in state[key]:
+                            updates[firestore.FieldPath(key, model).to_api_repr()] = state[key][model]
+                transaction.update(doc_ref, updates)
+            else:
+                transaction.set(
+                    doc_ref,
+                    {"study": study, "type": "elo_rating", "timestamp": now, "vote_count": vote_count, **state},
+                )
+            return state["ratings"]
+
+        ratings = _apply_in_transaction(transaction)
+        if study in self._cache:
+            # the snapshot listener will confirm shortly; serve the committed ratings now
+            self._cache[study]["ratings"].update(ratings)
+        return ratings
+
+    def apply_vote(self, study: str, model1: str, model2: str, winner: str) -> dict[str, float]:
+        """Apply one vote and return the study's ratings after it."""
+        return self.apply_votes(study, [(model1, model2, winner)])
+
+    def recompute(self, study: str, matchups: Iterable[Matchup]) -> dict[str, float]:
+        """Replace the study's ratings with a replay of the given votes, in order."""
+        state = replay(matchups)
+        vote_count = sum(state["games"].values()) // 2
+        self._doc_ref(study).set(
+            {
+                "study": study,
+                "type": "elo_rating",
+                "timestamp": datetime.datetime.now(),
+                "vote_count": vote_count,
+                **state,
+            }
+        )
+        log(f"Recomputed ELO ratings for study '{study}' from {vote_count} votes.")
+        return state["ratings"]
@@ -0,0 +1,155 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Data that pages render, loaded once and memoised, with a tracer for the backend calls of each render
+
+Mesop runs a page function again on every event, so pages read their data
+through `@loader` functions instead of querying backends directly:
+
+    @loader("settings")
+    def studies() -> dict[str, dict]:
+        ...
+
+A loader's result is kept per (page, loader, arguments) until its TTL ends
+or it is invalidated with `invalidate(page, study)`. Data that already has
+its own cache, such as the LeaderboardCache tables, is read directly: a
+second layer would expire on its own schedule and show stale data. Functions that make a
+network call report it with `backend_call(name)`; main.py wraps each page
+render in `render_trace(page)`, which counts them. A render's trace lives in
+a context variable, which pool threads do not inherit: work a render hands
+to a thread pool is submitted as `traced(fn)` so its calls count as well.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import functools
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from config.default import Default
+from utils.logger import log
+
+
+config = Default()
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("render_trace", default=None)
+
+
+def backend_call(name: str):
+    """Count a network call against the page render in progress, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace[name] += 1
+
+
+def traced(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """`fn`, run in a copy of the caller's context, so its backend calls on a pool thread count against the caller's render."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class RenderData:
+    """Memoised loader results, and per-page render traces (Singleton)"""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(RenderData, cls).__new__(cls)
+                instance._values = {}
+                instance._loading = {}
+                instance._stats = {"hits": 0, "loads": 0, "invalidations": 0}
+                instance._renders = {}
+                cls._instance = instance
+            return cls._instance
+
+    def get(self, key: tuple, load: Callable[[], Any], ttl: float) -> Any:
+        """The memoised value for a key, loading it (once, across threads) if missing or expired"""
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and cached[0] > time.time():
+                self._stats["hits"] += 1
+                return cached[1]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                cached = self._values.get(key)
+                if cached is not None and cached[0] > time.time():
+                    self._stats["hits"] += 1
+                    return cached[1]
+            value = load()
+            with self._lock:
+                self._values[key] = (time.time() + ttl, value)
+                self._stats["loads"] += 1
+            return value
+
+    def invalidate(self, page: Optional[str] = None, study: Optional[str] = None):
+        """Drop memoised values of a page (default: every page), for one study (default: every study)."""
+        with self._lock:
+            for key in list(self._values):
+                if (page is None or key[0] == page) and (study is None or key[2][:1] == (study,)):
+                    del self._values[key]
+                    self._stats["invalidations"] += 1
+
+    def record_render(self, page: str, calls: Counter):
+        with self._lock:
+            stats = self._renders.setdefault(page, {"renders": 0, "quiet_renders": 0, "backend_calls": 0, "last": {}})
+            stats["renders"] += 1
+            stats["quiet_renders"] += not calls
+            stats["backend_calls"] += sum(calls.values())
+            stats["last"] = dict(calls)
+
+    def metrics(self) -> dict[str, Any]:
+        """Loader hit and load counts, and per page: renders, renders without backend calls, and the last render's calls."""
+        with self._lock:
+            return {
+                **self._stats,
+                "values": len(self._values),
+                "pages": {page: {**stats, "last": dict(stats["last"])} for page, stats in self._renders.items()},
+            }
+
+
+def loader(page: str, ttl: Optional[float] = None):
+    """Memoise a page's data loader; its first argument, if any, is the study."""
+
+    def decorator(load: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(load)
+        def wrapper(*args):
+            key = (page, load.__name__, args)
+            return RenderData().get(key, lambda: load(*args), config.RENDER_DATA_TTL if ttl is None else ttl)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(page: Optional[str] = None, study: Optional[str] = None):
+    """Drop memoised loader results; see RenderData.invalidate."""
+    RenderData().invalidate(page, study)
+
+
+@contextmanager
+def render_trace(page: str) -> Iterator[Counter]:
+    """Count the backend calls made while rendering a page."""
+    calls = Counter()
+    token = _current_trace.set(calls)
+    try:
+        yield calls
+    finally:
+        _current_trace.reset(token)
+        RenderData().record_render(page, calls)
+        if calls:
+            log(f"[render] {page}: {sum(calls.values())} backend calls {dict(calls)}")
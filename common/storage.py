@@ -12,13 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import base64
-from functools import lru_cache
+import binascii
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import glob
+import io
+import os
+import re
+import threading
+import time
+from typing import Any, Optional, TypedDict
 
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import aiplatform
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
 import vertexai
 
+from common.render_data import backend_call
 from config.default import Default
 
 
@@ -28,36 +41,312 @@ vertexai.init(project=cfg.PROJECT_ID, location=cfg.LOCATION)
 aiplatform.init(project=cfg.PROJECT_ID, location=cfg.LOCATION)
 
 
+class StorageSession:
+    """Process-wide GCS client and bucket handles (Singleton).
+
+    The client is given its own AuthorizedSession, whose HTTP connection
+    pool is sized for concurrent uploads, and bucket handles are created
+    with `client.bucket`, which does not fetch bucket metadata.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(StorageSession, cls).__new__(cls)
+                credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+                http = AuthorizedSession(credentials)
+                http.mount("https://", HTTPAdapter(pool_connections=cfg.GCS_POOL_SIZE, pool_maxsize=cfg.GCS_POOL_SIZE))
+                instance.client = storage.Client(project=cfg.PROJECT_ID, credentials=credentials, _http=http)
+                instance._buckets = {}
+                cls._instance = instance
+                print(f"[StorageSession] - GCS client created with a pool of {cfg.GCS_POOL_SIZE} connections")
+            return cls._instance
+
+    def bucket(self, bucket_name: str) -> storage.Bucket:
+        """Cached bucket handle, no metadata round-trip"""
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self._buckets.setdefault(bucket_name, self.client.bucket(bucket_name))
+        return bucket
+
+    def blob(self, gs_uri: str, generation: Optional[int] = None) -> storage.Blob:
+        """Blob handle for a gs:// URI, optionally pinned to a generation"""
+        bucket, blob = gs_uri[5:].split("/", maxsplit=1)
+        return self.bucket(bucket).blob(blob, generation=generation)
+
+
+class GCSWorkers:
+    """The thread pool for bulk GCS operations, shared by every request in the process (Singleton).
+
+    Concurrent calls queue on its GCS_MAX_WORKERS threads rather than each
+    starting a pool of their own, so GCS threads stay bounded under load and
+    no call pays for thread start-up.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(GCSWorkers, cls).__new__(cls)
+                instance.executor = ThreadPoolExecutor(max_workers=cfg.GCS_MAX_WORKERS, thread_name_prefix="gcs")
+                cls._instance = instance
+            return cls._instance
+
+
+# base64 input is decoded this many characters at a time (a multiple of 4)
+_DECODE_CHUNK = 1024 * 1024
+# resumable uploads send chunks of this size (a multiple of 256 KiB)
+_UPLOAD_CHUNK = 8 * 256 * 1024
+
+
+class ImageSink:
+    """Buffers one object's bytes and uploads them to GCS without extra copies.
+
+    Base64 input is decoded a chunk at a time straight into the buffer, so a
+    second full-size bytes object is never built, and the buffer itself is
+    handed to the upload. Objects larger than GCS_RESUMABLE_THRESHOLD are
+    streamed with a resumable upload.
+    """
+
+    def __init__(self, folder: str, file_name: str, mime_type: str):
+        self.blob_name = f"{folder}/{file_name}"
+        self.mime_type = mime_type
+        self._buffer = io.BytesIO()
+
+    def write(self, contents: bytes | str) -> "ImageSink":
+        """Append raw contents; str is encoded as UTF-8"""
+        self._buffer.write(contents.encode("utf-8") if isinstance(contents, str) else contents)
+        return self
+
+    def write_base64(self, contents: str | bytes) -> "ImageSink":
+        """Append base64 encoded contents, decoding as it goes"""
+        for start in range(0, len(contents), _DECODE_CHUNK):
+            self._buffer.write(binascii.a2b_base64(contents[start:start + _DECODE_CHUNK]))
+        return self
+
+    @property
+    def size(self) -> int:
+        return self._buffer.getbuffer().nbytes
+
+    def upload(self) -> str:
+        """Upload the buffer, returning "bucket/path", and release it"""
+        bucket = StorageSession().bucket(cfg.GENMEDIA_BUCKET)
+        size = self.size
+        blob = bucket.blob(
+            self.blob_name,
+            chunk_size=_UPLOAD_CHUNK if size > cfg.GCS_RESUMABLE_THRESHOLD else None,
+        )
+        self._buffer.seek(0)
+        try:
+            blob.upload_from_file(self._buffer, size=size, content_type=self.mime_type)
+        finally:
+            self._buffer.close()
+        return f"{cfg.GENMEDIA_BUCKET}/{self.blob_name}"
+
+
+class GCSObject(TypedDict):
+    """Contents to store with store_many_to_gcs"""
+
+    folder: str
+    file_name: str
+    mime_type: str
+    contents: str | bytes
+
+
 def store_to_gcs(
     folder: str, file_name: str, mime_type: str, contents: str, decode: bool = False
 ):
     """store contents to GCS"""
-    client = storage.Client(project=cfg.PROJECT_ID)
-    bucket = client.get_bucket(cfg.GENMEDIA_BUCKET)
-    destination_blob_name = f"{folder}/{file_name}"
-    blob = bucket.blob(destination_blob_name)
+    sink = ImageSink(folder, file_name, mime_type)
     if decode:
-        contents_bytes = base64.b64decode(contents)
-        blob.upload_from_string(contents_bytes, content_type=mime_type)
+        sink.write_base64(contents)
     else:
-        blob.upload_from_string(contents, content_type=mime_type)
-    return f"{cfg.GENMEDIA_BUCKET}/{destination_blob_name}"
+        sink.write(contents)
+    return sink.upload()
+
+
+def store_many_to_gcs(objects: list[GCSObject], decode: bool = False) -> list[Optional[str]]:
+    """Store several objects to GCS concurrently, on the shared GCSWorkers pool and the pooled client.
+
+    Each object is decoded and uploaded by its own worker, so only the
+    objects currently uploading are held as decoded bytes; `objects` is not
+    modified. Returns the "bucket/path" of each object, in order, or None
+    for failed uploads.
+    """
+    def _store(obj: GCSObject) -> Optional[str]:
+        try:
+            return store_to_gcs(obj["folder"], obj["file_name"], obj["mime_type"], obj["contents"], decode=decode)
+        except Exception as e:
+            print(f"Error uploading {obj['folder']}/{obj['file_name']}: {e}")
+            return None
+
+    if len(objects) == 1:  # the common case needs no thread hand-off
+        return [_store(objects[0])]
+    return list(GCSWorkers().executor.map(_store, objects))
+
+
+@dataclass
+class _CachedBlob:
+    data: bytes
+    generation: int
+    checked_at: float
+
+
+class BlobCache:
+    """Downloaded GCS objects, bounded in bytes and revalidated (Singleton).
+
+    Objects are kept in memory in LRU order up to BLOB_CACHE_BYTES. Once an
+    object is BLOB_CACHE_TTL seconds old, the next read fetches its metadata
+    and downloads it again only if its generation changed. With
+    BLOB_CACHE_DIR set, downloads are also written to disk under their
+    generation, so other workers on the host, and restarts, read them from
+    disk after the metadata check. Concurrent misses for one object share a
+    single download.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(BlobCache, cls).__new__(cls)
+                instance._entries = OrderedDict()
+                instance._inflight = {}
+                instance._bytes = 0
+                instance._stats = {"hits": 0, "revalidations": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+                if cfg.BLOB_CACHE_DIR:
+                    os.makedirs(cfg.BLOB_CACHE_DIR, exist_ok=True)
+                cls._instance = instance
+            return cls._instance
 
-@lru_cache()
-def download_gcs_blob(gs_uri: str) -> bytes:
-    gcs_client: storage.Client = storage.Client(project=cfg.PROJECT_ID)
-    bucket, blob = gs_uri[5:].split("/", maxsplit=1)
-    blob = gcs_client.bucket(bucket).blob(blob)
-    blob_content = blob.download_as_bytes()
-    return blob_content
+    def get(self, gs_uri: str, generation: Optional[int] = None) -> bytes:
+        """The object's bytes; pass its `generation` when already known to skip the metadata check."""
+        with self._lock:
+            entry = self._entries.get(gs_uri)
+            if entry is not None and (
+                entry.generation == generation
+                or (generation is None and time.time() - entry.checked_at < cfg.BLOB_CACHE_TTL)
+            ):
+                self._entries.move_to_end(gs_uri)
+                self._stats["hits"] += 1
+                return entry.data
+            future = self._inflight.get(gs_uri)
+            leader = future is None
+            if leader:
+                future = self._inflight[gs_uri] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(self._fetch(gs_uri, entry, generation))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[gs_uri]
+        return future.result()
+
+    def invalidate(self, gs_uri: str):
+        """Forget an object, e.g. after overwriting it."""
+        with self._lock:
+            entry = self._entries.pop(gs_uri, None)
+            if entry is not None:
+                self._bytes -= len(entry.data)
+
+    def metrics(self) -> dict[str, Any]:
+        """Hit, revalidation, disk hit and miss counts, and the memory in use."""
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
+
+    def _fetch(self, gs_uri: str, entry: Optional[_CachedBlob], generation: Optional[int]) -> bytes:
+        """Revalidate the cached copy, or read the current generation from disk or GCS"""
+        backend_call("gcs.blob")
+        blob = StorageSession().blob(gs_uri, generation=generation)
+        if generation is None:
+            blob.reload()
+            generation = blob.generation
+        if entry is not None and entry.generation == generation:
+            outcome, data = "revalidations", entry.data
+        else:
+            data = self._read_disk(gs_uri, generation)
+            if data is not None:
+                outcome = "disk_hits"
+            else:
+                outcome = "misses"
+                data = blob.download_as_bytes()
+                self._write_disk(gs_uri, generation, data)
+        with self._lock:
+            self._stats[outcome] += 1
+        self._store(gs_uri, _CachedBlob(data, generation, time.time()))
+        return data
+
+    def _store(self, gs_uri: str, entry: _CachedBlob):
+        with self._lock:
+            old = self._entries.pop(gs_uri, None)
+            if old is not None:
+                self._bytes -= len(old.data)
+            if len(entry.data) > cfg.BLOB_CACHE_BYTES:
+                return  # too large to hold; served from disk or GCS each time
+            self._entries[gs_uri] = entry
+            self._bytes += len(entry.data)
+            while self._bytes > cfg.BLOB_CACHE_BYTES:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.data)
+                self._stats["evictions"] += 1
+
+    @staticmethod
+    def _disk_path(gs_uri: str, generation: Any) -> str:
+        return os.path.join(cfg.BLOB_CACHE_DIR, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', gs_uri[5:])}.{generation}")
+
+    def _read_disk(self, gs_uri: str, generation: int) -> Optional[bytes]:
+        if not cfg.BLOB_CACHE_DIR:
+            return None
+        try:
+            with open(self._disk_path(gs_uri, generation), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, gs_uri: str, generation: int, data: bytes):
+        """Write the generation atomically, and remove the object's older generations"""
+        if not cfg.BLOB_CACHE_DIR:
+            return
+        path = self._disk_path(gs_uri, generation)
+        try:
+            prefix = self._disk_path(gs_uri, "")
+            for old_path in glob.glob(glob.escape(prefix) + "*"):
+                if old_path != path and old_path[len(prefix) :].isdigit():
+                    os.remove(old_path)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[BlobCache] - could not write {gs_uri} to disk: {e}")
+
+
+def download_gcs_blob(gs_uri: str, generation: Optional[int] = None) -> bytes:
+    """The bytes of a GCS object, through the BlobCache"""
+    return BlobCache().get(gs_uri, generation)
 
 def check_gcs_blob_exists(gcs_blob_uri: str) -> bool:
     """Check if a GCS blob exists."""
     try:
-        gcs_client: storage.Client = storage.Client(project=cfg.PROJECT_ID)
-        bucket, blob = gcs_blob_uri[5:].split("/", maxsplit=1)
-        blob = gcs_client.bucket(bucket).blob(blob)
-        return blob.exists()
+        return StorageSession().blob(gcs_blob_uri).exists()
     except Exception as e:
         print(f"Error checking existence of {gcs_blob_uri}: {e}")
         return False
+
+
+def exists_many(gcs_blob_uris: list[str]) -> dict[str, bool]:
+    """Check which GCS blobs exist, concurrently on the shared GCSWorkers pool and the pooled client."""
+    unique_uris = list(dict.fromkeys(gcs_blob_uris))
+    return dict(zip(unique_uris, GCSWorkers().executor.map(check_gcs_blob_exists, unique_uris)))
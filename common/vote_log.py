@@ -0,0 +1,245 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Durable local vote log, drained to the cloud stores in the background """
+
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from config.default import Default
+from utils.logger import LogLevel, log
+from utils.metrics import Histogram
+
+
+config = Default()
+
+# receives a batch of vote records, each with its idempotency key as "id"; raises on failure
+VoteSink = Callable[[list[dict[str, Any]]], None]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS votes (
+    id TEXT PRIMARY KEY,
+    study TEXT NOT NULL,
+    record TEXT NOT NULL,
+    pending TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class VoteLog:
+    """Append-only SQLite (WAL) log of votes with a background drainer (Singleton).
+
+    `append` returns once the vote is fsynced to local disk. The drainer
+    then hands votes, in order and in batches, to each registered sink in
+    turn; a vote is deleted once every sink has accepted it. Workers sharing
+    the log claim batches with a lease, so votes left behind by a crashed
+    worker are replayed once the lease expires. Sinks must be idempotent on
+    the vote's "id", since a vote can be delivered more than once.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(VoteLog, cls).__new__(cls)
+                instance._initialize()
+                cls._instance = instance
+            return cls._instance
+
+    def _initialize(self):
+        self.path = config.VOTE_LOG_PATH
+        self.batch_size = config.VOTE_DRAIN_BATCH_SIZE
+        self.interval = config.VOTE_DRAIN_INTERVAL
+        self.lease = config.VOTE_DRAIN_LEASE
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        self._connect().execute(_SCHEMA)
+        self._sinks: dict[str, VoteSink] = {}
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"appended": 0, "drained": 0, "failed_batches": 0}
+        self.append_latency = Histogram()
+        self.drain_latency = Histogram()
+
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection to the log"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; transactions are opened explicitly
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # fsync the WAL on every commit
+            self._local.conn = conn
+        return conn
+
+    def register_sink(self, name: str, sink: VoteSink):
+        """Add a destination for votes; sinks receive each vote in registration order."""
+        if "," in name:
+            raise ValueError(f"Invalid sink name: {name}")
+        self._sinks[name] = sink
+
+    def start(self):
+        """Start the drainer, which also replays votes left over from a previous run."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="vote-log-drainer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def append(self, study: str, record: dict[str, Any]) -> str:
+        """Durably log a vote, returning its idempotency key."""
+        if not self._sinks:
+            raise RuntimeError("No vote sinks are registered.")
+        vote_id = uuid.uuid4().hex
+        start = time.monotonic()
+        self._connect().execute(
+            "INSERT INTO votes (id, study, record, pending, created_at) VALUES (?, ?, ?, ?, ?)",
+            (vote_id, study, json.dumps(record), ",".join(self._sinks), time.time()),
+        )
+        self.append_latency.observe(time.monotonic() - start)
+        self._stats["appended"] += 1
+        self._wake.set()
+        return vote_id
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Deliver logged votes until none are left, or timeout.
+
+        Batches leased by other workers are left to them until their lease expires.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            if self._drain_once() is not True:
+                time.sleep(self.interval)
+        return True
+
+    def pending(self) -> int:
+        """Number of votes not yet delivered to every sink."""
+        return self._connect().execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+
+    def close(self):
+        """Stop the drainer after a last, bounded attempt to deliver what is logged."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 5)
+        if not self.drain(timeout=config.VOTE_DRAIN_INTERVAL * 10):
+            log(f"Vote log closed with {self.pending()} undelivered votes in {self.path}.", LogLevel.WARNING)
+
+    def metrics(self) -> dict[str, Any]:
+        """Backlog, delivery counts and latencies."""
+        oldest = self._connect().execute("SELECT MIN(created_at) FROM votes").fetchone()[0]
+        return {
+            **self._stats,
+            "pending": self.pending(),
+            "oldest_age": time.time() - oldest if oldest else 0.0,
+            "append_latency": self.append_latency.snapshot(),
+            "drain_latency": self.drain_latency.snapshot(),
+        }
+
+    def _run(self):
+        """Drainer thread loop"""
+        backoff = self.interval
+        while not self._closed:
+            self._wake.wait(timeout=backoff)
+            self._wake.clear()
+            try:
+                delivered = True
+                while not self._closed and delivered:
+                    delivered = self._drain_once()
+                # back off while a sink is failing
+                backoff = self.interval if delivered is not False else min(backoff * 2, self.lease)
+            except Exception as e:
+                log(f"Vote log drainer error: {e}", LogLevel.ERROR)
+                backoff = min(backoff * 2, self.lease)
+
+    def _claim(self) -> list[tuple[str, str, str, str]]:
+        """Lease the oldest batch of votes that is unclaimed, expired or already this worker's"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, study, record, pending FROM votes"
+                " WHERE claimed_at IS NULL OR claimed_at < ? OR claimed_by = ?"
+                " ORDER BY rowid LIMIT ?",
+                (now - self.lease, self._owner, self.batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE votes SET claimed_by = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(self._owner, now, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _drain_once(self) -> Optional[bool]:
+        """Deliver one batch; returns whether it was fully delivered, or None if there was none"""
+        rows = self._claim()
+        if not rows:
+            return None
+        start = time.monotonic()
+        pending = {vote_id: [name for name in sinks.split(",") if name] for vote_id, _, _, sinks in rows}
+        votes = {vote_id: {"id": vote_id, "study": study, **json.loads(record)} for vote_id, study, record, _ in rows}
+        delivered = True
+        for name, sink in self._sinks.items():
+            # a sink only sees votes the sinks before it have accepted
+            batch = [vote_id for vote_id in votes if pending[vote_id][:1] == [name]]
+            if not batch:
+                continue
+            try:
+                sink([votes[vote_id] for vote_id in batch])
+            except Exception as e:
+                log(f"Failed to deliver {len(batch)} votes to {name}: {e}", LogLevel.ERROR)
+                self._stats["failed_batches"] += 1
+                delivered = False
+                break
+            for vote_id in batch:
+                pending[vote_id].pop(0)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = [(vote_id,) for vote_id, sinks in pending.items() if not sinks]
+            conn.executemany("DELETE FROM votes WHERE id = ?", done)
+            conn.executemany(
+                "UPDATE votes SET pending = ?, claimed_by = NULL, claimed_at = NULL WHERE id = ?",
+                [(",".join(sinks), vote_id) for vote_id, sinks in pending.items() if sinks],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.drain_latency.observe(time.monotonic() - start)
+        self._stats["drained"] += len(done)
+        return delivered
@@ -0,0 +1,91 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Pre-generated welcome messages, so no page waits on Gemini """
+
+from collections import deque
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from config.default import Default
+from models.gemini_model import generate_content
+from utils.logger import LogLevel, log
+
+
+config = Default()
+
+WELCOME_PROMPT = """
+Welcome the user to the battle of the generative media images, and encourage participation by asserting their voting on the images presented.
+This should be one or two sentences.
+"""
+DEFAULT_WELCOME = "Welcome to Arena!"
+
+_RETRY_DELAY = 30  # seconds after a failed or empty generation
+
+
+class WelcomeMessages:
+    """A pool of welcome messages, generated in the background (Singleton).
+
+    A background thread fills the pool to WELCOME_POOL_SIZE messages and then
+    replaces the oldest one every WELCOME_REFRESH_INTERVAL seconds. `get`
+    returns immediately: a pooled message, or DEFAULT_WELCOME while the pool
+    is still empty.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(WelcomeMessages, cls).__new__(cls)
+                instance._pool = deque(maxlen=max(config.WELCOME_POOL_SIZE, 1))
+                instance._stats = {"generated": 0, "failed": 0, "served": 0, "defaults": 0}
+                if config.WELCOME_POOL_SIZE > 0:
+                    threading.Thread(target=instance._run, name="welcome-messages", daemon=True).start()
+                cls._instance = instance
+            return cls._instance
+
+    def get(self, current: Optional[str] = None) -> str:
+        """A welcome message, different from `current` when the pool allows."""
+        with self._lock:
+            choices = [message for message in self._pool if message != current] or list(self._pool)
+            self._stats["served" if choices else "defaults"] += 1
+        return random.choice(choices) if choices else DEFAULT_WELCOME
+
+    def metrics(self) -> dict[str, Any]:
+        """Pool size, and messages generated and served."""
+        with self._lock:
+            return {**self._stats, "pooled": len(self._pool)}
+
+    def _run(self):
+        """Refill and refresh the pool"""
+        while True:
+            try:
+                message = generate_content(WELCOME_PROMPT).strip()
+                if not message:
+                    raise ValueError("Gemini returned an empty message")
+            except Exception as e:
+                with self._lock:
+                    self._stats["failed"] += 1
+                log(f"Could not generate a welcome message: {e}", LogLevel.WARNING)
+                time.sleep(_RETRY_DELAY)
+                continue
+            with self._lock:
+                self._pool.append(message)  # drops the oldest once full
+                self._stats["generated"] += 1
+                full = len(self._pool) == self._pool.maxlen
+            if full:
+                time.sleep(config.WELCOME_REFRESH_INTERVAL)
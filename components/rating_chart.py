@@ -0,0 +1,84 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mesop as me
+""" Rating history chart mesop component """
+import base64
+import datetime
+import html
+
+import mesop as me
+import pandas as pd
+
+
+_COLORS = ["#4285f4", "#db4437", "#f4b400", "#0f9d58", "#ab47bc", "#00acc1", "#ff7043", "#9e9d24"]
+_MARGIN = {"left": 48, "right": 200, "top": 16, "bottom": 28}
+
+
+def _svg(history: pd.DataFrame, width: int, height: int) -> str:
+    """Line chart of rating over time, one line per model"""
+    t_min, t_max = history["time"].min(), history["time"].max()
+    r_min, r_max = history["rating"].min(), history["rating"].max()
+    t_span = (t_max - t_min) or 1
+    r_min, r_max = r_min - 10, r_max + 10
+    plot_w = width - _MARGIN["left"] - _MARGIN["right"]
+    plot_h = height - _MARGIN["top"] - _MARGIN["bottom"]
+
+    def x(t: float) -> float:
+        return _MARGIN["left"] + (t - t_min) / t_span * plot_w
+
+    def y(rating: float) -> float:
+        return _MARGIN["top"] + (r_max - rating) / (r_max - r_min) * plot_h
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="11">'
+    ]
+    for rating in (r_min, (r_min + r_max) / 2, r_max):
+        parts.append(
+            f'<line x1="{_MARGIN["left"]}" x2="{_MARGIN["left"] + plot_w}" y1="{y(rating):.1f}" y2="{y(rating):.1f}" '
+            f'stroke="#ddd"/><text x="{_MARGIN["left"] - 4}" y="{y(rating) + 4:.1f}" text-anchor="end" '
+            f'fill="#666">{rating:.0f}</text>'
+        )
+    for t, anchor in ((t_min, "start"), (t_max, "end")):
+        label = datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M")
+        parts.append(f'<text x="{x(t):.1f}" y="{height - 8}" text-anchor="{anchor}" fill="#666">{label}</text>')
+
+    final = history.sort_values("time").groupby("model")["rating"].last().sort_values(ascending=False)
+    for idx, model in enumerate(final.index):
+        color = _COLORS[idx % len(_COLORS)]
+        series = history[history["model"] == model].sort_values("time")
+        points = " ".join(f"{x(t):.1f},{y(r):.1f}" for t, r in zip(series["time"], series["rating"]))
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="2" points="{points}"/>')
+        legend_y = _MARGIN["top"] + 8 + idx * 16
+        parts.append(
+            f'<rect x="{width - _MARGIN["right"] + 12}" y="{legend_y - 8}" width="10" height="10" fill="{color}"/>'
+            f'<text x="{width - _MARGIN["right"] + 28}" y="{legend_y + 1}">{html.escape(model)} '
+            f'({final[model]:.0f})</text>'
+        )
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+@me.component
+def rating_chart(history: pd.DataFrame, width: int = 720, height: int = 320):
+    """Rating history chart; `history` has model, time (epoch seconds) and rating columns"""
+    if history.empty:
+        me.text("No rating history yet.")
+        return
+    svg = _svg(history, width, height)
+    me.image(
+        src="data:image/svg+xml;base64," + base64.b64encode(svg.encode("utf-8")).decode("ascii"),
+        alt="Rating history",
+        style=me.Style(width="100%", max_width=width),
+    )
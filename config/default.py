@@ -36,16 +36,86 @@ class Default:
     INIT_VERTEX: bool = os.environ.get("INIT_VERTEX", "True").lower() in ("true", "1")
 
     GENMEDIA_BUCKET: str = os.environ.get("GENMEDIA_BUCKET")
+    GCS_POOL_SIZE: int = int(os.environ.get("GCS_POOL_SIZE", 32))  # HTTP connections per process
+    GCS_MAX_WORKERS: int = int(os.environ.get("GCS_MAX_WORKERS", 8))  # threads for bulk GCS operations
+    GCS_RESUMABLE_THRESHOLD: int = int(os.environ.get("GCS_RESUMABLE_THRESHOLD", 8 * 1024 * 1024))  # bytes
+    BLOB_CACHE_BYTES: int = int(os.environ.get("BLOB_CACHE_BYTES", 64 * 1024 * 1024))  # downloaded objects held in memory
+    BLOB_CACHE_TTL: float = float(os.environ.get("BLOB_CACHE_TTL", 60))  # seconds before a generation check
+    BLOB_CACHE_DIR: str = os.environ.get("BLOB_CACHE_DIR", "/tmp/arena/blobs")  # disk tier; empty to disable
     PUBLIC_BUCKET: bool = os.environ.get("PUBLIC_BUCKET", "False").lower() in ("true", "1")
-    SHOW_RESULTS_PAUSE_TIME: int = int(os.environ.get("SHOW_RESULTS_PAUSE_TIME", "1"))
     IMAGE_FIREBASE_DB: str = os.environ.get("IMAGE_FIREBASE_DB")
     IMAGE_COLLECTION_NAME = os.environ.get("IMAGE_COLLECTION_NAME")
     STUDY_COLLECTION_NAME: str = os.environ.get("STUDY_COLLECTION_NAME", "arena_study")
     IMAGE_RATINGS_COLLECTION_NAME: str = os.environ.get("IMAGE_RATINGS_COLLECTION_NAME", "arena_elo")
     STABLE_DIFFUSION_DB_PROMPTS: str = os.environ.get("STABLE_DIFFUSION_DB_PROMPTS", "prompts/stable_diffusion_prompts.json")
     DEFAULT_PROMPTS: str = os.environ.get("DEFAULT_PROMPTS", "prompts/imagen_prompts.json")
+    PROMPT_CACHE_SIZE: int = int(os.environ.get("PROMPT_CACHE_SIZE", 8))  # prompt lists held per process
+    PROMPT_REVALIDATE_INTERVAL: float = float(os.environ.get("PROMPT_REVALIDATE_INTERVAL", 60))  # seconds
+    PROMPT_PACK_DIR: str = os.environ.get("PROMPT_PACK_DIR", "/tmp/arena/prompt_packs")  # local copies of .ppk packs
     DEFAULT_STUDY_NAME: str = os.environ.get("DEFAULT_STUDY_NAME", "live")
     ELO_K_FACTOR: int = int(os.environ.get("ELO_K_FACTOR", 32))
+    ELO_TRANSACTION_ATTEMPTS: int = int(os.environ.get("ELO_TRANSACTION_ATTEMPTS", 20))  # retries under contention
+    ELO_CACHE_TIMEOUT: float = float(os.environ.get("ELO_CACHE_TIMEOUT", 5))  # seconds to wait for the first snapshot
+    # leaderboard ratings: "elo" (live) or "bradley_terry" (stored by scripts/recompute_ratings.py)
+    RATING_METHOD: str = os.environ.get("RATING_METHOD", "elo")
+    LEADERBOARD_CACHE_TTL: float = float(os.environ.get("LEADERBOARD_CACHE_TTL", 15))  # seconds
+    RENDER_DATA_TTL: float = float(os.environ.get("RENDER_DATA_TTL", 10))  # seconds a page's loaded data is reused
+    LEADERBOARD_CACHE_DIR: str = os.environ.get("LEADERBOARD_CACHE_DIR", "/tmp/arena/leaderboard")  # shared by workers
+    VOTE_FEED_PAGE_SIZE: int = int(os.environ.get("VOTE_FEED_PAGE_SIZE", 10))  # votes per history page
+    VOTE_FEED_TTL: float = float(os.environ.get("VOTE_FEED_TTL", 15))  # seconds before the newest page is re-read
+    VOTE_FEED_CACHE_PAGES: int = int(os.environ.get("VOTE_FEED_CACHE_PAGES", 500))
+
+    # durable vote log, drained to Firestore and Spanner in the background
+    VOTE_LOG_PATH: str = os.environ.get("VOTE_LOG_PATH", "/tmp/arena/votes.sqlite3")
+    VOTE_DRAIN_BATCH_SIZE: int = int(os.environ.get("VOTE_DRAIN_BATCH_SIZE", 100))
+    VOTE_DRAIN_INTERVAL: float = float(os.environ.get("VOTE_DRAIN_INTERVAL", 1))  # seconds
+    VOTE_DRAIN_LEASE: float = float(os.environ.get("VOTE_DRAIN_LEASE", 30))  # seconds before a claimed batch is retried
+
+    # image metadata writes
+    METADATA_BATCH_SIZE: int = int(os.environ.get("METADATA_BATCH_SIZE", 100))
+    METADATA_FLUSH_INTERVAL: float = float(os.environ.get("METADATA_FLUSH_INTERVAL", 2))  # seconds
+    METADATA_MAX_RETRIES: int = int(os.environ.get("METADATA_MAX_RETRIES", 5))
+    METADATA_SPILL_PATH: str = os.environ.get("METADATA_SPILL_PATH", "/tmp/arena/metadata_spill.jsonl")  # unwritten at exit
+
+    # in-memory catalog of each study's images, used instead of per-battle queries
+    IMAGE_CATALOG_ENABLED: bool = os.environ.get("IMAGE_CATALOG_ENABLED", "True").lower() in ("true", "1")
+    IMAGE_CATALOG_LOAD_TIMEOUT: float = float(os.environ.get("IMAGE_CATALOG_LOAD_TIMEOUT", 10))  # seconds
+
+    # smaller WebP variants of generated images, served instead of the originals
+    VARIANTS_ENABLED: bool = os.environ.get("VARIANTS_ENABLED", "True").lower() in ("true", "1")
+    VARIANT_QUALITY: int = int(os.environ.get("VARIANT_QUALITY", 80))  # WebP quality, 0-100
+    VARIANT_WORKERS: int = int(os.environ.get("VARIANT_WORKERS", 2))
+    VARIANT_INDEX_SIZE: int = int(os.environ.get("VARIANT_INDEX_SIZE", 10000))  # images whose variants are remembered
+    VARIANT_LOOKUP_TTL: float = float(os.environ.get("VARIANT_LOOKUP_TTL", 60))  # seconds before an image without variants is looked up again
+
+    # welcome messages, pre-generated with Gemini
+    WELCOME_POOL_SIZE: int = int(os.environ.get("WELCOME_POOL_SIZE", 5))  # 0 to always show the default
+    WELCOME_REFRESH_INTERVAL: float = float(os.environ.get("WELCOME_REFRESH_INTERVAL", 900))  # seconds between new messages
+
+    # image generation
+    WARM_UP_CLIENTS: bool = os.environ.get("WARM_UP_CLIENTS", "True").lower() in ("true", "1")
+    GENERATION_TIMEOUT: int = int(os.environ.get("GENERATION_TIMEOUT", 60))  # seconds
+    IMAGEN_CONCURRENCY: int = int(os.environ.get("IMAGEN_CONCURRENCY", 8))
+    GEMINI_CONCURRENCY: int = int(os.environ.get("GEMINI_CONCURRENCY", 4))
+    MODEL_GARDEN_CONCURRENCY: int = int(os.environ.get("MODEL_GARDEN_CONCURRENCY", 2))
+    STUDY_FETCH_CONCURRENCY: int = int(os.environ.get("STUDY_FETCH_CONCURRENCY", 8))
+    GENERATION_MAX_QUEUE: int = int(os.environ.get("GENERATION_MAX_QUEUE", 16))  # waiting calls per backend
+    # per-model deadlines in seconds, e.g. {"black-forest-labs/flux1-schnell": 15}
+    MODEL_DEADLINES: dict = field(default_factory=lambda: json.loads(os.environ.get("MODEL_DEADLINES", "{}")))
+    BATTLE_DEADLINE: int = int(os.environ.get("BATTLE_DEADLINE", 30))  # latency SLO for a live battle, seconds
+    FALLBACK_TIMEOUT: int = int(os.environ.get("FALLBACK_TIMEOUT", 3))  # cached image lookup, seconds
+    HEDGE_REQUESTS: bool = os.environ.get("HEDGE_REQUESTS", "False").lower() in ("true", "1")
+    HEDGE_QUANTILE: float = float(os.environ.get("HEDGE_QUANTILE", 0.95))
+    HEDGE_MIN_SAMPLES: int = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+
+    # battle prefetching
+    BATTLE_QUEUE_ENABLED: bool = os.environ.get("BATTLE_QUEUE_ENABLED", "True").lower() in ("true", "1")
+    BATTLE_QUEUE_SIZE: int = int(os.environ.get("BATTLE_QUEUE_SIZE", 4))
+    BATTLE_QUEUE_LOW_WATERMARK: int = int(os.environ.get("BATTLE_QUEUE_LOW_WATERMARK", 2))
+    BATTLE_QUEUE_WORKERS: int = int(os.environ.get("BATTLE_QUEUE_WORKERS", 2))
+    BATTLE_QUEUE_MAX_AGE: int = int(os.environ.get("BATTLE_QUEUE_MAX_AGE", 1800))  # seconds
+    NEXT_BATTLE_WORKERS: int = int(os.environ.get("NEXT_BATTLE_WORKERS", 4))  # battles generated at vote time on a queue miss
+    REVEAL_MIN_TIME: float = float(os.environ.get("REVEAL_MIN_TIME", 1))  # seconds the browser keeps a vote's reveal on screen
 
     # image models
     MODEL_IMAGEN2: str = "imagegeneration@006"
@@ -65,6 +135,10 @@ class Default:
     SPANNER_INSTANCE_ID: str = os.environ.get("SPANNER_INSTANCE_ID", "arena")
     SPANNER_DATABASE_ID: str = os.environ.get("SPANNER_DATABASE_ID", "study")
     SPANNER_TIMEOUT: int = int(os.environ.get("SPANNER_TIMEOUT", 300))  # seconds
+    SPANNER_POOL_SIZE: int = int(os.environ.get("SPANNER_POOL_SIZE", 10))  # sessions
+    SPANNER_PING_INTERVAL: int = int(os.environ.get("SPANNER_PING_INTERVAL", 300))  # seconds between session pings
+    RATING_HISTORY_FLUSH_INTERVAL: float = float(os.environ.get("RATING_HISTORY_FLUSH_INTERVAL", 5))  # seconds
+    RATING_HISTORY_POINTS: int = int(os.environ.get("RATING_HISTORY_POINTS", 300))  # per model, on the leaderboard chart
 
     def __post_init__(self):
         """Validates the configuration variables after initialization."""
@@ -83,6 +157,15 @@ class Default:
 
         if self.ELO_K_FACTOR <= 0:
             raise ValueError("ELO_K_FACTOR must be a positive integer.")
+        if self.RATING_METHOD not in ("elo", "bradley_terry"):
+            raise ValueError("RATING_METHOD must be 'elo' or 'bradley_terry'.")
+        if not 0 < self.VOTE_DRAIN_BATCH_SIZE <= 200:
+            raise ValueError("VOTE_DRAIN_BATCH_SIZE must be between 1 and 200.")
+
+        if self.BATTLE_QUEUE_SIZE <= 0 or self.BATTLE_QUEUE_WORKERS <= 0:
+            raise ValueError("BATTLE_QUEUE_SIZE and BATTLE_QUEUE_WORKERS must be positive integers.")
+        if self.NEXT_BATTLE_WORKERS <= 0:
+            raise ValueError("NEXT_BATTLE_WORKERS must be a positive integer.")
 
         if not self.IMAGE_FIREBASE_DB:
             raise ValueError("IMAGE_FIREBASE_DB environment variable is not set. Default will be used") 
@@ -16,11 +16,12 @@
 # Prerequisite: Create a Spanner instance "arena_study" on GCP console with 100 processing units.
 from dataclasses import dataclass, field, fields
 import dataclasses
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 import logging
 import secrets
 import string
+import threading
 from typing import Optional
 
 from google.cloud import spanner
@@ -54,21 +55,40 @@ class ArenaModelEvaluation():
         log(f"Initialized StudyRun: {self.model_name}, {self.time_of_rating}, {self.rating}, {self.study}, {self.id}")
 
 class ArenaStudyTracker:
-    """Arena Study Tracker for managing study runs in Spanner (Singleton)."""
+    """Arena Study Tracker for managing study runs in Spanner (Singleton).
+
+    The client and its session pool live as long as the process; a
+    background thread pings idle sessions so they are not expired by the
+    server.
+    """
 
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls, project_id: str, spanner_instance_id: str, spanner_database_id: str):
-        if cls._instance is None:
-            cls._instance = super(ArenaStudyTracker, cls).__new__(cls)
-            cls._instance.project_id = project_id
-            cls._instance.spanner_instance_id = spanner_instance_id
-            cls._instance.spanner_database_id = spanner_database_id
-            cls._instance.client = spanner.Client(project=project_id)
-            cls._instance.instance = cls._instance.client.instance(spanner_instance_id)
-            cls._instance.database = cls._instance.instance.database(spanner_database_id)
-            log("ArenaStudyTracker instance created.")
-        return cls._instance
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(ArenaStudyTracker, cls).__new__(cls)
+                instance.project_id = project_id
+                instance.spanner_instance_id = spanner_instance_id
+                instance.spanner_database_id = spanner_database_id
+                instance.client = spanner.Client(project=project_id)
+                instance.instance = instance.client.instance(spanner_instance_id)
+                instance.pool = spanner.PingingPool(size=config.SPANNER_POOL_SIZE, ping_interval=config.SPANNER_PING_INTERVAL)
+                instance.database = instance.instance.database(spanner_database_id, pool=instance.pool)
+                instance._closed = threading.Event()
+                threading.Thread(target=instance._ping_sessions, name="spanner-pinger", daemon=True).start()
+                cls._instance = instance
+                log("ArenaStudyTracker instance created.")
+            return cls._instance
+
+    def _ping_sessions(self):
+        """Keep pooled sessions alive until the tracker is closed"""
+        while not self._closed.wait(timeout=config.SPANNER_PING_INTERVAL):
+            try:
+                self.pool.ping()
+            except Exception as e:
+                log(f"Failed to ping Spanner sessions: {e}", LogLevel.WARNING)
 
     def _generate_unique_id(self, number_characters: int = 8) -> str:
         """Generate a unique ID of a specified length."""
@@ -119,18 +139,96 @@ class ArenaStudyTracker:
             log(f"{len(study_runs)} study runs added/updated successfully in the database.")
         except Exception as e:
             raise Exception(f"Error adding study runs: {e}") from e
-        finally:
-            self._close_connection()
+
+    def insert_ratings(self, ratings: dict[str, dict[str, float]], table_name: Optional[str] = "Study"):
+        """Insert one rating row per (study, model) in a single commit, timestamped by the commit."""
+        columns = ["model_name", "study", "time_of_rating", "rating", "id"]
+        values = [
+            [model_name, study, spanner.COMMIT_TIMESTAMP, rating, self._generate_unique_id()]
+            for study, models in ratings.items()
+            for model_name, rating in models.items()
+        ]
+        if not values:
+            return
+        try:
+            with self.database.batch() as batch:
+                batch.insert(table_name, columns=columns, values=values)
+        except Exception as e:
+            raise Exception(f"Error adding ratings: {e}") from e
+
+    def rating_history(
+        self,
+        study: str,
+        models: Optional[list[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        points: int = 300,
+        staleness: float = 15,
+        table_name: Optional[str] = "Study",
+    ) -> dict[str, list[tuple[datetime, float]]]:
+        """Rating trajectory of each model in a study, downsampled to about `points` points per model.
+
+        The time range is split into `points` buckets and Spanner returns the
+        last rating of each model in each bucket. Both queries run in one
+        read-only snapshot `staleness` seconds in the past, so they take no
+        locks and never contend with rating writes.
+        """
+        filters = "study = @study"
+        params = {"study": study}
+        param_types = {"study": spanner.param_types.STRING}
+        if models:
+            filters += " AND model_name IN UNNEST(@models)"
+            params["models"] = models
+            param_types["models"] = spanner.param_types.Array(spanner.param_types.STRING)
+
+        history: dict[str, list[tuple[datetime, float]]] = {}
+        with self.database.snapshot(exact_staleness=timedelta(seconds=staleness), multi_use=True) as snapshot:
+            if start is None or end is None:
+                first, last = list(
+                    snapshot.execute_sql(
+                        f"SELECT MIN(time_of_rating), MAX(time_of_rating) FROM {table_name} WHERE {filters}",
+                        params=params,
+                        param_types=param_types,
+                    )
+                )[0]
+                if first is None:
+                    return history
+                start, end = start or first, end or last
+
+            bucket_us = max(int((end - start).total_seconds() * 1_000_000) // max(points, 1), 1)
+            rows = snapshot.execute_sql(
+                f"""
+                SELECT model_name, MAX(time_of_rating) AS bucket_time, ANY_VALUE(rating HAVING MAX time_of_rating)
+                FROM {table_name}
+                WHERE {filters} AND time_of_rating BETWEEN @start AND @end
+                GROUP BY model_name, DIV(UNIX_MICROS(time_of_rating) - UNIX_MICROS(@start), @bucket_us)
+                ORDER BY model_name, bucket_time
+                """,
+                params={**params, "start": start, "end": end, "bucket_us": bucket_us},
+                param_types={
+                    **param_types,
+                    "start": spanner.param_types.TIMESTAMP,
+                    "end": spanner.param_types.TIMESTAMP,
+                    "bucket_us": spanner.param_types.INT64,
+                },
+            )
+            for model_name, time_of_rating, rating in rows:
+                history.setdefault(model_name, []).append((time_of_rating, rating))
+        return history
 
     def close(self):
-        """Close the Spanner client connection."""
+        """Close the Spanner client connection; the next ArenaStudyTracker() opens a new one."""
+        self._closed.set()
         self._close_connection()
+        with self._lock:
+            if ArenaStudyTracker._instance is self:
+                ArenaStudyTracker._instance = None
 
     def _close_connection(self):
         """Internal method to close the Spanner client connection."""
-        if self._instance and self._instance.client:
-            self._instance.client.close()
-            self._instance.client = None
+        if self.client:
+            self.client.close()
+            self.client = None
             log("Database connection closed.")
         else:
             log("Client was already closed or not initialized.", LogLevel.WARNING)
@@ -14,11 +14,12 @@
 
 import mesop as me
 
+from common.render_data import render_trace
 from state.state import AppState
 from components.page_scaffold import page_scaffold
-from pages.arena import arena_page_content
+from pages.arena import arena_page_content, on_load_arena
 from pages.leaderboard import leaderboard_page_content
-from pages.history import history_page_content
+from pages.history import history_page_content, on_load_history
 from pages.settings import settings_page_content
 
 # from pages.gemini2 import gemini_page_content
@@ -35,16 +36,28 @@ def on_load(e: me.LoadEvent):  # pylint: disable=unused-argument
         me.set_theme_mode("system")
 
 
+def on_load_home_page(e: me.LoadEvent):
+    """On load event of the arena page"""
+    on_load(e)
+    yield from on_load_arena(e)
+
+
+def on_load_history_page(e: me.LoadEvent):
+    """On load event of the history page"""
+    on_load(e)
+    on_load_history(e)
+
+
 @me.page(
     path="/",
     title="Arena - Home",
-    on_load=on_load,
+    on_load=on_load_home_page,
     security_policy=me.SecurityPolicy(dangerously_disable_trusted_types=True),
 )
 def home_page():
     """Main Page"""
     state = me.state(AppState)
-    with page_scaffold():  # pylint: disable=not-context-manager
+    with render_trace("arena"), page_scaffold():  # pylint: disable=not-context-manager
         arena_page_content(state)
 
 
@@ -56,18 +69,20 @@ def home_page():
 )
 def leaderboard_page():
     """Leaderboard Page"""
-    leaderboard_page_content(me.state(AppState))
+    with render_trace("leaderboard"):
+        leaderboard_page_content(me.state(AppState))
 
 
 @me.page(
     path="/history",
     title="Arena - History",
-    on_load=on_load,
+    on_load=on_load_history_page,
     security_policy=me.SecurityPolicy(dangerously_disable_trusted_types=True),
 )
 def history_page():
     """History Page"""
-    history_page_content(me.state(AppState))
+    with render_trace("history"):
+        history_page_content(me.state(AppState))
     
 
 @me.page(
@@ -78,7 +93,8 @@ def history_page():
 )
 def settings_page():
     """Another Page"""
-    settings_page_content(me.state(AppState))
+    with render_trace("settings"):
+        settings_page_content(me.state(AppState))
 
 
 # @me.page(
@@ -0,0 +1,464 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Arena battle generation and background battle prefetching """
+
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from config.default import Default
+from models.generate import study_fetch
+from models.registry import registry
+from models.scheduler import STUDY_BACKEND, BackendSaturated, scheduler
+from utils.metrics import Histogram, current_rss_mb, peak_rss_mb
+
+
+config = Default()
+
+@dataclass
+class Battle:
+    """A ready-to-render arena matchup."""
+
+    prompt: str
+    models: list[str]
+    images: list[Optional[str]] = field(default_factory=list)  # by model; None for a side without an image
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def model1(self) -> str:
+        return self.models[0]
+
+    @property
+    def model2(self) -> str:
+        return self.models[1]
+
+    @property
+    def complete(self) -> bool:
+        """Whether every model has an image."""
+        return len(self.images) == len(self.models) and all(self.images)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the battle images were generated."""
+        return time.monotonic() - self.created_at
+
+
+# Latency of successful generations per model, used to time hedged requests
+_latency: dict[str, Histogram] = defaultdict(Histogram)
+_metrics_lock = threading.Lock()
+_metrics = {"timeouts": 0, "hedges": 0, "hedge_wins": 0, "cached_fallbacks": 0, "replacements": 0, "failed_sides": 0}
+_rss = {"last_battle_mb": 0.0, "max_battle_growth_mb": 0.0}
+
+
+def _count(metric: str):
+    with _metrics_lock:
+        _metrics[metric] += 1
+
+
+def generation_metrics() -> dict:
+    """Counts of deadline misses, hedged requests and fallbacks; RSS after battles, and the process peak RSS."""
+    with _metrics_lock:
+        return {**_metrics, **{f"rss_{k}": v for k, v in _rss.items()}, "peak_rss_mb": peak_rss_mb()}
+
+
+def _record_rss(rss_before: Optional[float]):
+    """Record the current RSS after a battle, and how much it grew during the battle.
+
+    Battles generated concurrently in this process all count towards the growth.
+    """
+    rss_after = current_rss_mb()
+    if rss_before is None or rss_after is None:
+        return
+    with _metrics_lock:
+        _rss["last_battle_mb"] = rss_after
+        _rss["max_battle_growth_mb"] = max(_rss["max_battle_growth_mb"], rss_after - rss_before)
+    logging.info("RSS after battle: %.1f MiB (%+.1f MiB)", rss_after, rss_after - rss_before)
+
+
+def _done_future(result: list[str]) -> Future:
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+
+def _submit_side(model_name: str, prompt: str, study: str, aspect_ratio: str, degrade: bool = True) -> Future:
+    """Schedule one side of a battle on its backend.
+
+    If a live model's backend is saturated, degrade to a previously generated
+    image for the same prompt and model instead of queueing behind it.
+    """
+    if study != "live":
+        return scheduler.submit(STUDY_BACKEND, study_fetch, model_name, prompt, study)
+
+    adapter = registry.resolve(model_name)
+    if not adapter:
+        logging.error("no generator defined for %s", model_name)
+        return _done_future([])
+
+    logging.info("%s: %s (%s)", adapter.model["display"], model_name, adapter.backend)
+    try:
+        future = scheduler.submit(adapter.backend, adapter, prompt, aspect_ratio)
+    except BackendSaturated as e:
+        if not degrade:
+            raise
+        logging.warning(f"{e}; using a cached image for {model_name}")
+        _count("cached_fallbacks")
+        return scheduler.submit(STUDY_BACKEND, study_fetch, model_name, prompt)
+
+    submitted = time.monotonic()
+
+    def _record_latency(f: Future):
+        if not f.cancelled() and f.exception() is None and f.result():
+            _latency[model_name].observe(time.monotonic() - submitted)
+
+    future.add_done_callback(_record_latency)
+    return future
+
+
+def _deadline(model_name: str, study: str) -> float:
+    """How long to wait for one side of a battle, in seconds"""
+    adapter = registry.resolve(model_name) if study == "live" else None
+    deadline = adapter.timeout if adapter else config.GENERATION_TIMEOUT
+    return min(deadline, config.BATTLE_DEADLINE)
+
+
+def _hedge_delay(model_name: str) -> Optional[float]:
+    """When to hedge a straggling request, or None if hedging is off or uncalibrated"""
+    histogram = _latency.get(model_name)
+    if not config.HEDGE_REQUESTS or histogram is None or histogram.count < config.HEDGE_MIN_SAMPLES:
+        return None
+    return histogram.quantile(config.HEDGE_QUANTILE)
+
+
+@dataclass
+class _Side:
+    """In-flight generation for one model in a battle."""
+
+    model: str
+    primary: Future
+    started: float
+    deadline: float
+    hedge_at: Optional[float] = None
+    futures: list[Future] = field(default_factory=list)
+    hedged: bool = False
+    result: list[str] = field(default_factory=list)
+    finished: bool = False
+
+    def __post_init__(self):
+        self.futures = [self.primary]
+
+    def finish(self, result: Optional[list[str]] = None):
+        self.result = result or []
+        self.finished = True
+        for future in self.futures:
+            future.cancel()  # only cancels calls still waiting in a backend queue
+        self.futures = []
+
+
+def _cached_images(model_names: list[str], prompt: str, deadline: float) -> dict[str, list[str]]:
+    """Look up previously generated images of several models for a prompt, concurrently and without raising.
+
+    Lookups still running at `deadline` are abandoned, and those models get no image.
+    """
+    futures = {}
+    for model_name in model_names:
+        try:
+            futures[model_name] = scheduler.submit(STUDY_BACKEND, study_fetch, model_name, prompt)
+        except BackendSaturated as e:
+            logging.info(f"No cached image for {model_name}: {e}")
+    wait(list(futures.values()), timeout=max(0.0, deadline - time.monotonic()))
+    images = {}
+    for model_name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            logging.info(f"No cached image for {model_name}: timed out")
+            continue
+        try:
+            images[model_name] = future.result()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.info(f"No cached image for {model_name}: {e}")
+    return images
+
+
+def _await_sides(sides: list[_Side], prompt: str, study: str, aspect_ratio: str):
+    """Wait for every side until it succeeds, fails, or misses its deadline.
+
+    A side still running at its hedge time gets a second, identical request;
+    whichever request returns images first wins and the other is cancelled.
+    """
+    while True:
+        pending = [side for side in sides if not side.finished]
+        if not pending:
+            return
+        events = [side.deadline for side in pending]
+        events.extend(side.hedge_at for side in pending if side.hedge_at and not side.hedged)
+        outstanding = [future for side in pending for future in side.futures]
+        wait(outstanding, timeout=max(0.0, min(events) - time.monotonic()), return_when=FIRST_COMPLETED)
+
+        now = time.monotonic()
+        for side in pending:
+            for future in [f for f in side.futures if f.done()]:
+                side.futures.remove(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.error(f"Error during image generation for {side.model}: {e}")
+                    continue
+                if result:
+                    if future is not side.primary:
+                        _count("hedge_wins")
+                    side.finish(result[:1])
+                    break
+
+            if side.finished:
+                continue
+            if now >= side.deadline:
+                logging.error(f"Timed out waiting for {side.model} after {now - side.started:.1f}s")
+                _count("timeouts")
+                side.finish()
+            elif side.hedge_at and not side.hedged and now >= side.hedge_at:
+                side.hedged = True
+                try:
+                    side.futures.append(_submit_side(side.model, prompt, study, aspect_ratio, degrade=False))
+                    _count("hedges")
+                    logging.info(f"Hedging {side.model} after {now - side.started:.1f}s")
+                except BackendSaturated:
+                    logging.info(f"Not hedging {side.model}: backend saturated")
+            elif not side.futures:
+                side.finish()
+
+
+def generate_battle(
+    prompt: str,
+    models: list[str],
+    study: str,
+    aspect_ratio: str = "1:1",
+    replacements: Optional[list[str]] = None,
+) -> Battle:
+    """Create (or, in study mode, fetch) the images for one battle.
+
+    Any number of models can take part. Each side has a hard deadline; a side
+    that misses it or fails is filled with a cached image of the same model,
+    else with a cached image of one of `replacements`, in which case that
+    model takes its place in the returned battle. The cached images are all
+    looked up at once, within FALLBACK_TIMEOUT, so a battle takes at most
+    BATTLE_DEADLINE + FALLBACK_TIMEOUT seconds. Images are index-aligned with
+    the models; a side that cannot be filled has None as its image, and the
+    battle is not `complete`.
+    """
+    logging.info("BATTLE: %s", " vs. ".join(models))
+    logging.info("prompt: %s", prompt)
+
+    started = time.monotonic()
+    rss_before = current_rss_mb()
+    sides = []
+    for model in models:
+        try:
+            future = _submit_side(model, prompt, study, aspect_ratio)
+        except BackendSaturated as e:
+            logging.error(f"Unable to schedule {model}: {e}")
+            future = _done_future([])
+        hedge_delay = _hedge_delay(model) if study == "live" else None
+        sides.append(
+            _Side(
+                model=model,
+                primary=future,
+                started=started,
+                deadline=started + _deadline(model, study),
+                hedge_at=started + hedge_delay if hedge_delay else None,
+            )
+        )
+    _await_sides(sides, prompt, study, aspect_ratio)
+
+    cached, spare = {}, []
+    failed = [side.model for side in sides if not side.result]
+    if failed:
+        spare = [m for m in (replacements or []) if m not in models]
+        random.shuffle(spare)
+        # a study side was already a cached lookup, so only replacements are tried for it
+        lookups = (failed if study == "live" else []) + spare
+        deadline = min(time.monotonic(), started + config.BATTLE_DEADLINE) + config.FALLBACK_TIMEOUT
+        cached = _cached_images(lookups, prompt, deadline)
+        spare = [m for m in spare if cached.get(m)]
+
+    battle_models, images = [], []
+    for side in sides:
+        model, result = side.model, side.result
+        if not result and study == "live" and cached.get(model):
+            result = cached[model]
+            _count("cached_fallbacks")
+        if not result and spare:
+            candidate = spare.pop()
+            logging.info(f"Replacing {model} with {candidate}")
+            _count("replacements")
+            model, result = candidate, cached[candidate]
+        if not result:
+            _count("failed_sides")
+        battle_models.append(model)
+        images.append(result[0] if result else None)
+    _record_rss(rss_before)
+    return Battle(prompt=prompt, models=battle_models, images=images, created_at=time.monotonic())
+
+
+@dataclass
+class _StudyQueue:
+    """Prefetched battles and sampling settings for a single study."""
+
+    sample: Callable[[], tuple[str, list[str]]]
+    aspect_ratio: str = "1:1"
+    battles: deque = field(default_factory=deque)
+    in_flight: int = 0
+    refilling: bool = True
+
+
+class BattleQueue:
+    """Keeps a bounded queue of pre-generated battles per study.
+
+    Worker threads fill each registered study up to `capacity` battles using
+    `generate_battle`. Once a study has been filled, it is only refilled after
+    its depth drops below `low_watermark`, so idle studies do not keep paying
+    for generation. Battles older than `max_age` seconds are discarded.
+    """
+
+    def __init__(
+        self,
+        capacity: int = config.BATTLE_QUEUE_SIZE,
+        low_watermark: int = config.BATTLE_QUEUE_LOW_WATERMARK,
+        workers: int = config.BATTLE_QUEUE_WORKERS,
+        max_age: int = config.BATTLE_QUEUE_MAX_AGE,
+    ):
+        self.capacity = capacity
+        self.low_watermark = min(low_watermark, capacity)
+        self.max_age = max_age
+        self._studies: dict[str, _StudyQueue] = {}
+        self._cond = threading.Condition()
+        self._metrics = {"hits": 0, "misses": 0, "expired": 0, "generated": 0, "failed": 0}
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+        for idx in range(workers):
+            threading.Thread(target=self._worker, name=f"battle-prefetch-{idx}", daemon=True).start()
+
+    def configure(self, study: str, sample: Callable[[], tuple[str, list[str]]], aspect_ratio: str = "1:1"):
+        """Register a study, or update how its battles are sampled.
+
+        Args:
+            study: study name, "live" for live generation.
+            sample: returns a (prompt, models) tuple for the next battle.
+            aspect_ratio: aspect ratio used for live generation.
+        """
+        with self._cond:
+            if study in self._studies:
+                self._studies[study].sample = sample
+                self._studies[study].aspect_ratio = aspect_ratio
+                return
+            self._studies[study] = _StudyQueue(sample=sample, aspect_ratio=aspect_ratio)
+            self._cond.notify_all()
+
+    def get(self, study: str) -> Optional[Battle]:
+        """Pop the next ready battle for a study, or None on a miss."""
+        with self._cond:
+            queue = self._studies.get(study)
+            battle = None
+            while queue and queue.battles:
+                candidate = queue.battles.popleft()
+                if candidate.age <= self.max_age:
+                    battle = candidate
+                    break
+                self._metrics["expired"] += 1
+
+            if battle:
+                self._metrics["hits"] += 1
+                self._served_age_total += battle.age
+                self._served_age_max = max(self._served_age_max, battle.age)
+            else:
+                self._metrics["misses"] += 1
+
+            if queue and len(queue.battles) < self.low_watermark and not queue.refilling:
+                queue.refilling = True
+                self._cond.notify_all()
+        return battle
+
+    def depth(self, study: str) -> int:
+        """Number of ready battles for a study."""
+        with self._cond:
+            queue = self._studies.get(study)
+            return len(queue.battles) if queue else 0
+
+    def metrics(self) -> dict:
+        """Snapshot of queue depth, hit rate and staleness."""
+        with self._cond:
+            hits = self._metrics["hits"]
+            lookups = hits + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "depth": {study: len(queue.battles) for study, queue in self._studies.items()},
+                "in_flight": {study: queue.in_flight for study, queue in self._studies.items()},
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "mean_served_age": self._served_age_total / hits if hits else 0.0,
+                "max_served_age": self._served_age_max,
+            }
+
+    def _next_study(self) -> Optional[str]:
+        """Pick the study most in need of another battle. Caller holds the lock."""
+        best, best_fill = None, None
+        for study, queue in self._studies.items():
+            fill = len(queue.battles) + queue.in_flight
+            if not queue.refilling:
+                continue
+            if fill >= self.capacity:
+                queue.refilling = False
+                continue
+            if best_fill is None or fill < best_fill:
+                best, best_fill = study, fill
+        return best
+
+    def _worker(self):
+        """Worker thread loop: generate battles for studies that need refilling."""
+        while True:
+            with self._cond:
+                study = self._next_study()
+                while study is None:
+                    self._cond.wait()
+                    study = self._next_study()
+                queue = self._studies[study]
+                queue.in_flight += 1
+                sample, aspect_ratio = queue.sample, queue.aspect_ratio
+
+            battle = None
+            try:
+                prompt, models = sample()
+                generated = generate_battle(prompt, models, study, aspect_ratio)
+                if generated.complete:
+                    battle = generated
+            except Exception as e:
+                logging.error(f"Error prefetching battle for study {study}: {e}")
+
+            with self._cond:
+                queue.in_flight -= 1
+                if battle:
+                    queue.battles.append(battle)
+                    self._metrics["generated"] += 1
+                else:
+                    self._metrics["failed"] += 1
+                    # back off before retrying a study whose backends are failing
+                    self._cond.wait(timeout=1)
+                self._cond.notify_all()
+
+
+battle_queue: Optional[BattleQueue] = BattleQueue() if config.BATTLE_QUEUE_ENABLED else None
@@ -27,6 +27,7 @@ from google.genai.types import (
 from google.genai.errors import ClientError
 import vertexai
 
+from common.render_data import backend_call
 from models.set_up import ModelSetup
 
 
@@ -73,6 +74,7 @@ def generate_images(prompt: str) -> list[str]:
 def generate_content(prompt: str) -> str:
     """generate text content"""
 
+    backend_call("gemini")
     try:
         response = client.models.generate_content(
             model=MODEL_ID,
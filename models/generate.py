@@ -18,28 +18,34 @@ import base64
 import io
 import logging
 import time
-from typing import Any
+from typing import Any, Optional
 import uuid
 import random
-import os
 
 from PIL import Image
 
-from google.cloud import aiplatform
 from google.cloud.firestore import Client, FieldFilter
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
 
 from config.default import Default
 from config.firebase_config import FirebaseClient
-from common.storage import store_to_gcs
-from common.metadata import add_image_metadata
+from models.set_up import ModelSetup
+from common.storage import GCSObject, store_many_to_gcs
+from common.image_catalog import StudyImageCatalog, display_uri
+from common.image_variants import VariantPipeline
+from common.metadata import add_image_metadata, add_image_variants
 
 
 config = Default()
 logging.basicConfig(level=logging.DEBUG)
 
 
+def _record_image(gcs_uri: str, prompt: str, model_name: str):
+    """Queue an image's metadata, and create its variants; both happen in the background"""
+    doc_id = add_image_metadata(gcs_uri, prompt, model_name)
+    if config.VARIANTS_ENABLED:
+        VariantPipeline().submit(gcs_uri, lambda variants: add_image_variants(doc_id, variants))
+
+
 def base64_to_image(image_str: str) -> Any:
     """Convert base64 encoded string to an image.
 
@@ -92,12 +98,10 @@ def generate_images_from_model_garden(
     logging.info(f"Parameters: {parameters}")
     logging.info(f"Target GCS Folder: gs://{config.GENMEDIA_BUCKET}/{output_gcs_folder}/")
 
-    aiplatform.init(project=project_id, location=location)
-
     instances = [{"text": prompt}] 
 
-    endpoint_path = f"projects/{project_id}/locations/{location}/endpoints/{endpoint_id}"
-    endpoint = aiplatform.Endpoint(endpoint_path)
+    endpoint = ModelSetup.endpoint(endpoint_id, project_id, location)
+    endpoint_path = endpoint.resource_name
 
     arena_output: list[str] = []
     start_time = time.time()
@@ -122,6 +126,7 @@ def generate_images_from_model_garden(
              else:
                  logging.warning(f"Prediction missing expected image data key ('output' or 'bytesBase64Encoded'): {prediction}")
 
+        del response  # keep only the base64 payloads, which are released as they are uploaded
         if not image_outputs:
              logging.error("No valid image data found in any endpoint predictions.")
              return [] # Or raise an error
@@ -133,37 +138,26 @@ def generate_images_from_model_garden(
     elapsed_time = end_time - start_time
     logging.info(f"Endpoint call finished in {elapsed_time:.2f} seconds. Processing {len(image_outputs)} images.")
 
-    for idx, img_base64 in enumerate(image_outputs):
-        try:
-            image_filename = f"{uuid.uuid4()}.png"
-            gcs_path_suffix = store_to_gcs(
-                folder=output_gcs_folder,
-                file_name=image_filename,
-                mime_type="image/png",
-                contents=img_base64,
-                decode=True
-            )
-            # Construct full GCS URI
-            gcs_uri = f"gs://{gcs_path_suffix}"
-
-            logging.info(
-                f"Generated image {idx+1}/{len(image_outputs)} with model {model_name}. "
-                f"Stored at: {gcs_uri}"
-            )
-            arena_output.append(gcs_uri)
-
-            try:
-                add_image_metadata(gcs_uri, prompt, model_name)
-                logging.debug(f"Successfully added metadata for {gcs_uri}")
-            except Exception as ex:
-                if "DeadlineExceeded" in str(ex):
-                    logging.error(f"Firestore timeout adding metadata for {gcs_uri}: {ex}")
-                else:
-                    logging.error(f"Error adding image metadata for {gcs_uri}: {ex}", exc_info=True)
-
-        except Exception as ex:
-            logging.error(f"Error processing or uploading image {idx+1} from {model_name}: {ex}", exc_info=True)
-            # Continue with the next image
+    objects = [
+        GCSObject(folder=output_gcs_folder, file_name=f"{uuid.uuid4()}.png", mime_type="image/png", contents=img_base64)
+        for img_base64 in image_outputs
+    ]
+    image_outputs.clear()
+    gcs_paths = store_many_to_gcs(objects, decode=True)
+    for idx, gcs_path_suffix in enumerate(gcs_paths):
+        if gcs_path_suffix is None:
+            logging.error(f"Error uploading image {idx+1} from {model_name}")
+            continue  # Continue with the next image
+        # Construct full GCS URI
+        gcs_uri = f"gs://{gcs_path_suffix}"
+
+        logging.info(
+            f"Generated image {idx+1}/{len(gcs_paths)} with model {model_name}. "
+            f"Stored at: {gcs_uri}"
+        )
+        arena_output.append(gcs_uri)
+
+        _record_image(gcs_uri, prompt, model_name)
 
     logging.info(f"Finished endpoint processing for model {model_name}. Returning {len(arena_output)} GCS URIs.")
     return arena_output
@@ -245,9 +239,7 @@ def images_from_imagen(model_name: str, prompt: str, aspect_ratio: str):
     logging.info(f"prompt: {prompt}")
     logging.info(f"target output: {config.GENMEDIA_BUCKET}")
 
-    vertexai.init(project=config.PROJECT_ID, location=config.LOCATION)
-
-    image_model = ImageGenerationModel.from_pretrained(model_name)
+    image_model = ModelSetup.image_model(model_name)
 
     response = image_model.generate_images(
         prompt=prompt,
@@ -267,40 +259,27 @@ def images_from_imagen(model_name: str, prompt: str, aspect_ratio: str):
     for idx, img in enumerate(response.images):
         logging.info(f"Generated image {idx} with model {model_name} in {elapsed_time:.2f} seconds")
 
-        logging.info(
-            f"Generated image: #{idx}, len {len(img._as_base64_string())} at {img._gcs_uri}"
-        )
-        # output = img._as_base64_string()
-        # state.image_output.append(output)
         arena_output.append(img._gcs_uri)
         logging.info(f"Image created: {img._gcs_uri}")
-        try:
-            add_image_metadata(img._gcs_uri, prompt, model_name)
-        except Exception as e:
-            if "DeadlineExceeded" in str(e):  # Check for timeout error
-                logging.error(f"Firestore timeout: {e}")
-            else:
-                logging.error(f"Error adding image metadata: {e}")
+        _record_image(img._gcs_uri, prompt, model_name)
 
     return arena_output
 
-def study_fetch(model_name: str, prompt: str) -> list[str]:
+def study_fetch(model_name: str, prompt: str, study: Optional[str] = None) -> list[str]:
+    """A stored image for a prompt and model: from the in-memory catalog for a study battle, else queried"""
+    if study and config.IMAGE_CATALOG_ENABLED:
+        uri = StudyImageCatalog().random_image(model_name, prompt)
+        if uri:
+            return [uri]
+        logging.info("no catalog image for %s in study %s; querying", model_name, study)
+
     db: Client = FirebaseClient(database_id=config.IMAGE_FIREBASE_DB).get_client()
     collection_ref = db.collection(config.IMAGE_COLLECTION_NAME)
     print(f"Using: {model_name}")
 
     query = collection_ref.where(filter=FieldFilter("prompt", "==", prompt)).where(filter=FieldFilter("model", "==", model_name)).stream()
 
-    docs = []
-    for doc in query:
-        gs_uri = doc.to_dict()['gcsuri']
-        if "stablediffusion" not in gs_uri:
-            docs.append(os.path.splitext(gs_uri)[0])
-        else:
-            if gs_uri.startswith("20250328_"):
-                docs.append(os.path.splitext(gs_uri)[0])
-            else:
-                docs.append(gs_uri)
+    docs = [display_uri(doc.to_dict()['gcsuri']) for doc in query]
     return random.sample(docs, 1)
 
 if __name__ == "__main__":
@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """ Image Models type definitions """
-from typing import TypedDict
+from dataclasses import dataclass
+import threading
+from typing import Any, Callable, Optional, TypedDict
 
 
 class ImageModel(TypedDict):
@@ -20,3 +22,80 @@ class ImageModel(TypedDict):
 
     display: str
     model_name: str
+
+
+def gcs_uri_outputs(outputs: list[Any]) -> list[str]:
+    """Default output handler: keep non-empty string outputs (GCS URIs)."""
+    return [output for output in outputs if isinstance(output, str) and output]
+
+
+@dataclass(frozen=True)
+class ImageModelAdapter:
+    """Binds an ImageModel to the function that generates its images.
+
+    `generate` is called as generate(model_name, prompt, aspect_ratio) and its
+    result is passed through `handle_output` to get the list of image URIs.
+    The adapter does not limit its own calls: `max_concurrency` sets the
+    scheduler bulkhead of its `backend` (the largest, when adapters share one).
+    """
+
+    model: ImageModel
+    generate: Callable[[str, str, str], list[Any]]
+    backend: str
+    max_concurrency: int = 4
+    timeout: float = 60.0
+    handle_output: Callable[[list[Any]], list[str]] = gcs_uri_outputs
+
+    def __post_init__(self):
+        if self.max_concurrency <= 0:
+            raise ValueError("max_concurrency must be a positive integer.")
+
+    @property
+    def model_name(self) -> str:
+        return self.model["model_name"]
+
+    def __call__(self, prompt: str, aspect_ratio: str) -> list[str]:
+        """Generate images for a prompt."""
+        return self.handle_output(self.generate(self.model_name, prompt, aspect_ratio))
+
+
+class ImageModelRegistry:
+    """Resolves model names to their ImageModelAdapter."""
+
+    def __init__(self):
+        self._adapters: dict[str, ImageModelAdapter] = {}
+        self._aliases: dict[str, Optional[ImageModelAdapter]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, adapter: ImageModelAdapter):
+        """Add (or replace) the adapter for adapter.model_name."""
+        with self._lock:
+            self._adapters[adapter.model_name] = adapter
+            self._aliases.clear()
+
+    def resolve(self, model_name: str) -> Optional[ImageModelAdapter]:
+        """Look up the adapter for a model name, or None if none is registered.
+
+        Names that extend a registered name (e.g. a versioned variant) resolve
+        to that adapter; the prefix match is done once and remembered.
+        """
+        adapter = self._adapters.get(model_name)
+        if adapter:
+            return adapter
+        with self._lock:
+            if model_name not in self._aliases:
+                self._aliases[model_name] = next(
+                    (a for name, a in self._adapters.items() if model_name.startswith(name)), None
+                )
+            return self._aliases[model_name]
+
+    def adapters(self) -> list[ImageModelAdapter]:
+        """All registered adapters."""
+        return list(self._adapters.values())
+
+    def model_names(self) -> list[str]:
+        """Registered model names, in registration order."""
+        return list(self._adapters)
+
+    def __contains__(self, model_name: str) -> bool:
+        return self.resolve(model_name) is not None
@@ -0,0 +1,114 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Registry of the image models available to the arena """
+
+import threading
+
+from config.default import Default
+from models.gemini_model import generate_images
+from models.generate import (
+    images_from_flux,
+    images_from_imagen,
+    images_from_stable_diffusion,
+)
+from models.image_models import ImageModel, ImageModelAdapter, ImageModelRegistry
+from models.set_up import ModelSetup
+
+
+config = Default()
+
+IMAGEN_MODELS = {
+    config.MODEL_IMAGEN2: "Imagen 2",
+    config.MODEL_IMAGEN3_FAST: "Imagen 3 Fast",
+    config.MODEL_IMAGEN3: "Imagen 3",
+    config.MODEL_IMAGEN32: "Imagen 3.2",
+}
+
+
+def _gemini_images(model_name: str, prompt: str, aspect_ratio: str) -> list[str]:
+    """Gemini image output does not take a model name or aspect ratio"""
+    _ = model_name, aspect_ratio
+    return generate_images(prompt)
+
+
+def _deadline(model_name: str) -> float:
+    """Per-model deadline from MODEL_DEADLINES, else GENERATION_TIMEOUT"""
+    return float(config.MODEL_DEADLINES.get(model_name, config.GENERATION_TIMEOUT))
+
+
+def build_default_registry() -> ImageModelRegistry:
+    """Register the Imagen, Gemini and configured Model Garden models."""
+    registry = ImageModelRegistry()
+
+    for model_name, display in IMAGEN_MODELS.items():
+        registry.register(
+            ImageModelAdapter(
+                model=ImageModel(display=display, model_name=model_name),
+                generate=images_from_imagen,
+                backend="imagen",
+                max_concurrency=config.IMAGEN_CONCURRENCY,
+                timeout=_deadline(model_name),
+            )
+        )
+
+    registry.register(
+        ImageModelAdapter(
+            model=ImageModel(display="Gemini 2.0 Flash", model_name=config.MODEL_GEMINI2),
+            generate=_gemini_images,
+            backend="gemini",
+            max_concurrency=config.GEMINI_CONCURRENCY,
+            timeout=_deadline(config.MODEL_GEMINI2),
+        )
+    )
+
+    # Model Garden models are only available once their endpoint is deployed
+    if config.MODEL_FLUX1_ENDPOINT_ID:
+        registry.register(
+            ImageModelAdapter(
+                model=ImageModel(display="Flux.1 Schnell", model_name=config.MODEL_FLUX1),
+                generate=images_from_flux,
+                backend=f"endpoint/{config.MODEL_FLUX1_ENDPOINT_ID}",
+                max_concurrency=config.MODEL_GARDEN_CONCURRENCY,
+                timeout=_deadline(config.MODEL_FLUX1),
+            )
+        )
+    if config.MODEL_STABLE_DIFFUSION_ENDPOINT_ID:
+        registry.register(
+            ImageModelAdapter(
+                model=ImageModel(display="Stable Diffusion 2.1", model_name=config.MODEL_STABLE_DIFFUSION),
+                generate=images_from_stable_diffusion,
+                backend=f"endpoint/{config.MODEL_STABLE_DIFFUSION_ENDPOINT_ID}",
+                max_concurrency=config.MODEL_GARDEN_CONCURRENCY,
+                timeout=_deadline(config.MODEL_STABLE_DIFFUSION),
+            )
+        )
+    return registry
+
+
+registry = build_default_registry()
+
+
+def warm_up_clients():
+    """Create Imagen model handles and Model Garden endpoints in the background."""
+    endpoint_ids = [e for e in (config.MODEL_FLUX1_ENDPOINT_ID, config.MODEL_STABLE_DIFFUSION_ENDPOINT_ID) if e]
+    threading.Thread(
+        target=ModelSetup.warm_up,
+        args=(list(IMAGEN_MODELS), endpoint_ids),
+        name="client-warm-up",
+        daemon=True,
+    ).start()
+
+
+if config.WARM_UP_CLIENTS:
+    warm_up_clients()
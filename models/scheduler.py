@@ -0,0 +1,172 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Process-wide generation scheduler with per-backend bulkheads """
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from common.render_data import traced
+from config.default import Default
+from models.image_models import ImageModelRegistry
+from models.registry import registry
+from utils.logger import LogLevel, log
+from utils.metrics import Histogram
+
+
+config = Default()
+
+# Backend used for study-mode and fallback image lookups in Firestore
+STUDY_BACKEND = "firestore"
+
+
+class BackendSaturated(Exception):
+    """Raised when a backend's queue is full and the call is rejected."""
+
+
+@dataclass
+class _Bulkhead:
+    """Concurrency limit, threads, wait queue and latency histograms for one backend."""
+
+    limit: int
+    max_queue: int
+    pool: Optional[ThreadPoolExecutor] = None  # `limit` threads, started on the first call
+    running: int = 0
+    pending: deque = field(default_factory=deque)
+    rejected: int = 0
+    completed: int = 0
+    failed: int = 0
+    queue_time: Histogram = field(default_factory=Histogram)
+    run_time: Histogram = field(default_factory=Histogram)
+
+
+class GenerationScheduler:
+    """Runs generation calls on persistent thread pools, one per backend.
+
+    Each backend (Imagen, Gemini, each Model Garden endpoint) runs at most
+    `limit` calls at once, on its own pool of `limit` threads, including
+    backends first seen at submit time. Further calls wait in that backend's
+    own queue, so a slow backend can never hold threads another backend
+    needs. Once `max_queue` calls are waiting, new calls for that backend
+    are rejected with BackendSaturated so the caller can degrade.
+    """
+
+    def __init__(self, default_limit: int = 4, default_max_queue: int = config.GENERATION_MAX_QUEUE):
+        self.default_limit = default_limit
+        self.default_max_queue = default_max_queue
+        self._bulkheads: dict[str, _Bulkhead] = {}
+        self._lock = threading.Lock()
+
+    def configure_backend(self, backend: str, limit: int, max_queue: Optional[int] = None):
+        """Set the concurrency limit and queue bound for a backend."""
+        with self._lock:
+            if backend in self._bulkheads and self._bulkheads[backend].pool is not None:
+                raise RuntimeError(f"Backend {backend} must be configured before its first submit.")
+            self._bulkheads[backend] = _Bulkhead(
+                limit=limit, max_queue=self.default_max_queue if max_queue is None else max_queue
+            )
+
+    def submit(self, backend: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule fn(*args, **kwargs) on a backend, returning its Future.
+
+        Raises:
+            BackendSaturated: the backend is at its limit and its queue is full.
+        """
+        future: Future = Future()
+        task = (future, traced(fn), args, kwargs, time.monotonic())
+        with self._lock:
+            bulkhead = self._bulkheads.get(backend)
+            if bulkhead is None:
+                bulkhead = self._bulkheads[backend] = _Bulkhead(limit=self.default_limit, max_queue=self.default_max_queue)
+            if bulkhead.pool is None:
+                bulkhead.pool = ThreadPoolExecutor(max_workers=bulkhead.limit, thread_name_prefix=f"generation-{backend}")
+            if bulkhead.running < bulkhead.limit:
+                bulkhead.running += 1
+                bulkhead.pool.submit(self._run, bulkhead, task)
+            elif len(bulkhead.pending) < bulkhead.max_queue:
+                bulkhead.pending.append(task)
+            else:
+                bulkhead.rejected += 1
+                raise BackendSaturated(f"{backend} has {bulkhead.running} running and {len(bulkhead.pending)} queued calls")
+        return future
+
+    def _run(self, bulkhead: _Bulkhead, task: tuple):
+        """Pool thread: run a task, then hand the slot to the backend's next task."""
+        while task is not None:
+            future, fn, args, kwargs, queued_at = task
+            succeeded = None
+            if future.set_running_or_notify_cancel():
+                started = time.monotonic()
+                bulkhead.queue_time.observe(started - queued_at)
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:  # pylint: disable=broad-exception-caught
+                    succeeded = False
+                    future.set_exception(e)
+                else:
+                    succeeded = True
+                    future.set_result(result)
+                bulkhead.run_time.observe(time.monotonic() - started)
+
+            with self._lock:
+                if succeeded is not None:
+                    bulkhead.completed += succeeded
+                    bulkhead.failed += not succeeded
+                task = bulkhead.pending.popleft() if bulkhead.pending else None
+                if task is None:
+                    bulkhead.running -= 1
+
+    def saturated(self, backend: str) -> bool:
+        """True if a submit to this backend would be rejected right now."""
+        with self._lock:
+            bulkhead = self._bulkheads.get(backend)
+            return bool(bulkhead) and bulkhead.running >= bulkhead.limit and len(bulkhead.pending) >= bulkhead.max_queue
+
+    def metrics(self) -> dict:
+        """Per-backend load, rejection counts and latency histograms."""
+        with self._lock:
+            bulkheads = list(self._bulkheads.items())
+        return {
+            backend: {
+                "limit": b.limit,
+                "running": b.running,
+                "queued": len(b.pending),
+                "rejected": b.rejected,
+                "completed": b.completed,
+                "failed": b.failed,
+                "queue_time": b.queue_time.snapshot(),
+                "run_time": b.run_time.snapshot(),
+            }
+            for backend, b in bulkheads
+        }
+
+
+def build_scheduler(model_registry: ImageModelRegistry) -> GenerationScheduler:
+    """Create a scheduler with a bulkhead for every backend in the registry."""
+    generation_scheduler = GenerationScheduler()
+    limits: dict[str, int] = {}
+    for adapter in model_registry.adapters():
+        # adapters sharing a backend share its limit
+        limits[adapter.backend] = max(limits.get(adapter.backend, 0), adapter.max_concurrency)
+    limits[STUDY_BACKEND] = config.STUDY_FETCH_CONCURRENCY
+    for backend, limit in limits.items():
+        generation_scheduler.configure_backend(backend, limit)
+        log(f"Generation backend {backend}: {limit} concurrent calls", LogLevel.ON)
+    return generation_scheduler
+
+
+scheduler = build_scheduler(registry)
@@ -11,10 +11,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Optional
+from typing import Any, Callable, Hashable, Optional
 from dotenv import load_dotenv
 from google import genai
+from google.cloud import aiplatform
 import threading
+import vertexai
+from vertexai.preview.vision_models import ImageGenerationModel
 from config.default import Default
 
 load_dotenv(override=True)
@@ -64,4 +67,79 @@ class ModelSetup:
                 ModelSetup._client_cache[cache_key] = client
             else:
                 print(f"Using cached genai client for {project_id} in {location} using model: {model_id}")
-            return ModelSetup._client_cache[cache_key], model_id
\ No newline at end of file
+            return ModelSetup._client_cache[cache_key], model_id
+
+    _handle_cache: dict[Hashable, Any] = {}
+    _handle_locks: dict[Hashable, threading.Lock] = {}
+    _vertex_location: Optional[tuple[str, str]] = None
+
+    @staticmethod
+    def _cached_handle(cache_key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Returns the cached handle for cache_key, creating it once under a per-key lock."""
+        handle = ModelSetup._handle_cache.get(cache_key)
+        if handle is not None:
+            return handle
+        with ModelSetup._lock:
+            key_lock = ModelSetup._handle_locks.setdefault(cache_key, threading.Lock())
+        with key_lock:  # other keys can be created concurrently
+            if cache_key not in ModelSetup._handle_cache:
+                print(f"Creating model handle {cache_key}")
+                ModelSetup._handle_cache[cache_key] = factory()
+            return ModelSetup._handle_cache[cache_key]
+
+    @staticmethod
+    def image_model(
+        model_name: str,
+        project_id: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> ImageGenerationModel:
+        """Returns a cached Imagen model handle.
+
+        `vertexai.init` is process-global, so it is only called when the
+        project or location differs from the last initialized one.
+        """
+        project_id = project_id or config.PROJECT_ID
+        location = location or config.LOCATION
+
+        def _create() -> ImageGenerationModel:
+            with ModelSetup._lock:
+                if ModelSetup._vertex_location != (project_id, location):
+                    vertexai.init(project=project_id, location=location)
+                    ModelSetup._vertex_location = (project_id, location)
+                return ImageGenerationModel.from_pretrained(model_name)
+
+        return ModelSetup._cached_handle(("imagen", project_id, location, model_name), _create)
+
+    @staticmethod
+    def endpoint(
+        endpoint_id: str,
+        project_id: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> aiplatform.Endpoint:
+        """Returns a cached Model Garden endpoint handle.
+
+        The endpoint keeps its prediction client, so its HTTP/gRPC channel is
+        reused across predictions.
+        """
+        project_id = project_id or config.PROJECT_ID
+        location = location or config.LOCATION
+        return ModelSetup._cached_handle(
+            ("endpoint", project_id, location, endpoint_id),
+            lambda: aiplatform.Endpoint(
+                endpoint_name=f"projects/{project_id}/locations/{location}/endpoints/{endpoint_id}",
+                project=project_id,
+                location=location,
+            ),
+        )
+
+    @staticmethod
+    def warm_up(image_models: list[str], endpoint_ids: list[str]):
+        """Creates the clients and model handles used for generation ahead of the first battle."""
+        for create, name in [(ModelSetup.image_model, m) for m in image_models] + [
+            (ModelSetup.endpoint, e) for e in endpoint_ids
+        ]:
+            try:
+                create(name)
+            except Exception as e:
+                print(f"Unable to warm up {name}: {e}")
+        print(f"Warmed up {len(image_models)} image models and {len(endpoint_ids)} endpoints")
@@ -12,15 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import field
-import random
 import logging
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from typing import Optional, Sequence
+import uuid
 
 import mesop as me
 
-from common.metadata import update_elo_ratings
+from common.image_catalog import StudyImageCatalog
+from common.image_variants import VariantPipeline
+from common.matchmaker import matchmaker
+from common.metadata import record_vote
+from common.render_data import backend_call, traced
+from common.welcome import DEFAULT_WELCOME, WelcomeMessages
 from config.default import Default
 from prompts.utils import PromptManager
 from state.state import AppState
@@ -28,11 +35,7 @@ from components.header import header
 
 from models.set_up import ModelSetup, load_default_models
 
-from models.gemini_model import (
-    generate_content,
-    generate_images,
-)
-from models.generate import images_from_flux, images_from_imagen, images_from_stable_diffusion, study_fetch
+from models.battle import Battle, battle_queue, generate_battle
 
 
 # Initialize configuration
@@ -40,13 +43,16 @@ client, model_id = ModelSetup.init()
 MODEL_ID = model_id
 config = Default()
 prompt_manager = PromptManager()
+welcome_messages = WelcomeMessages()  # starts filling its pool now, before the first visitor
+# generates the next battle on a prefetch miss, while the vote is being recorded
+_next_battles = ThreadPoolExecutor(max_workers=config.NEXT_BATTLE_WORKERS, thread_name_prefix="next-battle")
+# battles still being prepared when their handler returned, by PageState.pending_battle
+_pending_battles: OrderedDict[str, Future] = OrderedDict()
+_pending_lock = threading.Lock()
+_PENDING_BATTLES_MAX = 1000
 logging.basicConfig(level=logging.DEBUG)
 
 
-IMAGEN_MODELS = [config.MODEL_IMAGEN2, config.MODEL_IMAGEN3_FAST, config.MODEL_IMAGEN3, config.MODEL_IMAGEN32,]
-GEMINI_MODELS = [config.MODEL_GEMINI2]
-
-
 @me.stateclass
 class PageState:
     """Local Page State"""
@@ -65,141 +71,148 @@ class PageState:
     chosen_model: str = ""
     study: str = "live"
     study_models: list[str] = field(default_factory=list)
+    prompts_location: str = ""
+    # the battle last voted on, revealed while the next one is shown
+    last_prompt: str = ""
+    last_models: list[str] = field(default_factory=list)
+    last_output: list[str] = field(default_factory=list)
+    last_choice: str = ""
+    revealing: bool = False  # the voted battle covers the next one; it fades out REVEAL_MIN_TIME after this clears
+    pending_battle: str = ""  # a battle not ready when its handler returned, shown by a later event
     # pylint: disable=invalid-field-call
 
 
-def arena_images(input: str, study: str):
-    """Create images for arena comparison"""
-    state = me.state(PageState)
-    if input == "":  # handle condition where someone hits "random" but doesn't modify
-        if state.arena_prompt != "":
-            input = state.arena_prompt
+def _covered_matchup(study: str, study_models: list[str], study_prompts: Sequence[str]) -> Optional[tuple[str, list[str]]]:
+    """A study battle on one of the study's prompts that both models have images for, or None if the catalog cannot tell
+
+    The catalog indexes every image of the models, so prompts outside the
+    study's set are dropped; an empty set (it could not be loaded) allows any.
+    """
+    covered = StudyImageCatalog().covered_pairs(study_models)
+    if covered is None:
+        return None
+    if study_prompts:
+        allowed = set(study_prompts)
+        covered = {pair: [prompt for prompt in prompts if prompt in allowed] for pair, prompts in covered.items()}
+    covered = {pair: prompts for pair, prompts in covered.items() if prompts}
+    if not covered:
+        logging.warning("no pair of models in study %s has images for a common prompt", study)
+        return None
+    models = matchmaker.pick_models(study, study_models, allowed=covered)
+    prompts = covered.get((models[0], models[1])) or covered[(models[1], models[0])]
+    return matchmaker.pick_prompt(study, prompts), models
+
+
+def _matchup(study: str, study_models: list[str], prompts_location: str) -> tuple[str, list[str]]:
+    """The next battle's prompt and models, chosen by the matchmaker"""
+    matchmaker.load_history(study)
+    prompts = prompt_manager.prompts(prompts_location)
+    if study != "live" and config.IMAGE_CATALOG_ENABLED:
+        matchup = _covered_matchup(study, study_models, prompts)
+        if matchup:
+            return matchup
+    prompt = matchmaker.pick_prompt(study, prompts) if prompts else prompt_manager.random_prompt(prompts_location)
+    return prompt, matchmaker.pick_models(study, study_models)
+
+
+def _battle_sampler(study: str, study_models: list[str], prompts_location: str):
+    """Returns a (prompt, models) sampler for the battle queue"""
+    models = list(study_models)
+
+    def sample() -> tuple[str, list[str]]:
+        return _matchup(study, models, prompts_location)
+
+    return sample
+
+
+def prepare_next_battle(state: PageState) -> Future:
+    """Start preparing the next battle: from the prefetch queue, or generated in the background on a miss"""
+    battle = battle_queue.get(state.study) if battle_queue else None
+    if battle:
+        logging.info("prefetched battle (%.1fs old): %s vs. %s", battle.age, battle.model1, battle.model2)
+        prepared = Future()
+        prepared.set_result(battle)
+        return prepared
+
+    backend_call("battle")
+    # page state is not available off the request thread, so copy what generation needs
+    study, study_models, prompts_location = state.study, list(state.study_models), state.prompts_location
+    aspect_ratio = state.image_aspect_ratio
+
+    def generate() -> Battle:
+        prompt, models = _matchup(study, study_models, prompts_location)
+        logging.info("%s vs. %s", models[0], models[1])
+        return generate_battle(prompt, models, study, aspect_ratio, replacements=study_models)
+
+    return _next_battles.submit(traced(generate))
+
+
+def show_battle(state: PageState, battle: Battle):
+    """Put a battle into page state"""
+    state.arena_prompt = battle.prompt
+    state.arena_model1, state.arena_model2 = battle.model1, battle.model2
     state.arena_output.clear()
+    state.arena_output.extend(image or "" for image in battle.images)  # "" keeps a missing image's place
+
+
+def swap_in(state: PageState, prepared: Future):
+    """Show a prepared battle if it is ready; otherwise show the spinner and leave it for a later event.
+
+    Handlers never wait on generation: a battle that is not ready is kept
+    in this process under `state.pending_battle`, and the next render or
+    event that finds it ready shows it (see `adopt_pending`).
+    """
+    if prepared.done():
+        _show_prepared(state, prepared)
+        return
+    token = uuid.uuid4().hex
+    with _pending_lock:
+        _pending_battles[token] = prepared
+        while len(_pending_battles) > _PENDING_BATTLES_MAX:
+            _pending_battles.popitem(last=False)
+    state.pending_battle = token
+    state.is_loading = True
+    state.revealing = False  # the reveal fades out onto the spinner
+
+
+def adopt_pending(state: PageState) -> bool:
+    """Show the battle an earlier event left pending, if it is ready; False if this process does not have it"""
+    if not state.pending_battle:
+        return True
+    with _pending_lock:
+        prepared = _pending_battles.get(state.pending_battle)
+        if prepared is not None and prepared.done():
+            del _pending_battles[state.pending_battle]
+    if prepared is None:
+        return False
+    if prepared.done():
+        _show_prepared(state, prepared)
+    return True
+
+
+def _show_prepared(state: PageState, prepared: Future):
+    """Put a finished battle into page state, ending the reveal; a failed one leaves the skip button"""
+    state.pending_battle = ""
+    state.is_loading = False
+    state.chosen_model = ""
+    state.revealing = False
+    try:
+        show_battle(state, prepared.result())
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("could not prepare the next battle: %s", e)
+        state.arena_prompt = ""
+        state.arena_output.clear()
+
+
+def on_load_arena(e: me.LoadEvent):  # pylint: disable=unused-argument
+    """Page load: the first battle is prepared in the background, with the spinner on screen"""
+    state = me.state(PageState)
+    if state.arena_prompt or state.pending_battle:
+        return
+    sync_study(state, me.state(AppState))
+    swap_in(state, prepare_next_battle(state))
+    yield
 
-    logging.info("BATTLE: %s vs. %s", state.arena_model1, state.arena_model2)
-
-    prompt = input
-    logging.info("prompt: %s", prompt)
-    if state.image_negative_prompt_input:
-        logging.info("negative prompt: %s", state.image_negative_prompt_input)
-    
-    with ThreadPoolExecutor() as executor:  # Create a thread pool
-        futures = []
-        if study == "live":
-            # model 1
-            if state.arena_model1 in IMAGEN_MODELS:
-                logging.info("model 1: %s", state.arena_model1)
-                futures.append(
-                    executor.submit(
-                        images_from_imagen,
-                        state.arena_model1,
-                        prompt,
-                        state.image_aspect_ratio,
-                    )
-                )
-            elif state.arena_model1.startswith(config.MODEL_GEMINI2):
-                logging.info("model 1: %s", state.arena_model1)
-                futures.append(
-                    executor.submit(
-                        generate_images,
-                        prompt,
-                    )
-                )
-            elif state.arena_model1.startswith(config.MODEL_FLUX1):
-                if config.MODEL_FLUX1_ENDPOINT_ID:
-                    logging.info("model 1: %s", state.arena_model1)
-                    futures.append(
-                        executor.submit(
-                            images_from_flux,
-                            state.arena_model1,
-                            prompt,
-                            state.image_aspect_ratio,
-                        )
-                    )
-                else:
-                    logging.error("no endpoint defined for %s", state.arena_model1)
-            elif state.arena_model1.startswith(config.MODEL_STABLE_DIFFUSION):
-                if config.MODEL_STABLE_DIFFUSION_ENDPOINT_ID:
-                    logging.info("model 1: %s", state.arena_model1)
-                    futures.append(
-                        executor.submit(
-                            images_from_stable_diffusion,
-                            state.arena_model1,
-                            prompt,
-                            state.image_aspect_ratio,
-                        )
-                    )
-                else:
-                    logging.error("no endpoint defined for %s", state.arena_model1)
-
-            # model 2
-            if state.arena_model2 in IMAGEN_MODELS:
-                logging.info("model 2: %s", state.arena_model2)
-                futures.append(
-                    executor.submit(
-                        images_from_imagen,
-                        state.arena_model2,
-                        prompt,
-                        state.image_aspect_ratio,
-                    )
-                )
-            elif state.arena_model2.startswith(config.MODEL_GEMINI2):
-                logging.info("model 2: %s", state.arena_model2)
-                futures.append(
-                    executor.submit(
-                        generate_images,
-                        prompt,
-                    )
-                )
-            elif state.arena_model2.startswith(config.MODEL_FLUX1):
-                if config.MODEL_FLUX1_ENDPOINT_ID:
-                    logging.info("model 2: %s", state.arena_model2)
-                    futures.append(
-                        executor.submit(
-                            images_from_flux,
-                            state.arena_model2,
-                            prompt,
-                            state.image_aspect_ratio,
-                        )
-                    )
-                else:
-                    logging.error("no endpoint defined for %s", state.arena_model2)
-            elif state.arena_model2.startswith(config.MODEL_STABLE_DIFFUSION):
-                if config.MODEL_STABLE_DIFFUSION_ENDPOINT_ID:
-                    logging.info("model 2: %s", state.arena_model2)
-                    futures.append(
-                        executor.submit(
-                            images_from_stable_diffusion,
-                            state.arena_model2,
-                            prompt,
-                            state.image_aspect_ratio,
-                        )
-                    )
-                else:
-                    logging.error("no endpoint defined for %s", state.arena_model2)
-        # Fetch images from study
-        else:
-            futures.extend([
-                executor.submit(
-                    study_fetch,
-                    state.arena_model1,
-                    prompt
-                ),
-                executor.submit(
-                    study_fetch,
-                    state.arena_model2,
-                    prompt
-                )
-            ])
-        
-        for future in as_completed(futures):  # Wait for tasks to complete
-            try:
-                result = future.result()  # Get the result of each task
-                state.arena_output.extend(
-                    result
-                )  # Assuming images_from_imagen returns a list
-            except Exception as e:
-                logging.error(f"Error during image generation: {e}")
 
 def on_click_reload_arena(e: me.ClickEvent):  # pylint: disable=unused-argument
     """Reload arena handler"""
@@ -207,81 +220,84 @@ def on_click_reload_arena(e: me.ClickEvent):  # pylint: disable=unused-argument
     if state.study == "live":
         state.study_models = load_default_models()
 
-    state.arena_prompt = prompt_manager.random_prompt()
-
     state.arena_output.clear()
-
-    state.is_loading = True
-    yield
+    state.revealing = False
     print(f"Use {state.study_models}")
+    swap_in(state, prepare_next_battle(state))
+    yield
 
-    # get random images
-    state.arena_model1, state.arena_model2 = random.sample(state.study_models, 2)
-    logging.info("%s vs. %s", state.arena_model1, state.arena_model2)
-    arena_images(state.arena_prompt, state.study)
 
-    state.is_loading = False
+def on_click_show_pending(e: me.ClickEvent):  # pylint: disable=unused-argument
+    """Show the pending battle once it is ready; prepare another if this process does not have it"""
+    state = me.state(PageState)
+    if not adopt_pending(state):
+        swap_in(state, prepare_next_battle(state))
     yield
 
 
 def on_click_arena_vote(e: me.ClickEvent):
-    """Arena vote handler"""
+    """Arena vote handler
+
+    The next battle is started as the vote arrives. The first yield covers
+    the battle with its reveal; once the next battle is in page state the
+    reveal is cleared, and the browser keeps it on screen for another
+    REVEAL_MIN_TIME seconds before fading it out. The handler never waits on
+    generation: a battle that is not ready yet is shown by a later event.
+    """
     state = me.state(PageState)
     model_name = getattr(state, e.key)
     logging.info("user preferred %s: %s", e.key, model_name)
+    prepared = prepare_next_battle(state)
     state.chosen_model = model_name
+    state.last_prompt = state.arena_prompt
+    state.last_models = [state.arena_model1, state.arena_model2]
+    state.last_output = list(state.arena_output)
+    state.last_choice = model_name
+    state.revealing = True
     yield
-    # update the elo ratings
-    update_elo_ratings(state.arena_model1, state.arena_model2, model_name, state.arena_output, state.arena_prompt, state.study)
-    yield
-    time.sleep(int(Default.SHOW_RESULTS_PAUSE_TIME))
+    # log the vote; ratings are updated in the background
+    record_vote(state.arena_model1, state.arena_model2, model_name, state.arena_output, state.arena_prompt, state.study)
+    # a queued battle is ready now; a generated one was started with the reveal
+    swap_in(state, prepared)
     yield
-    # clear the output and reload
-    state.arena_output.clear()
-    state.chosen_model = ""
-    state.arena_prompt = prompt_manager.random_prompt()
-    state.arena_model1, state.arena_model2 = random.sample(state.study_models, 2)
-    yield
-    arena_images(state.arena_prompt, state.study)
-    yield
-
-
-WELCOME_PROMPT = """
-Welcome the user to the battle of the generative media images, and encourage participation by asserting their voting on the images presented. 
-This should be one or two sentences.
-"""
 
 
 def reload_welcome(e: me.ClickEvent):  # pylint: disable=unused-argument
-    """Handle regeneration of welcome message event"""
+    """Handle regeneration of welcome message event: another pre-generated message"""
     app_state = me.state(AppState)
-    app_state.welcome_message = generate_welcome()
+    app_state.welcome_message = welcome_messages.get(current=app_state.welcome_message)
     yield
 
 
-def generate_welcome() -> str:
-    """Generate a nice welcome message with Gemini 2.0"""
-    return generate_content(WELCOME_PROMPT)
+def sync_study(page_state: PageState, app_state: AppState):
+    """Copy the active study into page state, and start loading its images and battles"""
+    page_state.study = app_state.study
+    page_state.prompts_location = app_state.study_prompts_location
+    if page_state.study == "live":
+        app_state.study_models = load_default_models()
+    page_state.study_models = app_state.study_models
+    if page_state.study != "live" and config.IMAGE_CATALOG_ENABLED:
+        StudyImageCatalog().watch(page_state.study_models)  # loads in the background
+    print(f"======> Starting Page state study models: {page_state.study_models}")
+    if battle_queue:
+        battle_queue.configure(
+            page_state.study,
+            _battle_sampler(app_state.study, page_state.study_models, app_state.study_prompts_location),
+            page_state.image_aspect_ratio,
+        )
 
 
 def arena_page_content(app_state: me.state):
     """Arena Mesop Page"""
 
     page_state = me.state(PageState)
-    prompt_manager.prompts_location = app_state.study_prompts_location
-    page_state.study = app_state.study
-    if page_state.study == "live":
-        app_state.study_models = load_default_models()
-    page_state.study_models = app_state.study_models
-    print(f"======> Starting Page state study models: {page_state.study_models}")
+    sync_study(page_state, app_state)
+    adopt_pending(page_state)
 
-    # TODO this is an initialization function that should be extracted
-    if not app_state.welcome_message:
-        app_state.welcome_message = generate_welcome()
-    if not page_state.arena_prompt:
-        page_state.arena_prompt = prompt_manager.random_prompt()
-        page_state.arena_model1, page_state.arena_model2 = random.sample(app_state.study_models, 2)
-        arena_images(page_state.arena_prompt, app_state.study)
+    # a pooled message once the pool has one; never waits on Gemini
+    if app_state.welcome_message in ("", DEFAULT_WELCOME):
+        app_state.welcome_message = welcome_messages.get()
+    # the first battle is prepared by on_load_arena, never during a render
 
     with me.box(
         style=me.Style(
@@ -360,15 +376,20 @@ def arena_page_content(app_state: me.state):
 
                     # Image outputs
                     with me.box(style=_BOX_STYLE):
+                        if page_state.last_choice:
+                            _reveal(page_state)
                         if page_state.is_loading:
                             with me.box(
                                 style=me.Style(
                                     display="grid",
                                     justify_content="center",
                                     justify_items="center",
+                                    gap=10,
                                 )
                             ):
                                 me.progress_spinner()
+                                if page_state.pending_battle:
+                                    me.button("Show next battle", on_click=on_click_show_pending, type="stroked")
                         if len(page_state.arena_output) != 0:
                             with me.box(
                                 style=me.Style(
@@ -385,13 +406,16 @@ def arena_page_content(app_state: me.state):
                                 ):
                                     for idx, img in enumerate(page_state.arena_output, start=1):
                                         print(f"===> idx: {idx}, img: {img}")
+                                        if not img:
+                                            continue  # this model has no image
                                         model_name = f"arena_model{idx}"
                                         model_value = getattr(page_state, model_name)
 
                                         replace_url = "https://storage.mtls.cloud.google.com/"
                                         if Default.PUBLIC_BUCKET:
                                             replace_url = "https://storage.googleapis.com/"
-                                        img_url = img.replace(
+                                        # a 768px variant, where one exists, instead of the full-size original
+                                        img_url = VariantPipeline().best(img, "display").replace(
                                             "gs://",
                                             replace_url
                                         )
@@ -435,7 +459,7 @@ def arena_page_content(app_state: me.state):
 
                                 me.box(style=me.Style(height=15))
 
-                                if len(page_state.arena_output) != 2:
+                                if len(page_state.arena_output) != 2 or not all(page_state.arena_output) or page_state.is_loading:
                                     disabled_choice = True
                                 else:
                                     disabled_choice = False
@@ -491,8 +515,96 @@ def arena_page_content(app_state: me.state):
                     # show user choice
                     if page_state.chosen_model:
                         me.text(f"You voted {page_state.chosen_model}")
+                    elif page_state.last_choice:
+                        _last_round(page_state)
+
+
+def _reveal(page_state: PageState):
+    """The battle just voted on, with its models revealed, laid over the next battle.
+
+    It is always rendered once a vote exists, so clearing `revealing` changes
+    the style of an element already on screen, and the delayed transition
+    keeps it visible for REVEAL_MIN_TIME seconds without the server waiting.
+    """
+    replace_url = "https://storage.googleapis.com/" if Default.PUBLIC_BUCKET else "https://storage.mtls.cloud.google.com/"
+    with me.box(style=_reveal_style(page_state.revealing)):
+        with me.box(style=me.Style(display="flex", flex_direction="row", gap=15, justify_content="center")):
+            for model_value, img in zip(page_state.last_models, page_state.last_output):
+                if not img:
+                    continue
+                img_url = VariantPipeline().best(img, "display").replace("gs://", replace_url)
+                with me.box(style=me.Style(display="flex", flex_direction="column", align_items="center")):
+                    me.image(
+                        src=img_url,
+                        style=_REVEAL_WINNER_STYLE if model_value == page_state.last_choice else _REVEAL_LOSER_STYLE,
+                    )
+                    me.text(model_value, style=me.Style(font_weight="bold" if model_value == page_state.last_choice else None))
+
+
+def _last_round(page_state: PageState):
+    """The battle last voted on, with its models revealed"""
+    replace_url = "https://storage.googleapis.com/" if Default.PUBLIC_BUCKET else "https://storage.mtls.cloud.google.com/"
+    with me.box(
+        style=me.Style(
+            display="flex",
+            flex_direction="column",
+            align_items="center",
+            gap=5,
+            margin=me.Margin(top=20),
+        )
+    ):
+        me.text(f"You voted {page_state.last_choice}", style=me.Style(font_weight="bold"))
+        me.text(page_state.last_prompt, style=me.Style(font_style="italic", font_size=12))
+        with me.box(style=me.Style(display="flex", flex_direction="row", gap=15)):
+            for model_value, img in zip(page_state.last_models, page_state.last_output):
+                img_url = VariantPipeline().best(img, "thumb").replace("gs://", replace_url)
+                with me.box(style=me.Style(display="flex", flex_direction="column", align_items="center")):
+                    me.image(
+                        src=img_url,
+                        style=_LAST_ROUND_STYLE if model_value == page_state.last_choice else _LAST_ROUND_LOSER_STYLE,
+                    )
+                    me.text(model_value, style=me.Style(font_size=12))
+
+
+def _reveal_style(revealing: bool) -> me.Style:
+    """The reveal covers the battle box; once it is cleared it stays REVEAL_MIN_TIME seconds, then fades out"""
+    return me.Style(
+        position="absolute",
+        top=0,
+        left=0,
+        right=0,
+        bottom=0,
+        z_index=1,
+        display="flex",
+        align_items="center",
+        justify_content="center",
+        background=me.theme_var("background"),
+        border_radius=12,
+        opacity=1 if revealing else 0,
+        visibility="visible" if revealing else "hidden",
+        transition=(
+            None
+            if revealing
+            else f"opacity 0.3s ease {config.REVEAL_MIN_TIME}s, visibility 0s linear {config.REVEAL_MIN_TIME + 0.3}s"
+        ),
+    )
 
 
+_REVEAL_WINNER_STYLE = me.Style(
+    width="450px",
+    margin=me.Margin(top=10),
+    border_radius="35px",
+    border=me.Border().all(me.BorderSide(color="green", style="inset", width="5px")),
+)
+_REVEAL_LOSER_STYLE = me.Style(width="450px", margin=me.Margin(top=10), border_radius="35px", opacity=0.5)
+
+_LAST_ROUND_STYLE = me.Style(
+    width="100px",
+    border_radius="12px",
+    border=me.Border().all(me.BorderSide(color="green", style="inset", width="3px")),
+)
+_LAST_ROUND_LOSER_STYLE = me.Style(width="100px", border_radius="12px", opacity=0.5)
+
 _BOX_STYLE = me.Style(
     flex_basis="max(480px, calc(50% - 48px))",
     background=me.theme_var("background"),
@@ -502,4 +614,5 @@ _BOX_STYLE = me.Style(
     display="flex",
     flex_direction="column",
     width="100%",
+    position="relative",  # for the reveal laid over the battle
 )
@@ -12,9 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """ History page"""
+import math
+from typing import Optional
+
 import mesop as me
 
-from common.metadata import get_latest_votes
+from common.image_variants import VariantPipeline
+from common.metadata import get_vote_page
 
 from components.header import header
 from components.dialog import dialog
@@ -29,6 +33,9 @@ from components.page_scaffold import (
 class PageState:
     is_open: bool = False
     image_url: str = ""
+    feed_study: str = ""  # cleared on each visit, so a new visit re-reads the newest votes
+    pages: int = 1  # pages of votes shown
+    reload: bool = False  # Refresh: read the newest votes from Firestore, not the cache
 
 
 def history_page_content(app_state: me.state):
@@ -38,8 +45,18 @@ def history_page_content(app_state: me.state):
             page_state = me.state(PageState)
             header("History", "history")
 
-            votes = get_latest_votes(app_state.study)
-            print(f"retrieved {len(votes)} votes")
+            # re-renders (e.g. the image dialog) reuse the pages this visit read; a new visit
+            # revalidates the newest page after VOTE_FEED_TTL, and Refresh always re-reads it
+            max_age = math.inf
+            if page_state.feed_study != app_state.study:
+                page_state.feed_study = app_state.study
+                page_state.pages = 1
+                max_age = None
+            if page_state.reload:
+                page_state.reload = False
+                max_age = 0
+            votes, more = _load_votes(app_state.study, page_state.pages, max_age)
+            me.button("Refresh", on_click=on_click_refresh, type="stroked")
 
             with dialog(  # pylint: disable=not-context-manager
                 is_open=page_state.is_open,
@@ -73,9 +90,11 @@ def history_page_content(app_state: me.state):
                             gap=10,
                         )
                     ):
-                        # images
+                        # images: the dialog shows the original, the list a thumbnail variant
                         image1_url = gcs_to_http(image1)
                         image2_url = gcs_to_http(image2)
+                        thumb1_url = gcs_to_http(_thumbnail(image1, v.get("variants1")))
+                        thumb2_url = gcs_to_http(_thumbnail(image2, v.get("variants2")))
                         with me.box(
                             style=me.Style(
                                 display="flex",
@@ -102,7 +121,7 @@ def history_page_content(app_state: me.state):
                                     ),
                                 ):
                                     me.image(
-                                        src=image1_url,
+                                        src=thumb1_url,
                                         style=(
                                             WINNER_THUMBNAIL_STYLE if winner == model1 else THUMBNAIL_STYLE
                                         ),
@@ -122,7 +141,7 @@ def history_page_content(app_state: me.state):
                                     ),
                                 ):
                                     me.image(
-                                        src=image2_url,
+                                        src=thumb2_url,
                                         style=(
                                             WINNER_THUMBNAIL_STYLE if winner == model2 else THUMBNAIL_STYLE
                                         ),
@@ -136,6 +155,39 @@ def history_page_content(app_state: me.state):
                             )
                             me.html(html=f'With prompt: "<em>{prompt}</em>"')
 
+                if more:
+                    me.button("Load more", on_click=on_click_load_more, type="stroked")
+
+
+def _load_votes(study: str, pages: int, max_age: Optional[float]) -> tuple[list[dict], bool]:
+    """The first `pages` pages of votes, and whether there are more; pages already read come from the VoteFeed cache"""
+    votes, cursor = [], None
+    for _ in range(pages):
+        page, cursor = get_vote_page(study, after=cursor, max_age=max_age)
+        votes.extend(page)
+        if cursor is None:
+            break
+    return votes, cursor is not None
+
+
+def on_click_load_more(e: me.ClickEvent):  # pylint: disable=unused-argument
+    """fetch the next page of votes"""
+    page_state = me.state(PageState)
+    page_state.pages += 1
+
+
+def on_click_refresh(e: me.ClickEvent):  # pylint: disable=unused-argument
+    """show the newest votes"""
+    page_state = me.state(PageState)
+    page_state.feed_study = ""
+    page_state.reload = True
+
+
+def on_load_history(e: me.LoadEvent):  # pylint: disable=unused-argument
+    """a new visit to the page: show the newest votes"""
+    page_state = me.state(PageState)
+    page_state.feed_study = ""
+
 
 def on_click_image_dialog(e: me.ClickEvent):
     """show larger image"""
@@ -150,6 +202,11 @@ def on_click_background_close(e: me.ClickEvent):
     page_state.is_open = False
 
 
+def _thumbnail(gcs_uri: str, variants: Optional[dict[str, str]]) -> str:
+    """The image's thumbnail variant, recorded with the vote or known to this process, else the image"""
+    return (variants or {}).get("thumb") or VariantPipeline().best(gcs_uri, "thumb")
+
+
 def gcs_to_http(gcs_uri: str) -> str:
     """replaces gcsuri with http uri"""
     return gcs_uri.replace(
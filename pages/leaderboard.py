@@ -12,13 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import mesop as me
+import pandas as pd
 
 from components.header import header
 from components.page_scaffold import (
     page_scaffold,
     page_frame,
 )
-from common.metadata import get_elo_ratings
+from components.rating_chart import rating_chart
+from common.metadata import get_leaderboard
+from common.rating_history import get_rating_history
+
+
+def _leaderboard_data(study: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """The study's ratings table and rating history; both are served from the LeaderboardCache, so no loader"""
+    return get_leaderboard(study), get_rating_history(study)
 
 
 def leaderboard_page_content(app_state: me.state):
@@ -27,7 +35,7 @@ def leaderboard_page_content(app_state: me.state):
         with page_frame():  # pylint: disable=not-context-manager
             header("Leaderboard", "leaderboard")
 
-            df = get_elo_ratings(app_state.study)
+            df, history = _leaderboard_data(app_state.study)
 
             with me.box(
                 style=me.Style(align_items="center", display="flex", justify_content="space-evenly")
@@ -42,3 +50,8 @@ def leaderboard_page_content(app_state: me.state):
                             "Index": me.TableColumn(sticky=True),
                         },
                     )
+
+            with me.box(style=me.Style(display="flex", justify_content="center")):
+                with me.box(style=me.Style(padding=me.Padding.all(10), width=720)):
+                    me.text("Rating history", type="headline-6")
+                    rating_chart(history)
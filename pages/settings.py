@@ -19,9 +19,20 @@ from components.page_scaffold import (
     page_frame,
 )
 
-from typing import Any
+from typing import Any, Optional
 from config.default import Default
 from config.firebase_config import FirebaseClient
+from common.image_catalog import StudyImageCatalog
+from common.image_variants import VariantPipeline
+from common.leaderboard import LeaderboardCache
+from common.metadata import MetadataWriter, vote_log
+from common.render_data import RenderData, backend_call, loader
+from common.storage import BlobCache
+from common.welcome import WelcomeMessages
+from common.rating_history import RatingHistoryWriter
+from models.battle import battle_queue, generation_metrics
+from models.scheduler import scheduler
+from prompts.utils import PromptManager
 
 import asyncio
 from google.cloud.firestore import AsyncClient, FieldFilter
@@ -44,7 +55,23 @@ def settings_page_content(app_state: me.state):
 
             me.box(style=me.Style(height=16))
 
-            me.text(f"Vote pause time: {Default.SHOW_RESULTS_PAUSE_TIME} seconds")
+            me.text(f"Next battle workers: {Default.NEXT_BATTLE_WORKERS}")
+
+            if battle_queue:
+                _render_battle_queue_metrics(battle_queue.metrics(), app_state)
+
+            _render_scheduler_metrics(scheduler.metrics(), generation_metrics())
+
+            _render_metadata_writer_metrics(MetadataWriter().metrics())
+            _render_vote_log_metrics(vote_log.metrics())
+            _render_rating_history_metrics(RatingHistoryWriter().metrics())
+            _render_prompt_cache_metrics(PromptManager().metrics())
+            _render_blob_cache_metrics(BlobCache().metrics())
+            _render_variant_metrics(VariantPipeline().metrics())
+            _render_render_data_metrics(RenderData().metrics())
+            _render_welcome_metrics(WelcomeMessages().metrics())
+            if app_state.study != "live" and cnfg.IMAGE_CATALOG_ENABLED:
+                _render_coverage_stats(StudyImageCatalog().coverage_stats(app_state.study_models))
 
 
 async def _purge_elo_ratings(study: str) -> bool:
@@ -74,8 +101,10 @@ async def _purge_elo_ratings(study: str) -> bool:
 
     return all(results)
 
+@loader("settings")
 def _get_studies() -> dict[dict[str, Any]]:
     """ Get all Studies """
+    backend_call("firestore.studies")
     studies = dict()
     docs = db.collection(cnfg.STUDY_COLLECTION_NAME).stream()
     for doc in docs:
@@ -93,6 +122,7 @@ def _render_study_info(studies: dict[dict[str, Any]], app_state: me.state):
     
     def _handle_purge(study: me.ClickEvent):
         asyncio.run(_purge_elo_ratings(study=study.key))
+        LeaderboardCache().invalidate(study.key)
     
     if len(studies):
         me.text("Available Studies", type="headline-5")
@@ -150,6 +180,142 @@ def _render_study_info(studies: dict[dict[str, Any]], app_state: me.state):
     else:
         me.markdown("No Studies found")
 
+def _render_battle_queue_metrics(metrics: dict[str, Any], app_state: me.state):
+    """Render the battle prefetch queue metrics"""
+    me.box(style=me.Style(height=16))
+    me.text("Battle Queue", type="headline-5")
+    me.text(f"Prefetched battles ready: {metrics['depth'].get(app_state.study, 0)}")
+    me.text(f"Hit rate: {metrics['hit_rate']:.0%} ({metrics['hits']} hits, {metrics['misses']} misses)")
+    me.text(f"Served battle age: {metrics['mean_served_age']:.1f}s mean, {metrics['max_served_age']:.1f}s max")
+    me.text(f"Expired: {metrics['expired']}, failed generations: {metrics['failed']}")
+
+def _render_scheduler_metrics(metrics: dict[str, Any], battle_metrics: dict[str, int]):
+    """Render per-backend generation load and latency"""
+    me.box(style=me.Style(height=16))
+    me.text("Generation Backends", type="headline-5")
+    me.text(
+        f"Deadline misses: {battle_metrics['timeouts']}, hedges: {battle_metrics['hedges']} "
+        f"({battle_metrics['hedge_wins']} won), cached fallbacks: {battle_metrics['cached_fallbacks']}, "
+        f"replacements: {battle_metrics['replacements']}, unfilled sides: {battle_metrics['failed_sides']}"
+    )
+    me.text(
+        f"RSS after the last battle: {battle_metrics['rss_last_battle_mb']:.0f} MiB, "
+        f"largest increase during a battle: {battle_metrics['rss_max_battle_growth_mb']:.0f} MiB, "
+        f"process peak: {battle_metrics['peak_rss_mb']:.0f} MiB"
+    )
+    for backend, m in metrics.items():
+        me.text(
+            f"{backend}: {m['running']}/{m['limit']} running, {m['queued']} queued, {m['rejected']} rejected, "
+            f"queue p95 {m['queue_time']['p95'] or 0}s, run p95 {m['run_time']['p95'] or 0}s"
+        )
+
+def _render_metadata_writer_metrics(metrics: dict[str, Any]):
+    """Render the background image metadata writer's queue"""
+    me.box(style=me.Style(height=16))
+    me.text("Image Metadata Writer", type="headline-5")
+    me.text(
+        f"Queued: {metrics['depth']}, written: {metrics['written']} in {metrics['batches']} batches, "
+        f"failed (requeued): {metrics['failed']}, spilled: {metrics['spilled']}, replayed: {metrics['replayed']}, flush p95 {metrics['flush_latency']['p95'] or 0}s"
+    )
+
+
+def _render_vote_log_metrics(metrics: dict[str, Any]):
+    """Render the durable vote log's backlog"""
+    me.box(style=me.Style(height=16))
+    me.text("Vote Log", type="headline-5")
+    me.text(
+        f"Pending: {metrics['pending']} (oldest {metrics['oldest_age']:.1f}s), appended: {metrics['appended']}, "
+        f"delivered: {metrics['drained']}, failed batches: {metrics['failed_batches']}"
+    )
+
+
+def _render_rating_history_metrics(metrics: dict[str, Any]):
+    """Render the Spanner rating history writer's backlog"""
+    me.box(style=me.Style(height=16))
+    me.text("Rating History Writer", type="headline-5")
+    me.text(
+        f"Pending: {metrics['pending']}, rows: {metrics['rows']} in {metrics['commits']} commits, "
+        f"failed: {metrics['failed']}, commit p95 {metrics['commit_latency']['p95'] or 0}s"
+    )
+
+
+def _render_prompt_cache_metrics(metrics: dict[str, Any]):
+    """Render the per-location prompt list cache"""
+    me.box(style=me.Style(height=16))
+    me.text("Prompt Cache", type="headline-5")
+    me.text(
+        f"Hits: {metrics['hits']}, revalidated: {metrics['revalidations']}, loaded: {metrics['loads']}, "
+        f"evicted: {metrics['evictions']}, errors: {metrics['errors']}"
+    )
+    for location, count in metrics["locations"].items():
+        me.text(f"{location}: {count} prompts")
+
+
+def _render_blob_cache_metrics(metrics: dict[str, Any]):
+    """Render the downloaded GCS object cache"""
+    me.box(style=me.Style(height=16))
+    me.text("Blob Cache", type="headline-5")
+    me.text(
+        f"{metrics['entries']} objects, {metrics['bytes'] / 2**20:.1f} MiB in memory; hits: {metrics['hits']}, "
+        f"revalidated: {metrics['revalidations']}, from disk: {metrics['disk_hits']}, downloads: {metrics['misses']}, "
+        f"shared downloads: {metrics['coalesced']}, evicted: {metrics['evictions']}"
+    )
+
+
+def _render_variant_metrics(metrics: dict[str, Any]):
+    """Render the image variant pipeline"""
+    me.box(style=me.Style(height=16))
+    me.text("Image Variants", type="headline-5")
+    saving = f", {metrics['original_bytes'] / metrics['variant_bytes']:.1f}x smaller" if metrics["variant_bytes"] else ""
+    me.text(
+        f"Created for {metrics['created']} images{saving}; pending: {metrics['pending']}, failed: {metrics['failed']}, "
+        f"known: {metrics['known']}, looked up: {metrics['lookups']}"
+    )
+
+
+def _render_render_data_metrics(metrics: dict[str, Any]):
+    """Render the page data loaders and the backend calls of page renders"""
+    me.box(style=me.Style(height=16))
+    me.text("Page Renders", type="headline-5")
+    me.text(f"Loader hits: {metrics['hits']}, loads: {metrics['loads']}, invalidations: {metrics['invalidations']}")
+    for page, m in metrics["pages"].items():
+        last = ", ".join(f"{name} {count}" for name, count in m["last"].items()) or "none"
+        me.text(
+            f"{page}: {m['renders']} renders, {m['quiet_renders']} without backend calls, "
+            f"{m['backend_calls']} calls in total; last render: {last}"
+        )
+
+
+def _render_welcome_metrics(metrics: dict[str, Any]):
+    """Render the welcome message pool"""
+    me.box(style=me.Style(height=16))
+    me.text("Welcome Messages", type="headline-5")
+    me.text(
+        f"Pooled: {metrics['pooled']}, generated: {metrics['generated']}, failed: {metrics['failed']}, "
+        f"served: {metrics['served']}, defaults served: {metrics['defaults']}"
+    )
+
+
+def _render_coverage_stats(stats: Optional[dict[str, Any]]):
+    """Render how well the current study's images cover its prompts and models"""
+    me.box(style=me.Style(height=16))
+    me.text("Study Image Coverage", type="headline-5")
+    if stats is None:
+        me.text("The study's image catalog is still loading.")
+        return
+    fully_covered = f"{stats['fully_covered'] / stats['prompts']:.0%}" if stats["prompts"] else "n/a"
+    me.text(
+        f"{stats['images']} images for {stats['prompts']} prompts; "
+        f"{stats['fully_covered']} prompts ({fully_covered}) have images from every model"
+    )
+    me.text(
+        "Prompts per model: " + ", ".join(f"{model} {count}" for model, count in stats["prompts_per_model"].items())
+    )
+    if stats["prompts_per_pair"]:
+        me.text(f"Shared prompts per pair: {min(stats['prompts_per_pair'].values())} min")
+    if stats["uncovered_pairs"]:
+        me.text(f"Pairs that can never battle: {', '.join(stats['uncovered_pairs'])}")
+
 _BOX_STYLE = me.Style(
     flex_basis="max(480px, calc(50% - 48px))",
     background=me.theme_var("background"),
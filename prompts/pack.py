@@ -0,0 +1,177 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Memory-mapped prompt packs, for prompt sets too large to hold as Python lists
+
+A pack is one file:
+
+    header   magic, version, flags, prompt count, and the position of each column
+    column   (count + 1) little-endian uint64 offsets, then the UTF-8 text they index
+
+The prompt column is always present; the ID and tag columns are optional.
+Tags are stored joined by TAG_SEPARATOR. Packs are built by
+scripts/build_prompt_pack.py and mapped read-only, so every worker on a
+host shares the same page cache copy.
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+import mmap
+import os
+import random
+import re
+import struct
+from typing import Iterable, Optional, Union
+
+from google.cloud import storage
+
+from common.storage import StorageSession
+from config.default import Default
+
+
+config = Default()
+
+PACK_SUFFIX = ".ppk"
+MAGIC = b"ARENAPPK"
+VERSION = 1
+TAG_SEPARATOR = "\x1f"
+_HEADER = struct.Struct("<8sIIQ6Q")  # magic, version, flags, count, (offsets, text) position per column
+_OFFSET = struct.Struct("<2Q")  # start and end of one entry
+_HAS_IDS, _HAS_TAGS = 1, 2
+
+PromptRecord = Union[str, dict]
+
+
+class PromptPack(Sequence):
+    """A read-only, memory-mapped sequence of prompts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"{path} is not a prompt pack.")
+        magic, version, self._flags, self._count, *columns = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} prompt pack.")
+        self._columns = list(zip(columns[::2], columns[1::2]))
+
+    def _entry(self, column: int, index: int) -> str:
+        if not -self._count <= index < self._count:
+            raise IndexError("prompt index out of range")
+        offsets, text = self._columns[column]
+        start, end = _OFFSET.unpack_from(self._map, offsets + 8 * (index % self._count))
+        return self._map[text + start : text + end].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._entry(0, i) for i in range(*index.indices(self._count))]
+        return self._entry(0, index)
+
+    def prompt_id(self, index: int) -> Optional[str]:
+        """The prompt's ID, if the pack has them."""
+        return self._entry(1, index) if self._flags & _HAS_IDS else None
+
+    def tags(self, index: int) -> list[str]:
+        """The prompt's tags, if the pack has them."""
+        if not self._flags & _HAS_TAGS:
+            return []
+        tags = self._entry(2, index)
+        return tags.split(TAG_SEPARATOR) if tags else []
+
+    def choice(self, rng: random.Random = random) -> Optional[str]:
+        """A prompt chosen uniformly at random, in constant time."""
+        return self[rng.randrange(self._count)] if self._count else None
+
+    def close(self):
+        self._map.close()
+
+
+def write_pack(path: str, records: Iterable[PromptRecord]) -> int:
+    """
+    Write prompts to a pack file, atomically.
+
+    Args:
+        path: the pack file to write.
+        records: prompts, each a string or a dict with "prompt" and optional "id" and "tags".
+    Returns:
+        The number of prompts written.
+    """
+    columns = [(bytearray(), [0]), (bytearray(), [0]), (bytearray(), [0])]
+    flags = 0
+    for record in records:
+        if isinstance(record, str):
+            record = {"prompt": record}
+        values = [record["prompt"], record.get("id"), record.get("tags")]
+        if values[1] is not None:
+            flags |= _HAS_IDS
+        if values[2]:
+            flags |= _HAS_TAGS
+        values[1] = "" if values[1] is None else str(values[1])
+        values[2] = TAG_SEPARATOR.join(values[2] or [])
+        for (text, offsets), value in zip(columns, values):
+            text += value.encode("utf-8")
+            offsets.append(len(text))
+
+    count = len(columns[0][1]) - 1
+    present = [True, bool(flags & _HAS_IDS), bool(flags & _HAS_TAGS)]
+    positions, position = [], _HEADER.size
+    for (text, offsets), keep in zip(columns, present):
+        if not keep:
+            positions += [0, 0]
+            continue
+        positions += [position, position + 8 * len(offsets)]
+        position += 8 * len(offsets) + len(text)
+        position += -position % 8  # keep each column's offsets aligned
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, flags, count, *positions))
+        for (text, offsets), keep in zip(columns, present):
+            if keep:
+                f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+                f.write(text)
+                f.write(b"\0" * (-f.tell() % 8))
+    os.replace(tmp_path, path)
+    return count
+
+
+def is_pack(location: str) -> bool:
+    return location.endswith(PACK_SUFFIX)
+
+
+def local_copy(blob: storage.Blob) -> str:
+    """Path of this host's copy of a pack blob's generation, downloading it if needed.
+
+    `blob` must have been reloaded, so its generation is known.
+    """
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{blob.bucket.name}/{blob.name}")
+    path = os.path.join(config.PROMPT_PACK_DIR, f"{name}.{blob.generation}{PACK_SUFFIX}")
+    if not os.path.exists(path):
+        os.makedirs(config.PROMPT_PACK_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        blob.download_to_filename(tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def open_pack(location: str) -> PromptPack:
+    """The pack at a local path or gs:// URI."""
+    if location.startswith("gs://"):
+        blob = StorageSession().blob(location)
+        blob.reload()
+        location = local_copy(blob)
+    return PromptPack(location)
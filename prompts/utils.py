@@ -13,78 +13,161 @@
 # limitations under the License.
 """ Utility functions for prompts """
 from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 import json
+import os
 import random
+import threading
+import time
+from typing import Any, Optional, Sequence
 
 from google.api_core import exceptions as gapic_exceptions
+from google.cloud import storage
 
-from common.storage import download_gcs_blob
+from common.render_data import backend_call
+from common.storage import StorageSession, download_gcs_blob
 from config.default import Default
+from prompts.pack import PromptPack, is_pack, local_copy
 
 config = Default()
 
+
+@dataclass
+class _PromptSet:
+    prompts: Sequence[str]
+    generation: Any  # GCS generation or local mtime the prompts were loaded from
+    checked_at: float
+
+
 class PromptManager:
-    """Singleton class to manage and provide image generation prompts"""
+    """Singleton class to manage and provide image generation prompts
+
+    Prompt lists are cached per location, for the PROMPT_CACHE_SIZE most
+    recently used locations. Once an entry is PROMPT_REVALIDATE_INTERVAL
+    seconds old, the next read compares the GCS object's generation (or the
+    local file's mtime) with the cached one and downloads the list again
+    only if it changed. Every call names its location, so studies sharing
+    a worker never see each other's prompts.
+    """
     _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(PromptManager, cls).__new__(cls)
+                instance._sets = OrderedDict()
+                instance._loading = {}
+                instance._stats = {"hits": 0, "revalidations": 0, "loads": 0, "evictions": 0, "errors": 0}
+                cls._instance = instance
+            return cls._instance
 
-    _prompts_location: str = config.DEFAULT_PROMPTS
-    
-    @property
-    def prompts_location(self) -> str:
-        return self._prompts_location
+    def prompts(self, location: Optional[str] = None) -> Sequence[str]:
+        """The prompts at a location (default: DEFAULT_PROMPTS); empty if they cannot be loaded."""
+        location = location or config.DEFAULT_PROMPTS
+        entry = self._fresh(location)
+        if entry is not None:
+            self._stats["hits"] += 1
+            return entry.prompts
 
-    @prompts_location.setter
-    def prompts_location(self, new_location: str):
-        if self._prompts_location == new_location:
-            return
-        self._prompts_location = new_location
-        self._instance._load_prompts()
+        with self._lock:
+            load_lock = self._loading.setdefault(location, threading.Lock())
+        with load_lock:
+            # another thread may have revalidated it meanwhile
+            entry = self._fresh(location)
+            if entry is None:
+                with self._lock:
+                    entry = self._sets.get(location)
+                entry = self._refresh(location, entry)
+                with self._lock:
+                    self._sets[location] = entry
+                    self._sets.move_to_end(location)
+                    while len(self._sets) > config.PROMPT_CACHE_SIZE:
+                        self._sets.popitem(last=False)
+                        self._stats["evictions"] += 1
+            return entry.prompts
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(PromptManager, cls).__new__(cls)
-            cls._instance._load_prompts()
-        return cls._instance
-
-    def _load_prompts(self):
-        """Loads prompts from the GCS blob into memory. Falls back to default prompt list."""
-        self.prompts = {"prompts": []} #initialize to empty list to avoid errors.
+    def random_prompt(self, location: Optional[str] = None) -> str:
+        """Returns a random image generation prompt from a location."""
+        prompts = self.prompts(location)
+        if prompts:
+            return random.choice(prompts)
+        else:
+            return "Default prompt: No prompts available."  # Handle empty prompt list
+
+    def metrics(self) -> dict[str, Any]:
+        """Cache hit, revalidation, load and eviction counts, and the cached locations."""
+        with self._lock:
+            return {**self._stats, "locations": {location: len(entry.prompts) for location, entry in self._sets.items()}}
+
+    def _fresh(self, location: str) -> Optional[_PromptSet]:
+        with self._lock:
+            entry = self._sets.get(location)
+            if entry is None or time.time() - entry.checked_at >= config.PROMPT_REVALIDATE_INTERVAL:
+                return None
+            self._sets.move_to_end(location)
+            return entry
+
+    def _refresh(self, location: str, entry: Optional[_PromptSet]) -> _PromptSet:
+        """Revalidate a cached entry, or load the prompts. Falls back to the stale entry, or the default prompt list."""
+        backend_call("prompts")
         try:
-            if self.prompts_location.startswith("gs://"):
-                prompt_file = download_gcs_blob(gs_uri=self.prompts_location)
-                prompt_file = prompt_file.decode("utf-8")
-                self.prompts = json.loads(prompt_file)
+            blob = None
+            if location.startswith("gs://"):
+                blob = StorageSession().blob(location)
+                blob.reload()
+                generation = blob.generation
             else:
-                with open(config.DEFAULT_PROMPTS, "r") as f:
-                    self.prompts = json.load(f)
+                generation = os.stat(location).st_mtime_ns
+            if entry is not None and entry.generation == generation:
+                self._stats["revalidations"] += 1
+                return replace(entry, checked_at=time.time())
+            prompts = self._load(location, blob)
+            self._stats["loads"] += 1
+            print(f"Loaded {len(prompts)} prompts from {location}")
+            return _PromptSet(prompts, generation, time.time())
 
         except gapic_exceptions.NotFound:
             print("Error: Requested blob not found, loading the default prompt list.")
-            self.prompts_location = config.DEFAULT_PROMPTS
+            if location != config.DEFAULT_PROMPTS:
+                return _PromptSet(self.prompts(config.DEFAULT_PROMPTS), None, time.time())
 
         except gapic_exceptions.Unauthorized:
             print("Error: Unauthorized to access requested blob.")
 
         except json.JSONDecodeError as e:
             print("Error: Requested blob is not a valid JSON. ", e)
-        
+
         except UnicodeDecodeError as e:
             print("Error: Failed to decode requested blob. ", e)
-        
+
         except FileNotFoundError:
-            print("Error: imagen_prompts.json not found.")
+            print(f"Error: {location} not found.")
+
+        except ValueError as e:
+            print("Error: Requested prompt pack is not valid. ", e)
+
+        self._stats["errors"] += 1
+        if entry is not None:
+            return replace(entry, checked_at=time.time())
+        return _PromptSet([], None, time.time())
+
+    @staticmethod
+    def _load(location: str, blob: Optional[storage.Blob]) -> Sequence[str]:
+        """Prompt packs (.ppk) are memory-mapped; JSON prompt lists are parsed"""
+        if is_pack(location):
+            return PromptPack(local_copy(blob) if blob else location)
+        if blob:
+            return json.loads(download_gcs_blob(location, blob.generation).decode("utf-8"))["prompts"]
+        with open(location, "r") as f:
+            return json.load(f)["prompts"]
 
-    def random_prompt(self) -> str:
-        """Returns a random image generation prompt."""
-        if self.prompts and self.prompts["prompts"]:
-            return random.choice(self.prompts["prompts"])
-        else:
-            return "Default prompt: No prompts available."  # Handle empty prompt list
 
 if __name__ == "__main__":
     prompt_manager = PromptManager()
     random_prompt1 = prompt_manager.random_prompt()
-    random_prompt2 = prompt_manager.random_prompt()
+    random_prompt2 = prompt_manager.random_prompt(config.DEFAULT_PROMPTS)
 
     print(random_prompt1)
     print(random_prompt2)
@@ -0,0 +1,96 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Create the WebP variants of stored images that do not have them yet.
+
+    python -m scripts.backfill_image_variants --model imagen-3.0-generate-001
+    python -m scripts.backfill_image_variants --limit 100 --dry_run
+
+New images get their variants when they are generated; this covers images
+stored before that, and study images loaded from elsewhere.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Any, Optional
+
+import fire
+from google.api_core import exceptions as gapic_exceptions
+from google.cloud import firestore
+
+from common.image_catalog import display_uri
+from common.image_variants import create_variants
+from common.metadata import MetadataWriter, add_image_variants
+from config.default import Default
+from config.firebase_config import FirebaseClient
+
+
+cfg = Default()
+
+
+def _backfill(doc_id: str, doc: dict[str, Any], dry_run: bool) -> Optional[tuple[int, int]]:
+    """Create one image's variants, returning the original and variant sizes"""
+    if dry_run:
+        print(f"Would create variants of {doc['gcsuri']}")
+        return None
+    # some images are stored under their served, extensionless name
+    for uri in dict.fromkeys([doc["gcsuri"], display_uri(doc["gcsuri"])]):
+        try:
+            variants, original_bytes, variant_bytes = create_variants(uri)
+        except gapic_exceptions.NotFound:
+            continue
+        except Exception as e:
+            print(f"Error creating variants of {uri}: {e}")
+            return None
+        add_image_variants(doc_id, variants)
+        return original_bytes, variant_bytes
+    print(f"Image not found: {doc['gcsuri']}")
+    return None
+
+
+def main(model: str = None, limit: int = None, workers: int = 8, dry_run: bool = False):
+    """
+    Create missing image variants and record them in the image metadata.
+
+    Args:
+        model: only images of this model; all images by default.
+        limit: stop after this many images.
+        workers: images processed concurrently.
+        dry_run: list the images without creating variants.
+    """
+    db = FirebaseClient(database_id=cfg.IMAGE_FIREBASE_DB).get_client()
+    query = db.collection(cfg.IMAGE_COLLECTION_NAME)
+    if model:
+        query = query.where(filter=firestore.FieldFilter("model", "==", model))
+    docs = [
+        (snapshot.id, doc)
+        for snapshot in query.select(["gcsuri", "variants"]).stream()
+        if (doc := snapshot.to_dict()).get("gcsuri") and not doc.get("variants")
+    ][:limit]
+    print(f"{len(docs)} images without variants")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = [r for r in executor.map(lambda item: _backfill(*item, dry_run), docs) if r]
+    MetadataWriter().flush()
+
+    if results:
+        original_bytes = sum(r[0] for r in results)
+        variant_bytes = sum(r[1] for r in results)
+        print(
+            f"Created variants of {len(results)} images in {time.perf_counter() - start:.1f}s: "
+            f"originals {original_bytes / 2**20:.1f} MiB, all variants {variant_bytes / 2**20:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,94 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro-benchmark: per-battle setup cost of fresh vs. cached Vertex AI handles.
+
+Measures only client/handle setup, not generation, so it costs no image
+generations. Example:
+
+    python -m scripts.benchmark_client_reuse --iterations 10
+"""
+import statistics
+import time
+from typing import Callable, Optional
+
+import fire
+from google.cloud import aiplatform
+import vertexai
+from vertexai.preview.vision_models import ImageGenerationModel
+
+from config.default import Default
+from models.set_up import ModelSetup
+
+config = Default()
+
+
+def _time(fn: Callable[[], object], iterations: int) -> list[float]:
+    """Wall-clock seconds for each call to fn"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _report(label: str, fresh: list[float], cached: list[float]):
+    fresh_ms = statistics.median(fresh) * 1000
+    cached_ms = statistics.median(cached) * 1000
+    print(f"{label:<28} fresh {fresh_ms:9.1f} ms   cached {cached_ms:9.3f} ms   saved {fresh_ms - cached_ms:9.1f} ms")
+
+
+def main(iterations: int = 10, model_name: str = config.MODEL_IMAGEN3_FAST, endpoint_id: Optional[str] = None):
+    """
+    Compare median setup latency with and without the ModelSetup handle cache.
+
+    Args:
+        iterations: number of timed setups per variant.
+        model_name: Imagen model to load.
+        endpoint_id: Model Garden endpoint ID, defaults to MODEL_FLUX1_ENDPOINT_ID.
+    """
+    endpoint_id = endpoint_id or config.MODEL_FLUX1_ENDPOINT_ID
+    project_id, location = config.PROJECT_ID, config.LOCATION
+
+    def fresh_imagen():
+        vertexai.init(project=project_id, location=location)
+        ImageGenerationModel.from_pretrained(model_name)
+
+    ModelSetup.image_model(model_name)  # populate the cache outside the timed loop
+    imagen_fresh = _time(fresh_imagen, iterations)
+    imagen_cached = _time(lambda: ModelSetup.image_model(model_name), iterations)
+    _report(f"imagen ({model_name})", imagen_fresh, imagen_cached)
+    per_battle = statistics.median(imagen_fresh) - statistics.median(imagen_cached)
+
+    if endpoint_id:
+        endpoint_path = f"projects/{project_id}/locations/{location}/endpoints/{endpoint_id}"
+
+        def fresh_endpoint():
+            aiplatform.init(project=project_id, location=location)
+            aiplatform.Endpoint(endpoint_path)
+
+        ModelSetup.endpoint(endpoint_id)
+        endpoint_fresh = _time(fresh_endpoint, iterations)
+        endpoint_cached = _time(lambda: ModelSetup.endpoint(endpoint_id), iterations)
+        _report(f"endpoint ({endpoint_id})", endpoint_fresh, endpoint_cached)
+        per_battle += statistics.median(endpoint_fresh) - statistics.median(endpoint_cached)
+    else:
+        print("No endpoint ID configured, skipping the Model Garden benchmark.")
+
+    # A battle sets up one handle per side
+    print(f"Estimated saving per battle: {per_battle * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,92 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Throughput of rating history writes: one upsert of every model per vote vs. coalesced deltas.
+
+Run it against the Spanner emulator, with the schema from scripts/setup_study_db.py:
+
+    gcloud emulators spanner start
+    gcloud spanner instances create arena --config=emulator-config --nodes=1 --description=arena
+    SPANNER_EMULATOR_HOST=localhost:9010 python -m scripts.setup_study_db
+    SPANNER_EMULATOR_HOST=localhost:9010 python -m scripts.benchmark_spanner_writer --votes 500
+"""
+import os
+import random
+import time
+import uuid
+
+import fire
+
+from common.rating_history import RatingHistoryWriter
+from config.default import Default
+from config.spanner_config import ArenaModelEvaluation, ArenaStudyTracker
+
+config = Default()
+
+MODELS = [f"model-{i}" for i in range(8)]
+
+
+def _votes(votes: int, seed: int):
+    """Random votes, with the ratings they produce"""
+    rng = random.Random(seed)
+    ratings = {model: 1000.0 for model in MODELS}
+    for _ in range(votes):
+        model1, model2 = rng.sample(MODELS, 2)
+        delta = rng.uniform(0, 32)
+        ratings[model1] += delta
+        ratings[model2] -= delta
+        yield model1, model2, dict(ratings)
+
+
+def main(votes: int = 500, seed: int = 0, allow_production: bool = False):
+    """
+    Write the rating history of `votes` votes both ways and compare throughput.
+
+    Args:
+        votes: number of votes to write.
+        seed: random seed.
+        allow_production: run even if SPANNER_EMULATOR_HOST is not set.
+    """
+    if not os.environ.get("SPANNER_EMULATOR_HOST") and not allow_production:
+        raise SystemExit("SPANNER_EMULATOR_HOST is not set; pass --allow_production to run against Spanner.")
+
+    tracker = ArenaStudyTracker(
+        project_id=config.PROJECT_ID,
+        spanner_instance_id=config.SPANNER_INSTANCE_ID,
+        spanner_database_id=config.SPANNER_DATABASE_ID,
+    )
+
+    study = f"bench-{uuid.uuid4().hex[:8]}"
+    start = time.perf_counter()
+    for _, _, ratings in _votes(votes, seed):
+        tracker.upsert_study_runs(
+            [ArenaModelEvaluation(model_name=model, rating=rating, study=study) for model, rating in ratings.items()]
+        )
+    elapsed = time.perf_counter() - start
+    print(f"every model per vote: {votes} commits, {votes * len(MODELS)} rows, "
+          f"{elapsed:.1f}s ({votes / elapsed:.1f} votes/s)")
+
+    study = f"bench-{uuid.uuid4().hex[:8]}"
+    writer = RatingHistoryWriter()
+    start = time.perf_counter()
+    for model1, model2, ratings in _votes(votes, seed):
+        writer.record(study, {model1: ratings[model1], model2: ratings[model2]})
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    metrics = writer.metrics()
+    print(f"coalesced deltas: {metrics['commits']} commits, {metrics['rows']} rows, "
+          f"{elapsed:.1f}s ({votes / elapsed:.1f} votes/s)")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
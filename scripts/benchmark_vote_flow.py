@@ -0,0 +1,128 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark: votes per second a single app worker can handle, with the old and new vote handlers.
+
+Replays the shape of `on_click_arena_vote` before and after the reveal pause
+was removed, with simulated backend latencies, so it needs no credentials
+and costs no generations. Example:
+
+    python -m scripts.benchmark_vote_flow --votes 200 --threads 1
+    python -m scripts.benchmark_vote_flow --hit_rate 0.5 --generation 6 --speedup 20
+
+Before: the vote is logged, the handler sleeps for the reveal pause, then
+generates the next battle inline on a prefetch miss. After: the next battle
+is started as the vote arrives, and the handler returns once the vote is
+logged; the browser holds the reveal, and a battle still being generated
+is shown by a later event.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import random
+import statistics
+import time
+from typing import Callable, Iterator
+
+import fire
+
+
+def _before(hit: bool, record: float, pause: float, generation: float, executor: ThreadPoolExecutor) -> Iterator[None]:  # pylint: disable=unused-argument
+    """The vote handler with `time.sleep(SHOW_RESULTS_PAUSE_TIME)`"""
+    yield  # reveal
+    time.sleep(record)  # record_vote
+    yield
+    time.sleep(pause)
+    yield
+    yield  # clear the output
+    if not hit:
+        time.sleep(generation)  # next battle, generated inline
+    yield
+
+
+def _after(hit: bool, record: float, pause: float, generation: float, executor: ThreadPoolExecutor) -> Iterator[None]:  # pylint: disable=unused-argument
+    """The vote handler that starts the next battle as the vote arrives and never waits on it"""
+    prepared = Future()
+    if hit:
+        prepared.set_result(None)
+    else:
+        prepared = executor.submit(time.sleep, generation)
+    yield  # reveal
+    time.sleep(record)  # record_vote
+    prepared.done()  # shown now if ready, else by a later event
+    yield
+
+
+def _run(handler: Callable[..., Iterator[None]], hits: list[bool], threads: int, generation_workers: int, **latencies) -> tuple[float, list[float]]:
+    """Handle every vote on one worker, returning the elapsed seconds and each vote's handler time"""
+    durations = []
+
+    def vote(hit: bool):
+        start = time.perf_counter()
+        for _ in handler(hit, executor=generations, **latencies):
+            pass
+        durations.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=generation_workers) as generations:
+        with ThreadPoolExecutor(max_workers=threads) as worker:
+            start = time.perf_counter()
+            list(worker.map(vote, hits))
+            elapsed = time.perf_counter() - start
+    return elapsed, durations
+
+
+def main(
+    votes: int = 200,
+    threads: int = 1,
+    hit_rate: float = 0.9,
+    record: float = 0.05,
+    pause: float = 1.0,
+    generation: float = 6.0,
+    generation_workers: int = 4,
+    speedup: float = 10.0,
+    seed: int = 0,
+):
+    """
+    Compare vote throughput of one worker with the old and new vote handlers.
+
+    Args:
+        votes: votes handled per run.
+        threads: request threads per worker; gunicorn's sync workers have 1.
+        hit_rate: share of votes whose next battle is ready in the prefetch queue.
+        record: seconds to log a vote.
+        pause: the old reveal pause, SHOW_RESULTS_PAUSE_TIME, in seconds; the browser holds the reveal now.
+        generation: seconds to generate a battle on a prefetch miss.
+        generation_workers: NEXT_BATTLE_WORKERS.
+        speedup: divide every latency by this, to finish sooner; results are scaled back.
+        seed: seed for choosing prefetch hits.
+    """
+    rng = random.Random(seed)
+    hits = [rng.random() < hit_rate for _ in range(votes)]
+    latencies = {"record": record / speedup, "pause": pause / speedup, "generation": generation / speedup}
+    print(
+        f"{votes} votes, {threads} thread(s) per worker, {hit_rate:.0%} prefetch hits, "
+        f"record {record}s, pause {pause}s, generation {generation}s"
+    )
+
+    results = {}
+    for label, handler in (("before", _before), ("after", _after)):
+        elapsed, durations = _run(handler, hits, threads, generation_workers, **latencies)
+        results[label] = votes / (elapsed * speedup)
+        print(
+            f"{label:<7} {results[label]:8.2f} votes/s per worker   "
+            f"handler p50 {statistics.median(durations) * speedup:6.2f}s   "
+            f"max {max(durations) * speedup:6.2f}s"
+        )
+    print(f"speedup {results['after'] / results['before']:.1f}x")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
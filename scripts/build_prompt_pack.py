@@ -0,0 +1,81 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Build a memory-mapped prompt pack (.ppk) from a prompt list.
+
+    python -m scripts.build_prompt_pack --source prompts/imagen_prompts.json --output imagen_prompts.ppk
+    python -m scripts.build_prompt_pack --source prompt_image_names.json --output sd.ppk --upload gs://bucket/prompts/sd.ppk
+
+Sources are JSON prompt lists ({"prompts": [...]}, whose entries are strings
+or {"prompt", "id", "tags"} dicts), the DiffusionDB prompt file written by
+scripts/diffusion_db_downloader.py ({"stable_diffusion": [[prompt, [image_name, ...]], ...]},
+keyed by the first image name), or text files with one prompt per line.
+Point a study's prompt list at the uploaded .ppk to serve it memory-mapped.
+"""
+import json
+import os
+import random
+import time
+from typing import Iterator
+
+import fire
+
+from common.storage import StorageSession
+from prompts.pack import PromptPack, PromptRecord, write_pack
+
+
+def _records(source: str) -> Iterator[PromptRecord]:
+    """The prompts of a source file, in pack record form"""
+    if source.endswith(".txt"):
+        with open(source, "r", encoding="utf-8") as f:
+            yield from (line.rstrip("\n") for line in f if line.strip())
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "stable_diffusion" in data:
+        for prompt, image_names in data["stable_diffusion"]:
+            yield {"prompt": prompt, "id": image_names[0] if image_names else None}
+    else:
+        yield from data["prompts"]
+
+
+def main(source: str, output: str, upload: str = None, samples: int = 100000):
+    """
+    Build a prompt pack.
+
+    Args:
+        source: JSON or text prompt file.
+        output: the .ppk file to write.
+        upload: optional gs:// URI to upload the pack to.
+        samples: random prompts to read from the finished pack, to time sampling.
+    """
+    start = time.perf_counter()
+    count = write_pack(output, _records(source))
+    print(f"Wrote {count} prompts to {output} ({os.path.getsize(output) / 2**20:.1f} MiB) in {time.perf_counter() - start:.2f}s")
+
+    pack = PromptPack(output)
+    if samples and count:
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(samples):
+            pack.choice(rng)
+        print(f"Random sampling: {(time.perf_counter() - start) / samples * 1e6:.2f}µs per prompt")
+    pack.close()
+
+    if upload:
+        StorageSession().blob(upload).upload_from_filename(output, content_type="application/octet-stream")
+        print(f"Uploaded to {upload}")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
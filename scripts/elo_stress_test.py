@@ -0,0 +1,88 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Concurrency stress test for the ELO engine: checks that no votes are lost.
+
+Run it against the Firestore emulator so no real study is touched:
+
+    gcloud emulators firestore start --host-port=localhost:8081
+    FIRESTORE_EMULATOR_HOST=localhost:8081 python -m scripts.elo_stress_test --workers 16 --votes 50
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import time
+import uuid
+
+import fire
+
+from common.ratings import DEFAULT_RATING, EloEngine
+
+MODELS = ["model-a", "model-b", "model-c", "model-d", "model-e"]
+
+
+def _vote(engine: EloEngine, study: str, votes: int, seed: int) -> int:
+    """Cast random votes from one worker"""
+    rng = random.Random(seed)
+    for _ in range(votes):
+        model1, model2 = rng.sample(MODELS, 2)
+        engine.apply_vote(study, model1, model2, rng.choice([model1, model2]))
+    return votes
+
+
+def main(workers: int = 16, votes: int = 50, allow_production: bool = False):
+    """
+    Cast workers x votes concurrent votes on a throwaway study and verify the totals.
+
+    Args:
+        workers: number of concurrent voting threads.
+        votes: votes cast by each thread.
+        allow_production: run even if FIRESTORE_EMULATOR_HOST is not set.
+    """
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST") and not allow_production:
+        raise SystemExit("FIRESTORE_EMULATOR_HOST is not set; pass --allow_production to run against Firestore.")
+
+    study = f"stress-{uuid.uuid4().hex[:8]}"
+    engine = EloEngine()
+    total = workers * votes
+    print(f"Casting {total} votes from {workers} workers on study {study}...")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        cast = sum(executor.map(lambda seed: _vote(engine, study, votes, seed), range(workers)))
+    elapsed = time.perf_counter() - start
+    print(f"{cast} votes in {elapsed:.1f}s ({cast / elapsed:.1f} votes/s)")
+
+    doc = engine._doc_ref(study).get().to_dict()  # pylint: disable=protected-access
+    games = sum(doc["games"].values())
+    wins = sum(doc["wins"].values())
+    rating_drift = abs(sum(doc["ratings"].values()) - DEFAULT_RATING * len(doc["ratings"]))
+
+    checks = {
+        f"vote_count == {total}": doc["vote_count"] == total,
+        f"games == {2 * total}": games == 2 * total,
+        f"wins == {total}": wins == total,
+        # ELO is zero-sum; only rounding to 2 decimals (<= 0.01 per vote) may drift
+        "rating sum conserved": rating_drift <= 0.01 * total,
+    }
+    for check, passed in checks.items():
+        print(f"{'PASS' if passed else 'FAIL'}: {check}")
+    print(f"vote_count={doc['vote_count']} games={games} wins={wins} rating drift={rating_drift:.2f}")
+
+    engine._doc_ref(study).delete()  # pylint: disable=protected-access
+    if not all(checks.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
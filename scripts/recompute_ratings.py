@@ -0,0 +1,106 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Recompute a study's ratings from its full vote history.
+
+    python -m scripts.recompute_ratings bradley_terry --study live
+    python -m scripts.recompute_ratings elo --study live   # replay with the current ELO_K_FACTOR
+    python -m scripts.recompute_ratings benchmark --votes 50000
+
+Set RATING_METHOD=bradley_terry for the leaderboard to serve the stored fit.
+"""
+import random
+import time
+
+import fire
+
+from common.bradley_terry import fit_bradley_terry, load_matchups, store_fit
+from common.leaderboard import LeaderboardCache
+from common.ratings import EloEngine, replay
+
+
+def bradley_terry(study: str, bootstrap: int = 1000, confidence: float = 0.95, seed: int = None, dry_run: bool = False):
+    """
+    Fit Bradley-Terry ratings with bootstrap confidence intervals and store them.
+
+    Args:
+        study: the study to rate.
+        bootstrap: number of bootstrap resamples.
+        confidence: width of the confidence intervals.
+        seed: random seed for the bootstrap.
+        dry_run: print the ratings without storing them.
+    """
+    start = time.perf_counter()
+    matchups = load_matchups(study)
+    print(f"Loaded {len(matchups)} votes for study '{study}' in {time.perf_counter() - start:.2f}s")
+    if not matchups:
+        return
+
+    start = time.perf_counter()
+    fit = fit_bradley_terry(matchups, bootstrap=bootstrap, confidence=confidence, seed=seed)
+    print(f"Fit in {time.perf_counter() - start:.3f}s")
+    print(fit.to_frame().round(1).to_string())
+    if not dry_run:
+        store_fit(study, fit)
+        LeaderboardCache().invalidate(study)
+
+
+def elo(study: str, dry_run: bool = False):
+    """
+    Replay a study's votes in order to recompute its ELO ratings, e.g. after changing ELO_K_FACTOR.
+
+    Args:
+        study: the study to rate.
+        dry_run: print the ratings without storing them.
+    """
+    matchups = load_matchups(study)
+    print(f"Replaying {len(matchups)} votes for study '{study}'")
+    ratings = replay(matchups)["ratings"] if dry_run else EloEngine().recompute(study, matchups)
+    if not dry_run:
+        LeaderboardCache().invalidate(study)
+    for model, rating in sorted(ratings.items(), key=lambda item: -item[1]):
+        print(f"{rating:8.2f}  {model}")
+
+
+def benchmark(votes: int = 50000, models: int = 8, bootstrap: int = 1000, seed: int = 0):
+    """
+    Time a fit on synthetic votes drawn from known ratings.
+
+    Args:
+        votes: number of synthetic votes.
+        models: number of models.
+        bootstrap: number of bootstrap resamples.
+        seed: random seed.
+    """
+    rng = random.Random(seed)
+    true_ratings = {f"model-{i}": rng.uniform(800, 1200) for i in range(models)}
+    names = list(true_ratings)
+    matchups = []
+    for _ in range(votes):
+        model1, model2 = rng.sample(names, 2)
+        expected = 1 / (1 + 10 ** ((true_ratings[model2] - true_ratings[model1]) / 400))
+        matchups.append((model1, model2, model1 if rng.random() < expected else model2))
+
+    start = time.perf_counter()
+    fit = fit_bradley_terry(matchups, bootstrap=bootstrap, seed=seed)
+    elapsed = time.perf_counter() - start
+    print(f"{votes} votes, {models} models, {bootstrap} bootstrap resamples: {elapsed:.3f}s")
+
+    mean = sum(true_ratings.values()) / models
+    df = fit.to_frame()
+    df["true"] = df["model"].map(lambda model: true_ratings[model] - mean + 1000)
+    print(df.round(1).to_string())
+
+
+if __name__ == "__main__":
+    fire.Fire({"bradley_terry": bradley_terry, "elo": elo, "benchmark": benchmark})
@@ -0,0 +1,101 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Offline simulation: votes needed for a stable ranking, active matchmaking vs. uniform pairs.
+
+Voters prefer models according to hidden true ratings (Bradley-Terry).
+Every `check_every` votes the history is fitted with the offline
+Bradley-Terry engine; a run stops once that ranking has matched the true
+ranking for `window` votes.
+
+    python -m scripts.simulate_matchmaking --models 8 --trials 20
+"""
+import random
+import statistics
+
+import fire
+
+from common.bradley_terry import fit_bradley_terry
+from common.matchmaker import Matchmaker
+from common.ratings import DEFAULT_RATING, expected_score
+
+
+def _run(true_ratings: dict[str, float], strategy: str, window: int, check_every: int, max_votes: int, seed: int) -> int:
+    """Votes until the ranking is stable, or max_votes"""
+    rng = random.Random(seed)
+    models = list(true_ratings)
+    true_order = sorted(models, key=lambda model: -true_ratings[model])
+    matchmaker = Matchmaker(rng=random.Random(seed))
+    matchups = []
+    stable_since = None
+    for vote in range(1, max_votes + 1):
+        if strategy == "active":
+            model1, model2 = matchmaker.pick_models("sim", models)
+        else:
+            model1, model2 = rng.sample(models, 2)
+        model1_wins = rng.random() < expected_score(true_ratings[model1], true_ratings[model2])
+        winner = model1 if model1_wins else model2
+        matchmaker.record("sim", model1, model2, winner)
+        matchups.append((model1, model2, winner))
+        if vote % check_every:
+            continue
+
+        fit = fit_bradley_terry(matchups, bootstrap=0)
+        if list(fit.to_frame()["model"]) == true_order:
+            stable_since = stable_since or vote
+            if vote - stable_since >= window:
+                return stable_since
+        else:
+            stable_since = None
+    return max_votes
+
+
+def main(
+    models: int = 8,
+    spread: float = 40,
+    trials: int = 20,
+    window: int = 500,
+    check_every: int = 50,
+    max_votes: int = 20000,
+    seed: int = 0,
+):
+    """
+    Compare the votes needed for a stable ranking under each pair-selection strategy.
+
+    Args:
+        models: number of models.
+        spread: average gap between consecutive true ratings.
+        trials: simulated arenas per strategy.
+        window: votes the ranking must stay correct for to count as stable.
+        check_every: votes between ranking checks.
+        max_votes: give up on an arena after this many votes.
+        seed: random seed.
+    """
+    rng = random.Random(seed)
+    results = {"uniform": [], "active": []}
+    for trial in range(trials):
+        gaps = [rng.uniform(0.5, 1.5) * spread for _ in range(models - 1)]
+        true_ratings = {f"model-{i}": DEFAULT_RATING + sum(gaps[:i]) for i in range(models)}
+        for strategy, votes in results.items():
+            votes.append(_run(true_ratings, strategy, window, check_every, max_votes, seed=seed * 1000 + trial))
+
+    for strategy, votes in results.items():
+        unstable = sum(v >= max_votes for v in votes)
+        print(f"{strategy:>8}: median {statistics.median(votes):.0f} votes, mean {statistics.mean(votes):.0f}"
+              f" ({unstable}/{trials} not stable within {max_votes})")
+    saved = 1 - statistics.median(results["active"]) / statistics.median(results["uniform"])
+    print(f"active matchmaking needs {saved:.0%} fewer votes (median)")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
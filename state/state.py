@@ -16,6 +16,7 @@ import mesop as me
 
 from dataclasses import field
 
+from common.welcome import DEFAULT_WELCOME
 from config.default import Default
 from models.set_up import load_default_models
 
@@ -29,7 +30,7 @@ class AppState:
     theme_mode: str = "light"
     sidenav_open: bool = True
     
-    welcome_message: str = "Welcome to Arena!"
+    welcome_message: str = DEFAULT_WELCOME
 
     name: str = "Google Cloud Next 2025 Attendee"  # Default name for the user
     study: str = "live"
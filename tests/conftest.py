@@ -0,0 +1,206 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Test setup: configuration, and an in-memory Firestore in place of the project's database """
+
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+import uuid
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="arena-tests-")
+os.environ.update(
+    {
+        "PROJECT_ID": "test-project",
+        "GENMEDIA_BUCKET": "test-bucket",
+        "IMAGE_FIREBASE_DB": "test-db",
+        "IMAGE_COLLECTION_NAME": "arena_images",
+        "INIT_VERTEX": "True",
+        "VOTE_LOG_PATH": os.path.join(_tmp, "votes.sqlite3"),
+        "BLOB_CACHE_DIR": "",
+        "LEADERBOARD_CACHE_DIR": os.path.join(_tmp, "leaderboard"),
+        "PROMPT_PACK_DIR": os.path.join(_tmp, "prompt_packs"),
+        "WELCOME_POOL_SIZE": "0",
+        "BATTLE_QUEUE_ENABLED": "False",
+    }
+)
+
+_OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    "==": lambda field, value: field == value,
+    "in": lambda field, value: field in value,
+    ">=": lambda field, value: field is not None and field >= value,
+    "<": lambda field, value: field is not None and field < value,
+}
+
+
+class FakeDocument:
+    """A document reference"""
+
+    def __init__(self, db: "FakeFirestore", collection: str, doc_id: str):
+        self._db, self._collection, self.id = db, collection, doc_id
+
+    def set(self, record: dict[str, Any], merge: bool = False):
+        self._db.write(self._collection, self.id, record, merge)
+
+    def get(self):
+        doc = self._db.docs(self._collection).get(self.id)
+        return SimpleNamespace(id=self.id, exists=doc is not None, to_dict=lambda: dict(doc) if doc is not None else None)
+
+
+class FakeQuery:
+    """A collection, or a query over one, with equality filters, ordering, cursors, limits and snapshot listeners"""
+
+    def __init__(self, db: "FakeFirestore", collection: str, filters: tuple = (), orders: tuple = (), after=None, limit=None):
+        self._db, self._collection, self._filters = db, collection, filters
+        self._orders, self._after, self._limit = orders, after, limit
+
+    def _copy(self, **changes) -> "FakeQuery":
+        fields = {"filters": self._filters, "orders": self._orders, "after": self._after, "limit": self._limit}
+        return FakeQuery(self._db, self._collection, **{**fields, **changes})
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self._db, self._collection, doc_id or uuid.uuid4().hex)
+
+    def where(self, filter) -> "FakeQuery":  # pylint: disable=redefined-builtin
+        return self._copy(filters=self._filters + ((filter.field_path, filter.op_string, filter.value),))
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field, direction == "DESCENDING"),))
+
+    def start_after(self, values: dict[str, Any]) -> "FakeQuery":
+        return self._copy(after=values)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def select(self, fields: list[str]) -> "FakeQuery":  # pylint: disable=unused-argument
+        return self
+
+    def matches(self, doc: dict[str, Any]) -> bool:
+        return all(_OPERATORS[op](doc.get(field), value) for field, op, value in self._filters)
+
+    def _key(self, doc_id: str, doc: dict[str, Any]) -> tuple:
+        """The document's position in the query's order, comparable ascending"""
+        key = []
+        for field, descending in self._orders:
+            value = doc_id if field == "__name__" else doc.get(field)
+            key.append(_Reversed(value) if descending else value)
+        return tuple(key)
+
+    def stream(self):
+        docs = [(doc_id, doc) for doc_id, doc in list(self._db.docs(self._collection).items()) if self.matches(doc)]
+        docs.sort(key=lambda item: self._key(*item))
+        if self._after is not None:
+            after = self._key(self._after.get("__name__"), self._after)
+            docs = [item for item in docs if self._key(*item) > after]
+        return [SimpleNamespace(id=doc_id, to_dict=lambda doc=doc: dict(doc)) for doc_id, doc in docs[: self._limit]]
+
+    def on_snapshot(self, callback: Callable):
+        return self._db.listen(self._collection, self, callback)
+
+
+class _Reversed:
+    """Sorts its value in descending order"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+
+class FakeBatch:
+    def __init__(self):
+        self._writes = []
+
+    def set(self, ref: FakeDocument, record: dict[str, Any], merge: bool = False):
+        self._writes.append((ref, record, merge))
+
+    def commit(self):
+        for ref, record, merge in self._writes:
+            ref.set(record, merge=merge)
+
+
+class FakeFirestore:
+    """Just enough of a Firestore client for the app's reads, batched writes and snapshot listeners.
+
+    Listeners are called synchronously: once with every matching document
+    when registered, then with each change.
+    """
+
+    def __init__(self):
+        self._collections: dict[str, dict[str, dict[str, Any]]] = {}
+        self._listeners: list[tuple[str, FakeQuery, Callable]] = []
+        self._lock = threading.RLock()
+
+    def collection(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch()
+
+    def docs(self, collection: str) -> dict[str, dict[str, Any]]:
+        return self._collections.setdefault(collection, {})
+
+    def write(self, collection: str, doc_id: str, record: dict[str, Any], merge: bool):
+        with self._lock:
+            docs = self.docs(collection)
+            before = docs.get(doc_id)
+            after = {**(before or {}), **record} if merge else dict(record)
+            docs[doc_id] = after
+            for listened, query, callback in self._listeners:
+                if listened != collection:
+                    continue
+                matched, matches = before is not None and query.matches(before), query.matches(after)
+                change = "MODIFIED" if matched and matches else "ADDED" if matches else "REMOVED" if matched else None
+                if change:
+                    callback(None, [_change(change, doc_id, after)], None)
+
+    def listen(self, collection: str, query: FakeQuery, callback: Callable):
+        with self._lock:
+            self._listeners.append((collection, query, callback))
+            callback(None, [_change("ADDED", snapshot.id, snapshot.to_dict()) for snapshot in query.stream()], None)
+        return SimpleNamespace(unsubscribe=lambda: None)
+
+
+def _change(kind: str, doc_id: str, doc: dict[str, Any]):
+    return SimpleNamespace(
+        type=SimpleNamespace(name=kind),
+        document=SimpleNamespace(id=doc_id, to_dict=lambda: dict(doc)),
+    )
+
+
+from config.firebase_config import FirebaseClient  # pylint: disable=wrong-import-position
+
+_firestore = FakeFirestore()
+FirebaseClient._instance = object.__new__(FirebaseClient)  # pylint: disable=protected-access
+FirebaseClient._instance._client = _firestore  # pylint: disable=protected-access
+
+
+@pytest.fixture
+def firestore_db() -> FakeFirestore:
+    """The in-memory Firestore every module's `db` points at, emptied before each test"""
+    with _firestore._lock:  # pylint: disable=protected-access
+        _firestore._collections.clear()  # pylint: disable=protected-access
+        _firestore._listeners.clear()  # pylint: disable=protected-access
+    return _firestore
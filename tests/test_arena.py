@@ -0,0 +1,112 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for how the arena shows the next battle without waiting on it """
+
+from concurrent.futures import Future
+import time
+from types import SimpleNamespace
+
+from models.battle import Battle
+from pages import arena
+
+
+def _state():
+    return SimpleNamespace(
+        study="live",
+        arena_prompt="a harbour",
+        arena_model1="imagen",
+        arena_model2="flux",
+        arena_output=["gs://test-bucket/old-a", "gs://test-bucket/old-b"],
+        is_loading=False,
+        chosen_model="",
+        last_prompt="",
+        last_models=[],
+        last_output=[],
+        last_choice="",
+        revealing=False,
+        pending_battle="",
+    )
+
+
+def _battle():
+    return Battle("a lighthouse", ["imagen", "flux"], ["gs://test-bucket/a", "gs://test-bucket/b"])
+
+
+def _vote(monkeypatch, state, prepared: Future) -> float:
+    """Run the vote handler to the end, returning how long it took"""
+    monkeypatch.setattr(arena.me, "state", lambda cls: state)
+    monkeypatch.setattr(arena, "prepare_next_battle", lambda state: prepared)
+    monkeypatch.setattr(arena, "record_vote", lambda *args: None)
+    started = time.monotonic()
+    steps = arena.on_click_arena_vote(SimpleNamespace(key="arena_model1"))
+    next(steps)
+    assert state.revealing and state.last_choice == "imagen"  # the reveal covers the voted battle
+    list(steps)
+    return time.monotonic() - started
+
+
+def test_a_ready_battle_replaces_the_reveal_at_once(monkeypatch):
+    state, prepared = _state(), Future()
+    prepared.set_result(_battle())
+
+    assert _vote(monkeypatch, state, prepared) < 0.5
+
+    assert state.arena_output == ["gs://test-bucket/a", "gs://test-bucket/b"]
+    assert not state.revealing and not state.is_loading and not state.chosen_model
+    assert state.last_output == ["gs://test-bucket/old-a", "gs://test-bucket/old-b"]
+
+
+def test_the_handler_returns_without_waiting_for_a_battle_being_generated(monkeypatch):
+    state, prepared = _state(), Future()
+
+    assert _vote(monkeypatch, state, prepared) < 0.5
+
+    assert state.is_loading and state.pending_battle and not state.revealing
+    assert state.arena_prompt == "a harbour"
+
+    # a later render finds the battle ready
+    assert arena.adopt_pending(state)
+    assert state.is_loading
+    prepared.set_result(_battle())
+    assert arena.adopt_pending(state)
+    assert state.arena_prompt == "a lighthouse" and not state.is_loading and not state.pending_battle
+
+
+def test_a_failed_battle_leaves_the_skip_button(monkeypatch):
+    state, prepared = _state(), Future()
+    _vote(monkeypatch, state, prepared)
+
+    prepared.set_exception(RuntimeError("backend down"))
+    arena.adopt_pending(state)
+
+    assert not state.arena_output and not state.is_loading and not state.pending_battle
+
+
+def test_a_battle_pending_in_another_process_is_reported():
+    state = _state()
+    state.pending_battle = "unknown"
+
+    assert not arena.adopt_pending(state)
+
+
+def test_covered_matchups_only_use_the_study_prompts(monkeypatch):
+    covered = {("imagen", "flux"): ["outside the study", "a lighthouse"], ("imagen", "sd"): ["outside the study"], ("flux", "sd"): []}
+    monkeypatch.setattr(arena, "StudyImageCatalog", lambda: SimpleNamespace(covered_pairs=lambda models: covered))
+
+    for _ in range(20):
+        prompt, models = arena._covered_matchup("prompts", ["imagen", "flux", "sd"], ["a lighthouse", "a harbour"])  # pylint: disable=protected-access
+        assert prompt == "a lighthouse"
+        assert sorted(models) == ["flux", "imagen"]
+
+    assert arena._covered_matchup("prompts", ["imagen", "flux", "sd"], ["a harbour"]) is None  # pylint: disable=protected-access
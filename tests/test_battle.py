@@ -0,0 +1,75 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" generate_battle keeps images aligned with models, and bounds its fallbacks """
+
+from concurrent.futures import Future
+import time
+
+import pytest
+
+from models import battle
+from models.battle import generate_battle
+
+LOOKUP_TIME = 0.3
+
+
+@pytest.fixture(autouse=True)
+def sides(monkeypatch):
+    """Live generation fails for "broken" and succeeds for every other model; cached lookups are slow"""
+
+    def submit_side(model_name, prompt, study, aspect_ratio, degrade=True):  # pylint: disable=unused-argument
+        future = Future()
+        future.set_result([] if model_name == "broken" else [f"gs://live/{model_name}.png"])
+        return future
+
+    def study_fetch(model_name, prompt, study=None):  # pylint: disable=unused-argument
+        time.sleep(LOOKUP_TIME)
+        return [f"gs://cached/{model_name}.png"] if model_name.startswith("spare") else []
+
+    monkeypatch.setattr(battle, "_submit_side", submit_side)
+    monkeypatch.setattr(battle, "study_fetch", study_fetch)
+    monkeypatch.setattr(battle.config, "FALLBACK_TIMEOUT", 1.0)
+
+
+def test_an_unfilled_side_keeps_its_place():
+    result = generate_battle("a red fox", ["broken", "imagen"], "live")
+
+    assert result.models == ["broken", "imagen"]
+    assert result.images == [None, "gs://live/imagen.png"]
+    assert not result.complete
+
+
+def test_a_replacement_takes_the_failed_side():
+    result = generate_battle("a red fox", ["broken", "imagen"], "live", replacements=["spare-a", "imagen"])
+
+    assert result.models == ["spare-a", "imagen"]
+    assert result.images == ["gs://cached/spare-a.png", "gs://live/imagen.png"]
+    assert result.complete
+
+
+def test_fallback_lookups_run_concurrently():
+    start = time.monotonic()
+    result = generate_battle("a red fox", ["broken", "imagen"], "live", replacements=[f"none-{n}" for n in range(4)] + ["spare-a"])
+
+    assert result.complete
+    assert time.monotonic() - start < LOOKUP_TIME * 3
+
+
+def test_fallback_lookups_stop_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(battle.config, "FALLBACK_TIMEOUT", LOOKUP_TIME / 3)
+    start = time.monotonic()
+    result = generate_battle("a red fox", ["broken", "imagen"], "live", replacements=["spare-a"])
+
+    assert time.monotonic() - start < LOOKUP_TIME
+    assert result.images == [None, "gs://live/imagen.png"]
@@ -0,0 +1,104 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Images loaded by the metadata loader are served from the in-memory catalog """
+
+import json
+
+import pytest
+
+from common import metadata
+from common.image_catalog import StudyImageCatalog, display_uri
+
+MODEL = "stable-diffusion"
+
+
+@pytest.fixture
+def catalog(firestore_db):  # pylint: disable=unused-argument
+    StudyImageCatalog._instance = None  # pylint: disable=protected-access
+    return StudyImageCatalog()
+
+
+def _load(tmp_path, monkeypatch, entries: list, model: str = MODEL, missing: tuple = ()):
+    """Load prompt/image entries through the real metadata loader, with every image but `missing` in GCS"""
+    source = tmp_path / f"{model}.json"
+    source.write_text(json.dumps({"stable_diffusion": entries}))
+    monkeypatch.setattr(metadata, "exists_many", lambda uris: {uri: not uri.endswith(missing) for uri in uris})
+    metadata.load_metadata_from_json("arena_images", str(source), "stable_diffusion", "stablediffusion", model)
+
+
+def _uri(name: str) -> str:
+    return display_uri(f"gs://test-bucket/stablediffusion/{name}")
+
+
+def test_loaded_images_are_in_the_catalog(tmp_path, monkeypatch, catalog):
+    _load(
+        tmp_path,
+        monkeypatch,
+        [["a red fox", ["fox1.png", "fox2.png"]], ["a blue whale", ["whale.png"]]],
+        missing=("fox1.png",),
+    )
+
+    assert catalog.lookup(MODEL, "a red fox", timeout=1) == [_uri("fox2.png")]
+    assert catalog.lookup(MODEL, "a blue whale", timeout=1) == [_uri("whale.png")]
+    assert catalog.lookup(MODEL, "a green frog", timeout=1) == []
+    assert catalog.metrics()[MODEL] == {"ready": True, "images": 2, "prompts": 2}
+
+
+def test_images_loaded_while_watched_are_added(tmp_path, monkeypatch, catalog):
+    catalog.watch([MODEL])
+    assert catalog.lookup(MODEL, "a red fox", timeout=1) == []
+
+    _load(tmp_path, monkeypatch, [["a red fox", ["fox.png"]]])
+
+    assert catalog.random_image(MODEL, "a red fox") == _uri("fox.png")
+
+
+def test_a_model_change_moves_the_image(firestore_db, catalog):
+    catalog.watch(["model-a", "model-b"])
+    image = firestore_db.collection("arena_images").document("img")
+    image.set({"gcsuri": "gs://test-bucket/img.png", "prompt": "a cat", "model": "model-a"})
+
+    image.set({"model": "model-b"}, merge=True)
+
+    assert catalog.lookup("model-a", "a cat", timeout=1) == []
+    assert catalog.lookup("model-b", "a cat", timeout=1) == [display_uri("gs://test-bucket/img.png")]
+
+
+def test_coverage_of_loaded_images(tmp_path, monkeypatch, catalog):
+    _load(tmp_path, monkeypatch, [["a red fox", ["a-fox.png"]], ["a blue whale", ["a-whale.png"]]], model="model-a")
+    _load(tmp_path, monkeypatch, [["a red fox", ["b-fox.png"]], ["a green frog", ["b-frog.png"]]], model="model-b")
+    _load(tmp_path, monkeypatch, [["a grey owl", ["c-owl.png"]]], model="model-c")
+    models = ["model-a", "model-b", "model-c"]
+
+    assert catalog.covered_pairs(models) == {
+        ("model-a", "model-b"): ["a red fox"],
+        ("model-a", "model-c"): [],
+        ("model-b", "model-c"): [],
+    }
+    stats = catalog.coverage_stats(models)
+    assert stats["images"] == 5
+    assert stats["prompts"] == 4
+    assert stats["fully_covered"] == 0
+    assert stats["prompts_per_model"] == {"model-a": 2, "model-b": 2, "model-c": 1}
+    assert stats["prompts_per_pair"]["model-a vs. model-b"] == 1
+    assert stats["uncovered_pairs"] == ["model-a vs. model-c", "model-b vs. model-c"]
+
+
+def test_coverage_counts_only_the_study_models(tmp_path, monkeypatch, catalog):
+    _load(tmp_path, monkeypatch, [["a red fox", ["a-fox.png"]]], model="model-a")
+    _load(tmp_path, monkeypatch, [["a red fox", ["b-fox.png"]]], model="model-b")
+    _load(tmp_path, monkeypatch, [["a grey owl", ["c-owl.png"]]], model="model-c")
+
+    assert catalog.covered_pairs(["model-a", "model-b"]) == {("model-a", "model-b"): ["a red fox"]}
+    assert catalog.coverage_stats(["model-a", "model-b"])["prompts"] == 1
@@ -0,0 +1,78 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for serving image variants recorded by other app instances """
+
+import threading
+import time
+
+from common.image_variants import VariantPipeline, config
+from common.render_data import render_trace
+
+
+def _eventually(check, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_variants_on_the_image_document_are_served_from_a_later_render(firestore_db):
+    firestore_db.collection(config.IMAGE_COLLECTION_NAME).document("img").set(
+        {
+            "gcsuri": "gs://test-bucket/imagen/other-instance.png",
+            "model": "imagen",
+            "prompt": "a lighthouse",
+            "variants": {"thumb": "gs://test-bucket/imagen/other-instance_thumb.webp"},
+        }
+    )
+    served = "gs://test-bucket/imagen/other-instance"  # the arena serves images without their extension
+
+    with render_trace("arena") as calls:
+        assert VariantPipeline().best(served, "thumb") == served
+    assert not calls  # the lookup runs in the background, not in the render
+
+    assert _eventually(lambda: VariantPipeline().best(served, "thumb") == "gs://test-bucket/imagen/other-instance_thumb.webp")
+    assert VariantPipeline().best(served, "display") == served
+
+
+def test_images_without_variants_are_looked_up_once_per_ttl(firestore_db):
+    uri = "gs://test-bucket/imagen/no-variants.png"
+    firestore_db.collection(config.IMAGE_COLLECTION_NAME).document("img").set(
+        {"gcsuri": uri, "model": "imagen", "prompt": "a lighthouse"}
+    )
+    lookups = VariantPipeline().metrics()["lookups"]
+
+    assert VariantPipeline().best(uri, "thumb") == uri
+    assert VariantPipeline().best(uri, "thumb") == uri
+    assert VariantPipeline().metrics()["lookups"] == lookups + 1
+
+    VariantPipeline().remember(uri, {"thumb": "gs://test-bucket/imagen/no-variants_thumb.webp"})
+    assert VariantPipeline().best(uri, "thumb") == "gs://test-bucket/imagen/no-variants_thumb.webp"
+
+
+def test_a_vote_does_not_wait_for_a_variant_lookup(monkeypatch):
+    from common import image_variants, metadata  # pylint: disable=import-outside-toplevel
+
+    release = threading.Event()
+    monkeypatch.setattr(image_variants, "load_variants", lambda gs_uri: release.wait(5) and {})
+    try:
+        started = time.monotonic()
+        metadata.record_vote(
+            "imagen", "flux", "imagen", ["gs://test-bucket/vote-a.png", "gs://test-bucket/vote-b.png"], "a lighthouse", "variants"
+        )
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
@@ -0,0 +1,133 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" MetadataWriter batching by size and by time, and its handling of failed batches """
+
+import datetime
+import time
+
+import pytest
+
+from common import metadata
+from common.metadata import MetadataWriter
+
+FLUSH_INTERVAL = 0.5
+
+
+class _Sink:
+    """Wraps the in-memory Firestore, recording each committed batch and failing the first `failures` commits"""
+
+    def __init__(self, db, failures: int = 0):
+        self._db, self.failures, self.batches = db, failures, []
+
+    def collection(self, name):
+        return self._db.collection(name)
+
+    def batch(self):
+        sink, batch = self, self._db.batch()
+
+        class _Batch:
+            def set(self, ref, record, merge=False):
+                batch.set(ref, record, merge=merge)
+
+            def commit(self):
+                if sink.failures:
+                    sink.failures -= 1
+                    raise RuntimeError("unavailable")
+                batch.commit()
+                sink.batches.append((time.monotonic(), len(batch._writes)))  # pylint: disable=protected-access
+
+        return _Batch()
+
+
+@pytest.fixture
+def writer(firestore_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(metadata.config, "METADATA_BATCH_SIZE", 3)
+    monkeypatch.setattr(metadata.config, "METADATA_FLUSH_INTERVAL", FLUSH_INTERVAL)
+    monkeypatch.setattr(metadata.config, "METADATA_MAX_RETRIES", 1)
+    monkeypatch.setattr(metadata.config, "METADATA_SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(metadata, "db", _Sink(firestore_db))
+    monkeypatch.setattr(MetadataWriter, "_instance", None)
+    writer = MetadataWriter()
+    yield writer
+    writer.close()
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_a_lone_record_waits_for_the_flush_interval(writer):
+    queued = time.monotonic()
+    writer.enqueue("arena_images", {"n": 1})
+
+    time.sleep(FLUSH_INTERVAL / 2)
+    assert metadata.db.batches == []
+    assert _wait_for(lambda: metadata.db.batches)
+    written_at, size = metadata.db.batches[0]
+    assert size == 1
+    assert written_at - queued >= FLUSH_INTERVAL * 0.9
+
+
+def test_records_queued_within_the_interval_share_a_batch(writer):
+    writer.enqueue("arena_images", {"n": 1})
+    time.sleep(FLUSH_INTERVAL / 4)
+    writer.enqueue("arena_images", {"n": 2})
+
+    assert _wait_for(lambda: metadata.db.batches)
+    assert [size for _, size in metadata.db.batches] == [2]
+
+
+def test_a_full_batch_is_written_at_once(writer):
+    queued = time.monotonic()
+    for n in range(3):
+        writer.enqueue("arena_images", {"n": n})
+
+    assert _wait_for(lambda: metadata.db.batches, timeout=FLUSH_INTERVAL / 2)
+    assert metadata.db.batches[0][0] - queued < FLUSH_INTERVAL / 2
+
+
+def test_flush_writes_without_waiting(writer):
+    writer.enqueue("arena_images", {"n": 1})
+    start = time.monotonic()
+
+    assert writer.flush(timeout=5)
+    assert time.monotonic() - start < FLUSH_INTERVAL / 2
+
+
+def test_a_failed_batch_is_requeued(writer, firestore_db):
+    metadata.db.failures = 1
+    doc_id = writer.enqueue("arena_images", {"n": 1})
+
+    assert writer.flush(timeout=5)
+    assert firestore_db.docs("arena_images")[doc_id] == {"n": 1}
+    assert writer.metrics()["failed"] == 1
+
+
+def test_records_unwritten_at_close_are_replayed(writer, firestore_db, monkeypatch):
+    metadata.db.failures = 1000
+    timestamp = datetime.datetime(2024, 5, 1, 12, 30)
+    doc_id = writer.enqueue("arena_images", {"n": 1, "timestamp": timestamp})
+    monkeypatch.setattr(metadata.config, "METADATA_FLUSH_INTERVAL", 0.05)  # close() waits 10 intervals
+    writer.close()
+    assert writer.metrics()["spilled"] == 1
+
+    metadata.db.failures = 0
+    monkeypatch.setattr(MetadataWriter, "_instance", None)
+    replayed = MetadataWriter()
+    assert replayed.flush(timeout=5)
+    assert firestore_db.docs("arena_images")[doc_id] == {"n": 1, "timestamp": timestamp}
+    replayed.close()
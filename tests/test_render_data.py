@@ -0,0 +1,34 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for the per-render backend call tracer """
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common.render_data import backend_call, render_trace, traced
+from models.scheduler import GenerationScheduler
+
+
+def test_calls_on_scheduler_threads_count_against_the_render():
+    scheduler = GenerationScheduler()
+    with render_trace("arena") as calls:
+        scheduler.submit("gemini", backend_call, "gemini").result(timeout=5)
+    assert calls == {"gemini": 1}
+
+
+def test_traced_work_on_a_pool_counts_against_the_render():
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with render_trace("arena") as calls:
+            pool.submit(backend_call, "untraced").result(timeout=5)
+            pool.submit(traced(backend_call), "battle").result(timeout=5)
+    assert calls == {"battle": 1}
@@ -0,0 +1,51 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for the generation scheduler's per-backend bulkheads """
+
+import threading
+
+from models.scheduler import GenerationScheduler
+
+
+def _hold(started: threading.Barrier, release: threading.Event):
+    started.wait(timeout=5)
+    release.wait(timeout=5)
+
+
+def test_backends_first_seen_at_submit_get_their_own_threads():
+    scheduler = GenerationScheduler(default_limit=2)
+    scheduler.configure_backend("imagen", 2)
+    release = threading.Event()
+    try:
+        # fill the configured backend, then two backends the scheduler has never seen
+        for backend in ("imagen", "garden-a", "garden-b"):
+            started = threading.Barrier(3)
+            futures = [scheduler.submit(backend, _hold, started, release) for _ in range(2)]
+            started.wait(timeout=5)  # both calls run at once, without waiting for a thread
+            assert not any(future.done() for future in futures)
+    finally:
+        release.set()
+
+
+def test_backend_can_be_configured_after_another_backend_starts():
+    scheduler = GenerationScheduler(default_limit=1)
+    assert scheduler.submit("imagen", lambda: "first").result(timeout=5) == "first"
+    scheduler.configure_backend("gemini", 3)
+    started, release = threading.Barrier(4), threading.Event()
+    try:
+        for _ in range(3):
+            scheduler.submit("gemini", _hold, started, release)
+        started.wait(timeout=5)
+    finally:
+        release.set()
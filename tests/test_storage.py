@@ -0,0 +1,66 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for the shared GCS helpers """
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from common import storage
+
+
+def test_concurrent_bulk_checks_share_one_bounded_pool(monkeypatch):
+    threads = set()
+
+    def exists(uri: str) -> bool:
+        threads.add(threading.current_thread().name)
+        time.sleep(0.01)
+        return uri.endswith("a.png")
+
+    monkeypatch.setattr(storage, "check_gcs_blob_exists", exists)
+    requests = [[f"gs://test-bucket/{n}/{name}.png" for name in ("a", "b", "c", "d")] for n in range(10)]
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as callers:
+        results = list(callers.map(storage.exists_many, requests))
+
+    assert all(result[uris[0]] and not result[uris[1]] for result, uris in zip(results, requests))
+    assert all(name.startswith("gcs") for name in threads)
+    assert len(threads) <= storage.cfg.GCS_MAX_WORKERS
+
+
+class _Blob:
+    generation = 1
+
+    def __init__(self, gs_uri: str):
+        self.gs_uri = gs_uri
+
+    def reload(self):
+        pass
+
+    def download_as_bytes(self) -> bytes:
+        return self.gs_uri.encode()
+
+
+def test_blob_cache_counts_every_concurrent_fetch(monkeypatch):
+    monkeypatch.setattr(storage, "StorageSession", lambda: type("Session", (), {"blob": lambda self, uri, generation=None: _Blob(uri)})())
+    cache = storage.BlobCache()
+    before = cache.metrics()
+    uris = [f"gs://test-bucket/blob-cache/{n}.png" for n in range(200)]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        assert list(pool.map(cache.get, uris)) == [uri.encode() for uri in uris]
+        list(pool.map(lambda uri: cache.get(uri, generation=2), uris))  # a new generation: fetched again
+
+    after = cache.metrics()
+    assert after["misses"] - before["misses"] == 2 * len(uris)
@@ -0,0 +1,58 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for the history page's vote feed """
+
+import datetime
+
+from common.metadata import VoteFeed, config
+
+
+def _store_votes(firestore_db, study: str, timestamps: list[datetime.datetime]):
+    for n, timestamp in enumerate(timestamps):
+        firestore_db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document(f"vote-{n:02d}").set(
+            {"study": study, "type": "vote", "timestamp": timestamp, "prompt": f"prompt {n}"}
+        )
+
+
+def _read_all(study: str, limit: int) -> list[str]:
+    prompts, cursor = [], None
+    while True:
+        page, cursor = VoteFeed().page(study, after=cursor, limit=limit, max_age=0)
+        prompts.extend(vote["prompt"] for vote in page)
+        if cursor is None:
+            return prompts
+
+
+def test_votes_sharing_a_timestamp_are_not_skipped_between_pages(firestore_db):
+    now = datetime.datetime(2024, 11, 5, 12, 0, tzinfo=datetime.timezone.utc)
+    earlier = now - datetime.timedelta(minutes=1)
+    _store_votes(firestore_db, "tied", [now] * 5 + [earlier] * 2)
+
+    prompts = _read_all("tied", limit=2)
+
+    assert sorted(prompts) == [f"prompt {n}" for n in range(7)]
+    assert set(prompts[-2:]) == {"prompt 5", "prompt 6"}  # the older votes come last
+
+
+def test_max_age_zero_rereads_the_first_page(firestore_db):
+    now = datetime.datetime(2024, 11, 5, 12, 0, tzinfo=datetime.timezone.utc)
+    _store_votes(firestore_db, "fresh", [now])
+    assert len(VoteFeed().page("fresh", limit=10)[0]) == 1
+
+    firestore_db.collection(config.IMAGE_RATINGS_COLLECTION_NAME).document("newer").set(
+        {"study": "fresh", "type": "vote", "timestamp": now + datetime.timedelta(seconds=1), "prompt": "newer"}
+    )
+
+    assert len(VoteFeed().page("fresh", limit=10)[0]) == 1  # within VOTE_FEED_TTL
+    assert VoteFeed().page("fresh", limit=10, max_age=0)[0][0]["prompt"] == "newer"
@@ -0,0 +1,71 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" VoteLog keeps votes until every sink has accepted them, and respects other workers' leases """
+
+import sqlite3
+import time
+
+import pytest
+
+from common import vote_log as vote_log_module
+from common.vote_log import VoteLog
+
+
+@pytest.fixture
+def make_log(monkeypatch, tmp_path):
+    monkeypatch.setattr(vote_log_module.config, "VOTE_LOG_PATH", str(tmp_path / "votes.sqlite3"))
+    monkeypatch.setattr(vote_log_module.config, "VOTE_DRAIN_INTERVAL", 0.01)
+
+    def make_log() -> VoteLog:
+        monkeypatch.setattr(VoteLog, "_instance", None)
+        return VoteLog()
+
+    return make_log
+
+
+def test_a_vote_stays_logged_until_the_sink_commits(make_log):
+    log = make_log()
+    committed, available = [], False
+
+    def sink(votes):
+        if not available:
+            raise RuntimeError("not committed")
+        committed.extend(votes)
+
+    log.register_sink("spanner", sink)
+    log.append("study", {"winner": "a"})
+
+    assert log.drain(timeout=0.05) is False
+    assert log.pending() == 1
+    available = True
+    assert log.drain(timeout=5)
+    assert log.pending() == 0
+    assert [vote["winner"] for vote in committed] == ["a"]
+
+
+def test_drain_leaves_batches_leased_by_other_workers(make_log):
+    log = make_log()
+    delivered = []
+    log.register_sink("firestore", delivered.extend)
+    log.append("study", {"winner": "a"})
+    with sqlite3.connect(log.path) as conn:
+        conn.execute("UPDATE votes SET claimed_by = 'other-host:1', claimed_at = ?", (time.time(),))
+
+    assert log.drain(timeout=0.05) is False
+    assert delivered == []
+
+    with sqlite3.connect(log.path) as conn:
+        conn.execute("UPDATE votes SET claimed_at = ?", (time.time() - log.lease - 1,))
+    assert log.drain(timeout=5)
+    assert [vote["winner"] for vote in delivered] == ["a"]
@@ -0,0 +1,44 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Tests for the welcome message pool """
+
+import pytest
+
+from common import welcome
+
+
+class _Stop(Exception):
+    pass
+
+
+def test_empty_messages_are_retried_after_a_delay(monkeypatch):
+    messages = welcome.WelcomeMessages()  # no background thread: WELCOME_POOL_SIZE is 0 under test
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) == 2:
+            raise _Stop
+
+    monkeypatch.setattr(welcome, "generate_content", lambda prompt: "  ")
+    monkeypatch.setattr(welcome.time, "sleep", sleep)
+    failed = messages.metrics()["failed"]
+
+    with pytest.raises(_Stop):
+        messages._run()  # pylint: disable=protected-access
+
+    assert delays == [welcome._RETRY_DELAY] * 2  # pylint: disable=protected-access
+    assert messages.metrics()["failed"] == failed + 2
+    assert messages.get() == welcome.DEFAULT_WELCOME
+